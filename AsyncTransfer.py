@@ -0,0 +1,315 @@
+import ssl
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+from HttpSession import DEFAULT_BACKOFF, DEFAULT_RETRIES, RETRY_STATUS
+
+# -------------------------
+# 以事件迴圈執行的下載
+# -------------------------
+# 執行緒池中每個下載都佔用一個作業系統執行緒，大量小檔案時並行數受限於執行緒數；
+# 這裡以單一事件迴圈同時處理數百個連線，暫停與取消也能立即作用在進行中的傳輸上。
+# 只使用標準函式庫（asyncio 串流 + 最小的 HTTP/1.1 客戶端），不需額外安裝套件。
+
+ASYNC_MAX_CONCURRENCY = 256
+DEFAULT_TIMEOUT = 15
+USER_AGENT = "modsync-async"
+
+
+class AsyncHttpError(Exception):
+    """連線中斷、逾時或回應格式錯誤。"""
+
+
+class AsyncResponse:
+    """
+    一個 HTTP 回應：status、headers（名稱皆為小寫）與 iter_content() 非同步逐塊讀取本文。
+    以 async with 使用，離開時本文已完整讀取且伺服器允許時連線會放回連線池，否則關閉。
+    """
+
+    def __init__(self, client, key, reader, writer, status, headers, reused):
+        self._client = client
+        self._key = key
+        self._reader = reader
+        self._writer = writer
+        self.status_code = status
+        self.headers = headers
+        self.reused = reused
+        self._remaining = None
+        self._chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+        self._complete = False
+        if not self._chunked and "content-length" in headers:
+            try:
+                self._remaining = int(headers["content-length"])
+            except ValueError:
+                self._remaining = -1
+            if self._remaining < 0:
+                writer.close()
+                raise AsyncHttpError(f"無法解析的 Content-Length: {headers['content-length']!r}")
+            self._complete = self._remaining == 0
+        self._keep_alive = headers.get("connection", "").lower() != "close" and (
+            self._chunked or self._remaining is not None)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    async def _read(self, n):
+        return await asyncio.wait_for(self._reader.read(n), self._client.timeout)
+
+    async def _readexactly(self, n):
+        return await asyncio.wait_for(self._reader.readexactly(n), self._client.timeout)
+
+    async def iter_content(self, chunk_size=65536):
+        try:
+            if self._chunked:
+                while True:
+                    line = await asyncio.wait_for(self._reader.readline(), self._client.timeout)
+                    size = int(line.split(b";", 1)[0].strip() or b"0", 16)
+                    if size == 0:
+                        # 略過結尾的 trailer
+                        while (await asyncio.wait_for(self._reader.readline(), self._client.timeout)).strip():
+                            pass
+                        break
+                    while size > 0:
+                        chunk = await self._read(min(chunk_size, size))
+                        if not chunk:
+                            raise AsyncHttpError("連線在傳輸途中中斷")
+                        size -= len(chunk)
+                        yield chunk
+                    await self._readexactly(2)
+            elif self._remaining is not None:
+                while self._remaining > 0:
+                    chunk = await self._read(min(chunk_size, self._remaining))
+                    if not chunk:
+                        raise AsyncHttpError("連線在傳輸途中中斷")
+                    self._remaining -= len(chunk)
+                    yield chunk
+            else:
+                # 沒有長度資訊時讀到連線關閉為止
+                while True:
+                    chunk = await self._read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            self._complete = True
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError) as e:
+            raise AsyncHttpError(str(e) or type(e).__name__) from e
+
+    def release(self):
+        if self._writer is None:
+            return
+        if self._complete and self._keep_alive:
+            self._client._put_idle(self._key, self._reader, self._writer)
+        else:
+            self._writer.close()
+        self._writer = None
+        self._client._release_slot(self._key)
+
+
+class AsyncHttpClient:
+    """
+    最小的 HTTP/1.1 GET 客戶端：每個主機保留 keep-alive 連線池，同時連線數以 max_per_host 限制。
+    必須在同一個事件迴圈中使用；只支援本程式需要的功能（Content-Length、chunked、Range 等自訂標頭）。
+    與 HttpSession 相同，連線錯誤與 429/5xx 依 backoff_factor 指數退避後重試（遵守 Retry-After）。
+    """
+
+    def __init__(self, max_per_host=ASYNC_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._idle = {}
+        self._slots = {}
+        self._ssl = None
+
+    def _slot(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = asyncio.Semaphore(self.max_per_host)
+        return slot
+
+    def _release_slot(self, key):
+        self._slots[key].release()
+
+    def _put_idle(self, key, reader, writer):
+        self._idle.setdefault(key, []).append((reader, writer))
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        context = None
+        if scheme == "https":
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            context = self._ssl
+        try:
+            return await asyncio.wait_for(asyncio.open_connection(host, port, ssl=context), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise AsyncHttpError(f"無法連線 {host}:{port}: {e or type(e).__name__}") from e
+
+    def get(self, url, headers=None):
+        return _RequestContext(self, url, headers or {})
+
+    async def request_with_retry(self, url, headers):
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = await self.request(url, headers)
+            except AsyncHttpError:
+                if last:
+                    raise
+                await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+                continue
+            if response.status_code not in RETRY_STATUS or last:
+                return response
+            delay = self.backoff_factor * 2 ** attempt
+            retry_after = response.headers.get("retry-after", "")
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            # 錯誤回應的本文很小，讀完即可重複使用連線
+            try:
+                async for _ in response.iter_content():
+                    pass
+            except AsyncHttpError:
+                pass
+            response.release()
+            await asyncio.sleep(delay)
+
+    async def request(self, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise AsyncHttpError(f"不支援的網址: {url}")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+        lines = [f"GET {target} HTTP/1.1", f"Host: {host}", f"User-Agent: {USER_AGENT}",
+                 "Accept-Encoding: identity", "Connection: keep-alive"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        await self._slot(key).acquire()
+        try:
+            # 連線池中的連線可能已被伺服器關閉，失敗時改用新連線重試一次
+            while True:
+                idle = self._idle.get(key)
+                reused = bool(idle)
+                reader, writer = idle.pop() if idle else await self._connect(key)
+                try:
+                    writer.write(payload)
+                    await asyncio.wait_for(writer.drain(), self.timeout)
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.timeout)
+                    break
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, OSError,
+                        asyncio.TimeoutError) as e:
+                    writer.close()
+                    if not reused:
+                        raise AsyncHttpError(str(e) or type(e).__name__) from e
+            status_line, *header_lines = head.decode("latin-1").split("\r\n")
+            try:
+                status = int(status_line.split(" ", 2)[1])
+            except (IndexError, ValueError):
+                writer.close()
+                raise AsyncHttpError(f"無法解析的回應: {status_line!r}") from None
+            response_headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    response_headers[name.strip().lower()] = value.strip()
+            return AsyncResponse(self, key, reader, writer, status, response_headers, reused)
+        except BaseException:
+            self._release_slot(key)
+            raise
+
+    def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+class _RequestContext:
+    """讓 client.get(...) 可以直接以 async with 使用。"""
+
+    def __init__(self, client, url, headers):
+        self._client = client
+        self._url = url
+        self._headers = headers
+        self._response = None
+
+    async def __aenter__(self):
+        self._response = await self._client.request_with_retry(self._url, self._headers)
+        return self._response
+
+    async def __aexit__(self, *exc):
+        self._response.release()
+
+
+class AsyncRunner:
+    """
+    在背景執行緒執行事件迴圈：submit(coro) 回傳 concurrent.futures.Future，可由任何執行緒等待或加上回呼；
+    pause()/resume() 透過 asyncio.Event 讓所有傳輸在下一塊資料前停住，cancel_all() 立即取消進行中的傳輸。
+    """
+
+    def __init__(self, max_per_host=ASYNC_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._tasks = set()
+        self._max_per_host = max_per_host
+        self._timeout = timeout
+        self.client = None
+        self.running = None
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.client = AsyncHttpClient(self._max_per_host, self._timeout)
+        self.running = asyncio.Event()
+        self.running.set()
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            # 等待 run_in_executor 的工作結束後才關閉事件迴圈
+            self.loop.run_until_complete(self.loop.shutdown_default_executor())
+            self.loop.close()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(self._track(coro), self.loop)
+
+    async def _track(self, coro):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            return await coro
+        finally:
+            self._tasks.discard(task)
+
+    async def wait_running(self):
+        await self.running.wait()
+
+    def pause(self):
+        self.loop.call_soon_threadsafe(self.running.clear)
+
+    def resume(self):
+        self.loop.call_soon_threadsafe(self.running.set)
+
+    def cancel_all(self):
+        def cancel():
+            for task in list(self._tasks):
+                task.cancel()
+            # 已暫停的傳輸也要醒來才能處理取消
+            self.running.set()
+        self.loop.call_soon_threadsafe(cancel)
+
+    def close(self):
+        def shutdown():
+            self.client.close()
+            self.loop.stop()
+        self.loop.call_soon_threadsafe(shutdown)
+        self._thread.join()
@@ -0,0 +1,50 @@
+import threading
+
+# -------------------------
+# 小檔案批次佇列
+# -------------------------
+# 每批最多的檔案數與位元組數；超過 BATCH_FILE_LIMIT 的單一檔案不列入批次，仍以逐檔下載（可續傳、可多連線）
+BATCH_MAX_FILES = 256
+BATCH_MAX_BYTES = 8 * 1024 * 1024
+BATCH_FILE_LIMIT = 1024 * 1024
+
+
+class BatchQueue:
+    """
+    收集同一個資料夾需要下載的小檔案，累積到上限即呼叫 flush(files) 送出一批。
+    因為需要下載的檔案是由多個雜湊工作陸續找出的，以 hold()/release() 計算仍在進行的工作數，
+    最後一個工作結束時送出剩餘不足一批的檔案。
+    """
+
+    def __init__(self, flush, max_files=BATCH_MAX_FILES, max_bytes=BATCH_MAX_BYTES):
+        self._flush = flush
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._files = []
+        self._bytes = 0
+        self._holders = 0
+        self._lock = threading.Lock()
+
+    def hold(self):
+        with self._lock:
+            self._holders += 1
+
+    def release(self):
+        with self._lock:
+            self._holders -= 1
+            batch = self._take() if self._holders == 0 else None
+        if batch:
+            self._flush(batch)
+
+    def add(self, rel, size=0):
+        with self._lock:
+            self._files.append(rel)
+            self._bytes += size or 0
+            full = len(self._files) >= self.max_files or self._bytes >= self.max_bytes
+            batch = self._take() if full else None
+        if batch:
+            self._flush(batch)
+
+    def _take(self):
+        batch, self._files, self._bytes = self._files, [], 0
+        return batch
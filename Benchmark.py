@@ -0,0 +1,307 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import statistics
+
+from ContentStore import ContentStore
+from HashIndex import HashIndex
+from LocalModServer import LocalModServer
+from SyncEngine import SyncEngine, TRANSFER_ASYNC, TRANSFER_THREADS, resolve_local_folder
+from FlowControl import parse_rate
+
+# -------------------------
+# 同步效能測試
+# -------------------------
+# 以本機模擬伺服器產生固定亂數種子的合成模組包，量測三種情境的同步時間：
+#   cold     空白的客戶端資料夾完整安裝
+#   noop     安裝完成後立即再同步一次（沒有任何變更）
+#   verify   刪除本地雜湊索引後再同步，所有檔案都需重新計算雜湊
+#   partial  伺服器修改、新增、刪除少量檔案後再同步
+#   second   （--store 時）以同一個共用檔案庫安裝第二個版本資料夾
+# 每個情境都記錄耗時、伺服器收到的請求數與傳輸量，方便比較改動前後的差異。
+# 用法: python Benchmark.py --packs large_jars,many_configs --repeat 3 --latency 0.02 --json bench.json
+
+SCENARIOS = ("cold", "noop", "verify", "partial")
+
+
+def write_random_file(path, size, rng, text=False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if text:
+        # 設定檔為可壓縮的文字內容
+        words = ["enabled", "true", "false", "value", "range", "# comment", "spawn", "weight", "="]
+        data = " ".join(rng.choice(words) for _ in range(size // 5)).encode("utf-8")[:size]
+    else:
+        # jar 內容本身已壓縮，以隨機位元組模擬
+        data = rng.randbytes(size)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def gen_large_jars(root, rng, scale):
+    """少量大型 jar（伺服器資料夾 mods）。"""
+    for i in range(max(1, int(12 * scale))):
+        size = rng.randint(1, 6) * 1024 * 1024
+        write_random_file(os.path.join(root, "mods", f"mod-{i:03d}.jar"), size, rng)
+
+
+def gen_many_configs(root, rng, scale):
+    """大量小型設定檔（伺服器資料夾 config）。"""
+    for i in range(max(1, int(2000 * scale))):
+        sub = f"mod{i % 80:02d}"
+        size = rng.randint(200, 4096)
+        write_random_file(os.path.join(root, "config", sub, f"settings-{i:04d}.toml"), size, rng, text=True)
+
+
+def gen_deep_tree(root, rng, scale, depth=8, fanout=2):
+    """深層巢狀目錄（伺服器資料夾 resources）。"""
+    count = max(1, int(400 * scale))
+    for i in range(count):
+        parts = [f"d{rng.randrange(fanout)}" for _ in range(rng.randint(1, depth))]
+        size = rng.randint(512, 32 * 1024)
+        write_random_file(os.path.join(root, "resources", *parts, f"asset-{i:04d}.bin"), size, rng)
+
+
+PACKS = {
+    "large_jars": gen_large_jars,
+    "many_configs": gen_many_configs,
+    "deep_tree": gen_deep_tree,
+}
+
+
+def list_files(root):
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            files.append(os.path.join(dirpath, name))
+    return sorted(files)
+
+
+def mutate_pack(root, rng, ratio=0.05):
+    """修改、刪除與新增約 ratio 比例的檔案，模擬伺服器端的一次小改版。"""
+    files = list_files(root)
+    count = max(1, int(len(files) * ratio))
+    targets = rng.sample(files, min(len(files), count * 2))
+    changed, removed = targets[:count], targets[count:]
+    for path in changed:
+        write_random_file(path, os.path.getsize(path) or 1024, rng)
+    for path in removed:
+        os.remove(path)
+    for i in range(count):
+        source = rng.choice(changed)
+        name = f"added-{i:04d}" + os.path.splitext(source)[1]
+        write_random_file(os.path.join(os.path.dirname(source), name), os.path.getsize(source), rng)
+    return {"changed": len(changed), "removed": len(removed), "added": count}
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def verify_client(server_root, client_dir):
+    """
+    以雜湊比對客戶端與伺服器的每個資料夾，回傳不一致的相對路徑（缺少、內容不同，或嚴格同步資料夾中多出的檔案）。
+    非嚴格同步的資料夾保留玩家自行加入的檔案，多出的檔案不算不一致。
+    """
+    mismatched = []
+    for folder in sorted(os.listdir(server_root)):
+        server_base = os.path.join(server_root, folder)
+        if not os.path.isdir(server_base):
+            continue
+        local_base, strict = resolve_local_folder(client_dir, folder)
+        expected = {os.path.relpath(p, server_base): p for p in list_files(server_base)}
+        for rel, path in sorted(expected.items()):
+            local = os.path.join(local_base, rel)
+            if not os.path.isfile(local) or file_digest(local) != file_digest(path):
+                mismatched.append(f"{folder}/{rel}")
+        if strict and os.path.isdir(local_base):
+            for path in list_files(local_base):
+                rel = os.path.relpath(path, local_base)
+                if rel not in expected:
+                    mismatched.append(f"{folder}/{rel}（多出）")
+    return mismatched
+
+
+class BenchmarkRunner:
+    def __init__(self, workdir, latency=0.0, bandwidth=None, error_rate=0.0, scale=1.0, seed=1234, verbose=False,
+                 algorithms=None, use_store=False, link_bandwidth=None, max_rate=None, mirrors=0,
+                 transfer=TRANSFER_THREADS):
+        self.workdir = workdir
+        self.algorithms = algorithms
+        self.use_store = use_store
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.link_bandwidth = link_bandwidth
+        self.max_rate = max_rate
+        self.mirror_count = mirrors
+        self.transfer = transfer
+        self.error_rate = error_rate
+        self.scale = scale
+        self.seed = seed
+        self.verbose = verbose
+
+    def print_lines(self, lines, progress):
+        if self.verbose and lines:
+            print("\n".join(lines))
+
+    def sync_once(self, server, client_dir, store=None, mirrors=()):
+        for each in (server, *mirrors):
+            each.reset_stats()
+        engine = SyncEngine(server.url, client_dir, listener=self.print_lines, store=store, transfer=self.transfer)
+        engine.set_bandwidth_limit(self.max_rate)
+        started = time.perf_counter()
+        engine.run()
+        elapsed = time.perf_counter() - started
+        engine.session.close()
+        # 不只看同步是否回報成功，實際比對客戶端的檔案內容，內容有誤的情境視為失敗
+        mismatched = verify_client(server.root, client_dir)
+        result = {"seconds": elapsed, "ok": engine.ok and not mismatched, "failed_files": engine.failed_files,
+                  "mismatched": mismatched}
+        # 請求數與傳輸量為主伺服器與所有鏡像站的合計
+        for key in server.stats:
+            result[key] = sum(each.stats[key] for each in (server, *mirrors))
+        # 各階段耗時與計數，寫入 JSON 以便比對哪個階段變慢
+        result["report"] = {key: engine.report[key]
+                            for key in ("phases", "counters", "latency", "concurrency", "mirrors")}
+        return result
+
+    def start_server(self, root, mirrors=None):
+        return LocalModServer(root, latency=self.latency, bandwidth=self.bandwidth, error_rate=self.error_rate,
+                              seed=self.seed, algorithms=self.algorithms, link_bandwidth=self.link_bandwidth,
+                              mirrors=mirrors).start()
+
+    def run_pack(self, pack, repeat):
+        """產生指定的模組包並依序執行各情境 repeat 次，回傳每次的結果列表。"""
+        results = []
+        for run in range(repeat):
+            run_dir = os.path.join(self.workdir, f"{pack}-{run}")
+            server_dir = os.path.join(run_dir, "server")
+            client_dir = os.path.join(run_dir, "client")
+            rng = random.Random(f"{self.seed}-{pack}")
+            PACKS[pack](server_dir, rng, self.scale)
+            files = list_files(server_dir)
+            total_bytes = sum(os.path.getsize(p) for p in files)
+
+            # 每次測試使用獨立的檔案庫，不影響使用者實際的共用檔案庫
+            store = ContentStore(os.path.join(run_dir, "store")) if self.use_store else None
+            scenarios = SCENARIOS + ("second",) if self.use_store else SCENARIOS
+            # 鏡像站與主伺服器提供同一個資料夾，各自有獨立的頻寬限制，由主伺服器的 /mirrors?json=1 公布
+            mirrors = [self.start_server(server_dir) for _ in range(self.mirror_count)]
+            server = self.start_server(server_dir, [m.url for m in mirrors])
+            try:
+                for scenario in scenarios:
+                    if scenario == "verify":
+                        index_path = HashIndex(client_dir).index_path
+                        if os.path.exists(index_path):
+                            os.remove(index_path)
+                    elif scenario == "partial":
+                        mutate_pack(server_dir, rng)
+                    elif scenario == "second":
+                        client_dir = os.path.join(run_dir, "client2")
+                    row = self.sync_once(server, client_dir, store, mirrors)
+                    row.update(pack=pack, scenario=scenario, run=run, files=len(files), pack_bytes=total_bytes)
+                    results.append(row)
+                    print(f"  {pack:<13} {scenario:<8} #{run}  {row['seconds']:7.2f}s  "
+                          f"{row['requests']:5d} req  {row['bytes_sent'] / 1048576:8.1f} MB"
+                          f"{'' if row['ok'] else '  ❌'}")
+                    for rel in row["mismatched"][:10]:
+                        print(f"    ❌ 內容與伺服器不一致: {rel}")
+            finally:
+                server.stop()
+                for mirror in mirrors:
+                    mirror.stop()
+                shutil.rmtree(run_dir, ignore_errors=True)
+        return results
+
+
+def summarize(results):
+    """以 (模組包, 情境) 分組，取耗時的中位數與最小值。"""
+    groups = {}
+    for row in results:
+        groups.setdefault((row["pack"], row["scenario"]), []).append(row)
+    summary = []
+    for (pack, scenario), rows in groups.items():
+        seconds = [r["seconds"] for r in rows]
+        summary.append({
+            "pack": pack,
+            "scenario": scenario,
+            "runs": len(rows),
+            "median_seconds": statistics.median(seconds),
+            "min_seconds": min(seconds),
+            "requests": statistics.median(r["requests"] for r in rows),
+            "bytes_sent": statistics.median(r["bytes_sent"] for r in rows),
+            "ok": all(r["ok"] for r in rows),
+        })
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n{'模組包':<13} {'情境':<8} {'中位數':>8} {'最小值':>8} {'請求數':>7} {'傳輸量':>10}")
+    for row in summary:
+        print(f"{row['pack']:<13} {row['scenario']:<8} {row['median_seconds']:7.2f}s {row['min_seconds']:7.2f}s "
+              f"{row['requests']:7.0f} {row['bytes_sent'] / 1048576:8.1f}MB{'' if row['ok'] else '  ❌'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="以本機模擬伺服器量測同步效能")
+    parser.add_argument("--packs", default=",".join(PACKS), help=f"要測試的模組包，以逗號分隔（{', '.join(PACKS)}）")
+    parser.add_argument("--repeat", type=int, default=1, help="每個模組包重複次數")
+    parser.add_argument("--scale", type=float, default=1.0, help="檔案數量倍率")
+    parser.add_argument("--latency", type=float, default=0.0, help="每個請求的延遲（秒）")
+    parser.add_argument("--bandwidth", type=float, default=None, help="每個連線的頻寬上限（bytes/s）")
+    parser.add_argument("--link-bandwidth", type=float, default=None, help="伺服器所有連線合計的頻寬上限（bytes/s）")
+    parser.add_argument("--max-rate", default=None, help="客戶端的頻寬上限（例如 2M）")
+    parser.add_argument("--mirrors", type=int, default=0, help="另外啟動的鏡像站數量（與主伺服器提供相同檔案）")
+    parser.add_argument("--transfer", choices=(TRANSFER_THREADS, TRANSFER_ASYNC), default=TRANSFER_THREADS,
+                        help="逐檔下載使用執行緒池或事件迴圈")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="隨機回傳 503 的機率（0~1）")
+    parser.add_argument("--hash", default=None, help="伺服器提供的雜湊演算法，以逗號分隔（預設全部）")
+    parser.add_argument("--store", action="store_true", help="使用共用檔案庫，並加測第二個版本資料夾的安裝")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--workdir", default=None, help="暫存資料夾（預設使用系統暫存目錄）")
+    parser.add_argument("--json", default=None, help="將所有結果寫入 JSON 檔")
+    parser.add_argument("--verbose", action="store_true", help="顯示同步 log")
+    args = parser.parse_args(argv)
+
+    packs = [p.strip() for p in args.packs.split(",") if p.strip()]
+    unknown = [p for p in packs if p not in PACKS]
+    if unknown:
+        parser.error(f"未知的模組包: {', '.join(unknown)}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="modsync-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    runner = BenchmarkRunner(workdir, latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate,
+                             scale=args.scale, seed=args.seed, verbose=args.verbose,
+                             algorithms=[a.strip() for a in args.hash.split(",")] if args.hash else None,
+                             use_store=args.store, link_bandwidth=args.link_bandwidth,
+                             max_rate=parse_rate(args.max_rate) if args.max_rate else None, mirrors=args.mirrors,
+                             transfer=args.transfer)
+    print(f"📊 latency={args.latency}s bandwidth={args.bandwidth or '不限'} error_rate={args.error_rate} "
+          f"scale={args.scale} repeat={args.repeat}")
+    results = []
+    try:
+        for pack in packs:
+            results.extend(runner.run_pack(pack, args.repeat))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize(results)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"options": vars(args), "summary": summary, "runs": results}, f, ensure_ascii=False, indent=2)
+    return 0 if all(row["ok"] for row in summary) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import os
+import sys
+import shutil
+import threading
+
+from HashEngine import hash_file
+from HashIndex import HashIndex
+
+# -------------------------
+# 多個版本資料夾共用的檔案庫
+# -------------------------
+# 以 (雜湊演算法, 雜湊) 為鍵保存下載過的檔案：<store>/objects/<演算法>/<雜湊前兩碼>/<雜湊>
+# 同一個模組只需下載一次，其他版本資料夾直接由檔案庫建立硬連結（或複製），幾乎不需網路傳輸。
+
+# 內容不會被遊戲修改的檔案才以硬連結共用，其他（設定檔、腳本等）一律複製，避免修改一份影響所有版本
+LINK_EXTENSIONS = (".jar", ".zip")
+
+
+def default_store_path():
+    """使用者層級的檔案庫位置：Windows 為 %LOCALAPPDATA%\\modsync\\store，其餘為 ~/.cache/modsync/store。"""
+    if sys.platform == "win32" and os.environ.get("LOCALAPPDATA"):
+        return os.path.join(os.environ["LOCALAPPDATA"], "modsync", "store")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "modsync", "store")
+
+
+def should_link(path):
+    return path.lower().endswith(LINK_EXTENSIONS)
+
+
+def link_or_copy(src, dst, link):
+    """link 為 True 時建立硬連結，跨磁碟或檔案系統不支援時改為複製。"""
+    if link:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+
+class ContentStore:
+    """
+    內容定址的共用檔案庫。放入與取出都以暫存檔 + 原子改名完成，多個程序同時使用也不會看到寫到一半的檔案。
+    取出前以檔案庫自己的雜湊索引確認內容未被改動（硬連結的檔案若在某個版本資料夾被修改會連帶影響檔案庫），
+    不一致的項目直接移除，改回網路下載。
+    """
+
+    def __init__(self, root=None):
+        self.root = os.path.abspath(root or default_store_path())
+        self.objects_dir = os.path.join(self.root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = HashIndex(self.root)
+        self._tmp_counter = 0
+        self._lock = threading.Lock()
+
+    def object_path(self, algorithm, digest):
+        digest = digest.lower()
+        return os.path.join(self.objects_dir, algorithm, digest[:2], digest)
+
+    def _tmp_path(self, path):
+        with self._lock:
+            self._tmp_counter += 1
+            counter = self._tmp_counter
+        return f"{path}.{os.getpid()}.{threading.get_ident()}.{counter}.tmp"
+
+    def contains(self, algorithm, digest):
+        return bool(digest) and os.path.isfile(self.object_path(algorithm, digest))
+
+    def verify(self, algorithm, digest):
+        """確認檔案庫中的項目與雜湊一致；大小與 mtime 未變時直接使用索引紀錄。不一致時移除並回傳 False。"""
+        path = self.object_path(algorithm, digest)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        actual = self.index.lookup(path, st, count=False, algorithm=algorithm)
+        if actual is None:
+            actual = hash_file(path, algorithm, st.st_size)
+            self.index.store(path, actual, st, algorithm)
+        if actual == digest.lower():
+            return True
+        self.discard(algorithm, digest)
+        return False
+
+    def discard(self, algorithm, digest):
+        path = self.object_path(algorithm, digest)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        self.index.invalidate(path)
+
+    def add(self, algorithm, digest, src_path):
+        """將已驗證的檔案放入檔案庫（已存在則略過）。可硬連結的檔案共用同一份內容，不額外佔用空間。"""
+        if not digest:
+            return False
+        path = self.object_path(algorithm, digest)
+        if os.path.isfile(path):
+            return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = self._tmp_path(path)
+        try:
+            link_or_copy(src_path, tmp_path, should_link(src_path))
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        self.index.store(path, digest.lower(), algorithm=algorithm)
+        return True
+
+    def materialize(self, algorithm, digest, dest_path):
+        """由檔案庫建立 dest_path（硬連結或複製），成功回傳 True；檔案庫沒有或內容不符時回傳 False。"""
+        if not self.contains(algorithm, digest) or not self.verify(algorithm, digest):
+            return False
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = self._tmp_path(dest_path)
+        try:
+            link_or_copy(self.object_path(algorithm, digest), tmp_path, should_link(dest_path))
+            os.replace(tmp_path, dest_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def save(self):
+        self.index.save()
@@ -0,0 +1,58 @@
+import threading
+
+# -------------------------
+# 批次事件通道
+# -------------------------
+class EventChannel:
+    """
+    工作執行緒只把 log 與進度寫入緩衝區（僅取一次鎖），由背景計時執行緒以固定頻率合併後呼叫 flush：
+        flush(lines, progress)
+    lines 為期間累積的所有 log 行，progress 為每個進度鍵最後一次的值，
+    如此不論有多少執行緒、多少事件，UI 每秒只會收到固定次數的更新。
+    poll 為選用的函式，每次合併時呼叫並將回傳的 dict 併入 progress，
+    適合每收到一塊資料就變動的數值（例如已下載位元組），不必逐次寫入緩衝區。
+    """
+
+    def __init__(self, flush, interval=0.1, poll=None):
+        self._flush = flush
+        self._poll = poll
+        self.interval = interval
+        self._lines = []
+        self._progress = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def log(self, text):
+        with self._lock:
+            self._lines.append(text)
+
+    def progress(self, key, value):
+        with self._lock:
+            self._progress[key] = value
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            lines, self._lines = self._lines, []
+            progress, self._progress = self._progress, {}
+        if self._poll is not None:
+            progress.update(self._poll() or {})
+        if lines or progress:
+            self._flush(lines, progress)
+
+    def close(self):
+        """停止計時執行緒並送出剩餘事件。"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
@@ -0,0 +1,153 @@
+import re
+import time
+import threading
+
+# -------------------------
+# 下載並行數與頻寬控制
+# -------------------------
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+DEFAULT_CONCURRENCY = 4
+
+
+def parse_rate(text):
+    """將 "500K"、"2M"、"1.5m" 或純數字（bytes/s）轉為 bytes/s；0 或空字串表示不限制，回傳 None。"""
+    text = str(text).strip().upper()
+    if not text:
+        return None
+    match = re.fullmatch(r"([\d.]+)\s*([KMG]?)(?:I?B)?(?:/S)?", text)
+    if not match:
+        raise ValueError(f"無法解析的速率: {text}")
+    value = float(match.group(1)) * {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[match.group(2)]
+    return value if value > 0 else None
+
+
+class TokenBucket:
+    """
+    全域頻寬上限：所有下載執行緒每收到一塊資料就呼叫 consume(位元組數)，超過速率時在該執行緒等待。
+    rate 為 None 時不限制；可在同步途中以 set_rate 調整。
+    """
+
+    def __init__(self, rate=None):
+        self._lock = threading.Lock()
+        self.rate = None
+        self.capacity = 0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate if rate and rate > 0 else None
+            # 最多累積 0.25 秒的額度，避免閒置後一次湧入大量資料
+            self.capacity = max(self.rate / 4, 64 * 1024) if self.rate else 0
+            self._tokens = min(self._tokens, self.capacity)
+            self._last = time.monotonic()
+
+    def reserve(self, nbytes):
+        """扣除 nbytes 的額度並回傳呼叫者應等待的秒數（不限制時為 0），供非同步下載以 asyncio.sleep 等待。"""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # 額度可以暫時為負，由這次呼叫者等待補足，其他執行緒之後也會依序等待
+            self._tokens -= nbytes
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def consume(self, nbytes):
+        wait = self.reserve(nbytes)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    依實測結果調整同時進行的下載數（加法增加、乘法減少）：
+    每完成約一輪（目前上限個）下載即比較這一輪與上一輪的傳輸速度，
+    速度明顯提升時上限 +1，明顯下降或延遲大幅上升時 -1；
+    遇到伺服器錯誤（429/5xx、逾時）時上限減半，並在一段逐次加長的時間內暫停開始新的下載。
+    """
+
+    IMPROVE = 1.05
+    REGRESS = 0.8
+    LATENCY_FACTOR = 2.0
+
+    def __init__(self, initial=DEFAULT_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.peak = int(self.limit)
+        self.active = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._backoff = 0.0
+        self._backoff_until = 0.0
+        self._previous = None
+        self._base_latency = None
+        self._reset_window(time.monotonic())
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_count = 0
+        self._window_latency = 0.0
+
+    def try_acquire(self):
+        """目前的並行數未達上限且不在退避期間時佔用一個名額並回傳 True。"""
+        with self._lock:
+            if self.active >= int(self.limit) or time.monotonic() < self._backoff_until:
+                return False
+            self.active += 1
+            return True
+
+    def backoff_remaining(self):
+        with self._lock:
+            return max(0.0, self._backoff_until - time.monotonic())
+
+    def release(self, nbytes=0, seconds=0.0, error=False):
+        """歸還名額並回報這次傳輸的位元組數、耗時與是否遇到伺服器錯誤。"""
+        now = time.monotonic()
+        with self._lock:
+            self.active -= 1
+            if error:
+                self.errors += 1
+                self.limit = max(self.minimum, self.limit / 2)
+                self._backoff = min(10.0, self._backoff * 2 or 0.5)
+                self._backoff_until = now + self._backoff
+                self._previous = None
+                self._reset_window(now)
+                return
+            self._backoff = max(0.0, self._backoff / 2 - 0.1)
+            self._window_bytes += nbytes
+            self._window_count += 1
+            self._window_latency += seconds
+            if self._window_count >= max(2, int(self.limit)):
+                self._evaluate(now)
+
+    def _evaluate(self, now):
+        elapsed = max(now - self._window_start, 1e-6)
+        current = (self._window_bytes / elapsed, self._window_count / elapsed)
+        latency = self._window_latency / self._window_count
+        if self._base_latency is None or latency < self._base_latency:
+            self._base_latency = latency
+        previous = self._previous
+        if previous is None:
+            # 第一輪沒有比較對象，先嘗試增加
+            self.limit = min(self.maximum, self.limit + 1)
+        else:
+            improved = current[0] >= previous[0] * self.IMPROVE or current[1] >= previous[1] * self.IMPROVE
+            regressed = current[0] < previous[0] * self.REGRESS and current[1] < previous[1] * self.REGRESS
+            congested = latency > self._base_latency * self.LATENCY_FACTOR and not improved
+            if improved:
+                self.limit = min(self.maximum, self.limit + 1)
+            elif regressed or congested:
+                self.limit = max(self.minimum, self.limit - 1)
+        self.peak = max(self.peak, int(self.limit))
+        self._previous = current
+        self._reset_window(now)
+
+    def snapshot(self):
+        with self._lock:
+            return {"limit": int(self.limit), "peak": self.peak, "active": self.active, "errors": self.errors}
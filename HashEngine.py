@@ -0,0 +1,87 @@
+import os
+import mmap
+import hashlib
+
+try:
+    import xxhash
+except ImportError:  # 選用套件，未安裝時只提供 hashlib 的演算法
+    xxhash = None
+
+# -------------------------
+# 可替換的雜湊演算法
+# -------------------------
+# 伺服器可在清單回應的 X-Hash-Algorithm 標頭宣告使用的演算法（未宣告時為 md5），
+# 客戶端以 ?hash=演算法1,演算法2 依偏好順序告知自己支援哪些演算法。
+DEFAULT_ALGORITHM = "md5"
+ALGORITHM_HEADER = "X-Hash-Algorithm"
+
+# 讀取緩衝區：大區塊讀取可減少系統呼叫次數，且 hashlib 處理大區塊時會釋放 GIL，多執行緒可同時使用多核心
+READ_BUFFER_SIZE = 1024 * 1024
+# 超過此大小的檔案以 mmap 交給雜湊函式一次處理，省去複製到 Python 緩衝區
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+ALGORITHMS = {
+    "md5": hashlib.md5,
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+    "blake2s": hashlib.blake2s,
+}
+if xxhash is not None:
+    ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+    ALGORITHMS["xxh64"] = xxhash.xxh64
+
+# 客戶端的偏好順序：非加密的 xxh3 最快；SHA-256 在支援 SHA 指令集的 CPU 上由 OpenSSL 硬體加速，通常快於 BLAKE2 與 MD5
+PREFERRED_ALGORITHMS = tuple(name for name in ("xxh3_128", "sha256", "blake2b", "md5") if name in ALGORITHMS)
+
+
+def is_supported(algorithm):
+    return algorithm in ALGORITHMS
+
+
+def new_hasher(algorithm=DEFAULT_ALGORITHM):
+    """建立雜湊物件；不支援的演算法會拋出 ValueError。"""
+    try:
+        return ALGORITHMS[algorithm]()
+    except KeyError:
+        raise ValueError(f"不支援的雜湊演算法: {algorithm}") from None
+
+
+def choose_algorithm(offered, supported=None):
+    """
+    從對方依偏好排列的演算法清單中，選出第一個本地也支援的演算法。
+    offered 可為逗號分隔字串或 list，都不支援時回傳 DEFAULT_ALGORITHM。
+    """
+    if isinstance(offered, str):
+        offered = offered.split(",")
+    supported = supported if supported is not None else ALGORITHMS
+    for name in offered or ():
+        name = name.strip().lower()
+        if name in supported and name in ALGORITHMS:
+            return name
+    return DEFAULT_ALGORITHM
+
+
+def hash_file(path, algorithm=DEFAULT_ALGORITHM, size=None):
+    """計算檔案的雜湊：大檔案使用 mmap，其餘以大緩衝區 readinto 讀取。"""
+    hasher = new_hasher(algorithm)
+    if size is None:
+        size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size >= MMAP_THRESHOLD:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    hasher.update(mm)
+                return hasher.hexdigest()
+            except (OSError, ValueError):
+                # 部分檔案系統不支援 mmap，退回一般讀取
+                hasher = new_hasher(algorithm)
+                f.seek(0)
+        buffer = bytearray(READ_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher.hexdigest()
@@ -0,0 +1,139 @@
+import os
+import json
+import tempfile
+import threading
+
+# -------------------------
+# 本地雜湊索引
+# -------------------------
+INDEX_DIR_NAME = ".modsync"
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """
+    以同目錄下的唯一暫存檔 + 原子改名寫入 JSON，避免寫到一半中斷造成損毀。
+    暫存檔名各自獨立，多個執行緒或程序同時寫入同一個檔案時，結果為其中一份完整內容。
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class HashIndex:
+    """
+    每個版本資料夾一份的本地雜湊快取，存放於 <mc_version_path>/.modsync/hash_index.json。
+    以相對路徑為鍵，記錄 (檔案大小, mtime_ns, {演算法: 雜湊})；大小或 mtime 任一改變即視為失效，
+    如此未變動的檔案只需 stat 一次，不必重新讀取內容。伺服器更換雜湊演算法時，各演算法的結果分開保存。
+    """
+
+    FILE_NAME = "hash_index.json"
+    VERSION = 2
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.index_dir = os.path.join(self.root, INDEX_DIR_NAME)
+        self.index_path = os.path.join(self.index_dir, self.FILE_NAME)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def _rel(self, file_path):
+        """回傳相對於版本資料夾的路徑（以 / 分隔），不在版本資料夾內則回傳 None。"""
+        rel = os.path.relpath(os.path.abspath(file_path), self.root)
+        if rel.startswith("..") or os.path.isabs(rel):
+            return None
+        return rel.replace("\\", "/")
+
+    def load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entries = data.get("entries", {})
+            if data.get("version") == self.VERSION:
+                self._entries = {k: (v[0], v[1], dict(v[2])) for k, v in entries.items()}
+            elif data.get("version") == 1:
+                # 舊版索引只記錄 MD5
+                self._entries = {k: (v[0], v[1], {"md5": v[2]}) for k, v in entries.items()}
+        except (OSError, ValueError, AttributeError, IndexError, TypeError):
+            # 索引不存在或損毀時直接重建
+            self._entries = {}
+
+    def lookup(self, file_path, st=None, count=True, algorithm="md5"):
+        """若檔案大小與 mtime 與索引一致，回傳快取的雜湊，否則回傳 None。count=False 時不計入命中統計。"""
+        rel = self._rel(file_path)
+        if rel is None:
+            return None
+        try:
+            st = st or os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(rel)
+            if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns and algorithm in entry[2]:
+                if count:
+                    self.hits += 1
+                return entry[2][algorithm]
+            if count:
+                self.misses += 1
+        return None
+
+    def store(self, file_path, digest, st=None, algorithm="md5"):
+        """記錄檔案目前的大小、mtime 與雜湊；大小與 mtime 未變時保留其他演算法的結果。"""
+        rel = self._rel(file_path)
+        if rel is None or digest is None:
+            return
+        try:
+            st = st or os.stat(file_path)
+        except OSError:
+            return
+        with self._lock:
+            entry = self._entries.get(rel)
+            if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+                digests = dict(entry[2])
+            else:
+                digests = {}
+            digests[algorithm] = digest
+            self._entries[rel] = (st.st_size, st.st_mtime_ns, digests)
+            self._dirty = True
+
+    def invalidate(self, file_path):
+        rel = self._rel(file_path)
+        if rel is None:
+            return
+        with self._lock:
+            if self._entries.pop(rel, None) is not None:
+                self._dirty = True
+
+    def compact(self):
+        """移除已不存在檔案的條目。"""
+        with self._lock:
+            dead = [rel for rel in self._entries
+                    if not os.path.isfile(os.path.join(self.root, rel.replace("/", os.sep)))]
+            for rel in dead:
+                del self._entries[rel]
+            if dead:
+                self._dirty = True
+        return len(dead)
+
+    def save(self):
+        """壓縮後以暫存檔 + 原子改名的方式寫回索引，避免寫到一半中斷造成損毀。"""
+        self.compact()
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": self.VERSION, "entries": {k: list(v) for k, v in self._entries.items()}}
+            self._dirty = False
+        write_json_atomic(self.index_path, data, separators=(",", ":"))
@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import time
+import random
+import zipfile
+import tempfile
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from MerkleTree import dir_digest
+from FlowControl import TokenBucket
+from HashEngine import ALGORITHMS, ALGORITHM_HEADER, DEFAULT_ALGORITHM, choose_algorithm, hash_file
+
+# -------------------------
+# 本機模擬模組伺服器
+# -------------------------
+# 以一個本地資料夾模擬同步伺服器，提供客戶端使用的所有端點，方便在沒有正式伺服器時驗證同步流程：
+#   /config_names?json=1           根目錄下的資料夾名稱列表
+#   /mirrors?json=1                可下載相同檔案的鏡像站網址列表（以 --mirror 指定）
+#   /{folder}/?json=1              巢狀 {名稱: 雜湊 或 子字典}（加上 size=1 時檔案為 [雜湊, 大小]）
+#   /{folder}/{子目錄}/?merkle=1    該層的 Merkle 摘要與子項目
+#   /{folder}/{path}?download=1    單檔下載（支援 Range，含 bytes=起點-終點 的區段）
+#   /{folder}?download=1           整個資料夾的 ZIP
+#   POST /{folder}/?batch=1        本文為 {"files": [相對路徑, ...]}，回傳只含這些檔案的 ZIP（compress=1 時壓縮）
+# 清單請求可加上 hash=演算法1,演算法2，伺服器選用第一個支援的演算法並以 X-Hash-Algorithm 標頭回覆。
+# 另可注入延遲、頻寬限制與隨機錯誤，供效能測試模擬各種網路狀況。
+
+# request_log 保留的請求數，長時間執行時不會無限增長
+REQUEST_LOG_SIZE = 100000
+
+
+class LocalModServer:
+    """
+    latency     每個請求回應前等待的秒數
+    bandwidth   每個連線的傳輸上限（bytes/s），None 為不限制
+    link_bandwidth 所有連線合計的傳輸上限（bytes/s），模擬伺服器或玩家的對外頻寬
+    error_rate  隨機回傳 503 的機率（0~1）
+    algorithms  願意提供的雜湊演算法，None 為全部支援的演算法
+    mirrors     於 /mirrors?json=1 公布的鏡像站網址
+    merkle      是否提供 ?merkle=1（False 時模擬不支援摘要的舊伺服器，回傳 400）
+    request_log 最近收到的請求 (方法, 路徑含查詢字串)，供測試檢查客戶端實際送出的請求
+    """
+
+    def __init__(self, root, host="127.0.0.1", port=0, latency=0.0, bandwidth=None, error_rate=0.0, seed=None,
+                 algorithms=None, link_bandwidth=None, mirrors=None, merkle=True):
+        self.root = os.path.abspath(root)
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.link = TokenBucket(link_bandwidth)
+        self.error_rate = error_rate
+        self.mirrors = list(mirrors or [])
+        self.merkle = merkle
+        self.algorithms = set(algorithms) if algorithms else set(ALGORITHMS)
+        self.httpd = None
+        self._thread = None
+        self._hash_cache = {}
+        self._hash_lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = {"requests": 0, "bytes_sent": 0, "errors_injected": 0}
+            self.request_log = deque(maxlen=REQUEST_LOG_SIZE)
+
+    def record_request(self, method, path):
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.request_log.append((method, path))
+
+    def count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def inject_fault(self):
+        """套用延遲；依 error_rate 決定此請求是否要回傳錯誤。"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._stats_lock:
+            failed = self.error_rate and self._random.random() < self.error_rate
+        if failed:
+            self.count("errors_injected")
+        return failed
+
+    def copy_stream(self, src, dst, length=None):
+        """以 64 KB 為單位輸出（length 為最多輸出的位元組數），有頻寬限制時依已傳輸量暫停。"""
+        started = time.time()
+        sent = 0
+        remaining = length
+
+        def read():
+            return src.read(65536 if remaining is None else min(65536, remaining))
+
+        for chunk in iter(read, b""):
+            if remaining is not None:
+                remaining -= len(chunk)
+            self.link.consume(len(chunk))
+            dst.write(chunk)
+            sent += len(chunk)
+            # 逐塊計入傳輸量：客戶端收完最後一塊時，伺服器可能仍在頻寬限制的等待中
+            self.count("bytes_sent", len(chunk))
+            if self.bandwidth:
+                delay = sent / self.bandwidth - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.httpd.server_address[1]}"
+
+    def request_handler(self):
+        """處理請求的類別，子類別可改用自訂的 handler。"""
+        return ModRequestHandler
+
+    def start(self):
+        """於背景執行緒啟動伺服器，回傳自身以便串接。"""
+        self.httpd = ModHTTPServer((self.host, self.port), self.request_handler())
+        self.httpd.daemon_threads = True
+        self.httpd.app = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def resolve(self, rel):
+        """將請求路徑轉為本地絕對路徑，不允許跳出根目錄。"""
+        path = os.path.abspath(os.path.join(self.root, rel.replace("/", os.sep)))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            return None
+        return path
+
+    def file_hash(self, path, algorithm=DEFAULT_ALGORITHM):
+        st = os.stat(path)
+        key = (path, algorithm)
+        with self._hash_lock:
+            cached = self._hash_cache.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = hash_file(path, algorithm, st.st_size)
+        with self._hash_lock:
+            self._hash_cache[key] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def choose_algorithm(self, query):
+        return choose_algorithm(query.get("hash", [""])[0], self.algorithms)
+
+    def folder_names(self):
+        return sorted(n for n in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, n)))
+
+    def file_value(self, path, with_size, algorithm=DEFAULT_ALGORITHM):
+        digest = self.file_hash(path, algorithm)
+        return [digest, os.path.getsize(path)] if with_size else digest
+
+    def build_tree(self, path, with_size=False, algorithm=DEFAULT_ALGORITHM):
+        tree = {}
+        for entry in sorted(os.scandir(path), key=lambda e: e.name):
+            if entry.is_dir():
+                tree[entry.name] = self.build_tree(entry.path, with_size, algorithm)
+            elif entry.is_file():
+                tree[entry.name] = self.file_value(entry.path, with_size, algorithm)
+        return tree
+
+    def merkle_level(self, path, with_size=False, algorithm=DEFAULT_ALGORITHM):
+        files = {}
+        dirs = {}
+        for entry in os.scandir(path):
+            if entry.is_dir():
+                dirs[entry.name] = self.merkle_level(entry.path, algorithm=algorithm)["hash"]
+            elif entry.is_file():
+                files[entry.name] = self.file_value(entry.path, with_size, algorithm)
+        return {"hash": dir_digest(files, dirs), "files": files, "dirs": dirs, "algorithm": algorithm}
+
+    def write_zip(self, path, out):
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+            for dirpath, dirnames, filenames in os.walk(path):
+                for name in filenames:
+                    full = os.path.join(dirpath, name)
+                    zf.write(full, os.path.relpath(full, path).replace(os.sep, "/"))
+
+    def write_batch_zip(self, path, files, out, compress=False):
+        """只打包指定的檔案；不存在或超出資料夾的路徑直接略過，由客戶端改為逐檔下載。"""
+        method = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        with zipfile.ZipFile(out, "w", method) as zf:
+            for rel in files:
+                full = os.path.abspath(os.path.join(path, str(rel).replace("/", os.sep)))
+                if not full.startswith(path + os.sep) or not os.path.isfile(full):
+                    continue
+                zf.write(full, str(rel).strip("/"))
+
+
+class ModHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # 客戶端讀到需要的內容後提早關閉連線屬正常情況，不輸出錯誤
+        if isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class ModRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 標頭與內容分開寫出，關閉 Nagle 避免 keep-alive 連線上每個小回應都多等一次延遲 ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def app(self):
+        return self.server.app
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.app.count("bytes_sent", len(body))
+
+    def send_error_text(self, status):
+        body = f"HTTP {status}".encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        rel = unquote(parts.path).strip("/")
+        self.app.record_request("GET", self.path)
+        try:
+            if self.app.inject_fault():
+                return self.send_error_text(503)
+            if rel == "config_names":
+                return self.send_json(self.app.folder_names())
+            if rel == "mirrors":
+                return self.send_json(self.app.mirrors)
+            path = self.app.resolve(rel)
+            if path is None or not os.path.exists(path):
+                return self.send_error_text(404)
+            if os.path.isdir(path):
+                with_size = "size" in query
+                algorithm = self.app.choose_algorithm(query)
+                headers = {ALGORITHM_HEADER: algorithm}
+                if "merkle" in query and self.app.merkle:
+                    return self.send_json(self.app.merkle_level(path, with_size, algorithm), headers=headers)
+                if "json" in query:
+                    return self.send_json(self.app.build_tree(path, with_size, algorithm), headers=headers)
+                if "download" in query:
+                    return self.send_zip(path)
+            elif "download" in query:
+                return self.send_file(path)
+            self.send_error_text(400)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        rel = unquote(parts.path).strip("/")
+        self.app.record_request("POST", self.path)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            if self.app.inject_fault():
+                return self.send_error_text(503)
+            path = self.app.resolve(rel)
+            if path is None or not os.path.isdir(path) or "batch" not in query:
+                return self.send_error_text(404)
+            try:
+                files = json.loads(body.decode("utf-8"))["files"]
+            except (ValueError, KeyError, TypeError):
+                return self.send_error_text(400)
+            if not isinstance(files, list):
+                return self.send_error_text(400)
+            self.send_zip(path, files, compress="compress" in query)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_zip(self, path, files=None, compress=True):
+        with tempfile.TemporaryFile() as tmp:
+            if files is None:
+                self.app.write_zip(path, tmp)
+            else:
+                self.app.write_batch_zip(path, files, tmp, compress)
+            size = tmp.tell()
+            tmp.seek(0)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            self.app.copy_stream(tmp, self.wfile)
+
+    def send_file(self, path, etag=None):
+        """傳送單一檔案（支援 Range）；未指定 etag 時以檔案的 md5 作為 ETag。"""
+        size = os.path.getsize(path)
+        etag = etag or f'"{self.app.file_hash(path)}"'
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and (not if_range or if_range == etag):
+            try:
+                first, last = range_header.split("=", 1)[1].split("-", 1)
+                start = int(first)
+                end = min(int(last), size - 1) if last.strip() else size - 1
+            except (IndexError, ValueError):
+                start, end = 0, size - 1
+            if (start >= size or end < start) and size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        length = max(0, end - start + 1)
+        if length < size:
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            self.app.copy_stream(f, self.wfile, length)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本機模擬模組伺服器")
+    parser.add_argument("root", help="伺服器根目錄（其下每個子資料夾即為一個同步資料夾）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="每個請求的延遲（秒）")
+    parser.add_argument("--bandwidth", type=float, default=None, help="每個連線的頻寬上限（bytes/s）")
+    parser.add_argument("--link-bandwidth", type=float, default=None, help="所有連線合計的頻寬上限（bytes/s）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="隨機回傳 503 的機率（0~1）")
+    parser.add_argument("--hash", default=None, help="提供的雜湊演算法，以逗號分隔（預設全部）")
+    parser.add_argument("--mirror", action="append", default=[], help="於 /mirrors?json=1 公布的鏡像站網址（可重複）")
+    parser.add_argument("--no-merkle", action="store_true", help="不提供 ?merkle=1，模擬不支援摘要比對的舊伺服器")
+    args = parser.parse_args(argv)
+    algorithms = [a.strip() for a in args.hash.split(",")] if args.hash else None
+    server = LocalModServer(args.root, args.host, args.port, latency=args.latency, bandwidth=args.bandwidth,
+                            error_rate=args.error_rate, algorithms=algorithms,
+                            link_bandwidth=args.link_bandwidth, mirrors=args.mirror,
+                            merkle=not args.no_merkle).start()
+    print(f"Serving {server.root} at {server.url}")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
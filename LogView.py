@@ -0,0 +1,66 @@
+from collections import deque
+
+from PyQt6.QtWidgets import QListView, QAbstractItemView
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex
+
+# -------------------------
+# 有上限的 log 顯示
+# -------------------------
+class LogModel(QAbstractListModel):
+    """以固定長度的環狀緩衝區保存 log，超過上限時丟棄最舊的行，記憶體不會隨同步時間增長。"""
+
+    def __init__(self, max_lines=5000, parent=None):
+        super().__init__(parent)
+        self._lines = deque(maxlen=max_lines)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._lines)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return self._lines[index.row()]
+        return None
+
+    def append_lines(self, lines):
+        if not lines:
+            return
+        max_lines = self._lines.maxlen
+        lines = lines[-max_lines:]
+        overflow = len(self._lines) + len(lines) - max_lines
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self._lines.popleft()
+            self.endRemoveRows()
+        start = len(self._lines)
+        self.beginInsertRows(QModelIndex(), start, start + len(lines) - 1)
+        self._lines.extend(lines)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._lines.clear()
+        self.endResetModel()
+
+
+class LogView(QListView):
+    """只繪製可見範圍的 log 列表；使用者往上捲動查看時不會被新訊息強制拉回底部。"""
+
+    def __init__(self, max_lines=5000, parent=None):
+        super().__init__(parent)
+        self.log_model = LogModel(max_lines, self)
+        self.setModel(self.log_model)
+        self.setUniformItemSizes(True)
+        self.setWordWrap(False)
+        self.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+
+    def append_lines(self, lines):
+        scrollbar = self.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 2
+        self.log_model.append_lines(lines)
+        if at_bottom:
+            self.scrollToBottom()
+
+    def clear(self):
+        self.log_model.clear()
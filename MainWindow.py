@@ -1,22 +1,36 @@
 import sys
 import os
-import requests
-import json
+import threading
 import webbrowser
 
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-    QLabel, QTextEdit, QProgressBar, QLineEdit, QFileDialog, QMessageBox, QSplashScreen,
+    QLabel, QProgressBar, QLineEdit, QFileDialog, QMessageBox, QSplashScreen,
     QCheckBox
 )
+from PyQt6.QtCore import pyqtSignal
 
 from WorkerThread import WorkerThread
+from SyncEngine import TRANSFER_ASYNC, TRANSFER_THREADS
+from HttpSession import create_session
+from LogView import LogView
+from ContentStore import ContentStore
+from FlowControl import MAX_CONCURRENCY, parse_rate
+from TransferProgress import describe
+from MirrorPool import parse_mirrors
+from Prefetch import Prefetch, fetch_update_info
+from PeerCache import PeerServer, DEFAULT_PEER_PORT
 
 # -------------------------
 # 主視窗部分
 # -------------------------
 
 class MainWindow(QWidget):
+    # 「進行中的下載」最多顯示的行數
+    TRANSFER_LINES = 5
+    # 背景執行緒取得的最新版本資訊（或例外），交回 GUI 執行緒顯示
+    update_info_signal = pyqtSignal(object)
+
     def __init__(self, version, serverUrl):
 
         super().__init__()
@@ -38,6 +52,28 @@ class MainWindow(QWidget):
         server_layout.addWidget(self.server_input)
         layout.addLayout(server_layout)
 
+        # 選填的鏡像站：檔案清單仍由伺服器 URL 取得，檔案內容可分散由各鏡像站下載
+        mirror_layout = QHBoxLayout()
+        mirror_layout.addWidget(QLabel("鏡像站:"))
+        self.mirrors_input = QLineEdit()
+        self.mirrors_input.setPlaceholderText("選填，多個網址以逗號分隔（伺服器公布的鏡像站會自動加入）")
+        mirror_layout.addWidget(self.mirrors_input)
+        layout.addLayout(mirror_layout)
+
+        # 區網快取：優先由同一區網內其他玩家分享的檔案下載，也可分享本機已驗證的檔案
+        peer_layout = QHBoxLayout()
+        peer_layout.addWidget(QLabel("區網快取:"))
+        self.peers_input = QLineEdit()
+        self.peers_input.setPlaceholderText("選填，其他玩家的分享網址，例如 http://192.168.1.5:8765")
+        peer_layout.addWidget(self.peers_input)
+        self.share_checkbox = QCheckBox("分享給區網")
+        self.share_checkbox.setToolTip("啟用後：同一區網的其他玩家可以由本機下載已驗證與伺服器一致的檔案，減輕伺服器負擔。")
+        self.share_checkbox.toggled.connect(self.toggle_share)
+        peer_layout.addWidget(self.share_checkbox)
+        layout.addLayout(peer_layout)
+        self.peer_server = None
+        self.share_port = DEFAULT_PEER_PORT
+
         path_layout = QHBoxLayout()
         path_layout.addWidget(QLabel("Minecraft 版本資料夾:"))
         exe_dir = os.path.dirname(sys.executable)
@@ -53,17 +89,47 @@ class MainWindow(QWidget):
         self.only_add_config_checkbox.setToolTip("啟用後：若本地已存在同名 config 檔案，將不會覆蓋或刪除該檔案，只會下載伺服器上本地缺少的檔案。")
         layout.addWidget(self.only_add_config_checkbox)
 
-        self.log_area = QTextEdit()
-        self.log_area.setReadOnly(True)
+        # 多個版本資料夾共用已下載的檔案，同一個模組只需下載一次
+        self.store_checkbox = QCheckBox("使用共用檔案庫 (多個版本資料夾共用已下載的模組)")
+        self.store_checkbox.setToolTip("啟用後：下載過的檔案會保存在共用檔案庫，其他版本資料夾需要相同檔案時直接以硬連結或複製取得，不必重新下載。")
+        self.store_checkbox.setChecked(True)
+        layout.addWidget(self.store_checkbox)
+        self.content_store = None
+
+        # 以事件迴圈同時進行大量下載，適合大量小檔案且伺服器不支援批次下載時
+        self.async_checkbox = QCheckBox("使用非同步下載 (大量小檔案時可同時進行數百個下載)")
+        self.async_checkbox.setToolTip("啟用後：逐檔下載改由單一事件迴圈處理，不需為每個下載佔用一個執行緒，暫停與停止也會立即生效。")
+        layout.addWidget(self.async_checkbox)
+
+        # 下載頻寬上限，同步途中修改也會立即套用
+        rate_layout = QHBoxLayout()
+        rate_layout.addWidget(QLabel("下載頻寬上限:"))
+        self.rate_input = QLineEdit()
+        self.rate_input.setPlaceholderText("不限制（例如 500K、2M，單位為每秒位元組）")
+        self.rate_input.editingFinished.connect(self.apply_rate_limit)
+        rate_layout.addWidget(self.rate_input)
+        layout.addLayout(rate_layout)
+
+        # 虛擬化的 log 列表，只保留最近的訊息
+        self.log_area = LogView()
         layout.addWidget(self.log_area)
 
+        # 整體進度以位元組計算（千分比），下方顯示檔案數、速度與剩餘時間
         layout.addWidget(QLabel("整體進度"))
         self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setValue(0)
         layout.addWidget(self.progress_bar)
+        self.progress_label = QLabel("")
+        layout.addWidget(self.progress_label)
 
-        layout.addWidget(QLabel("單檔進度"))
-        self.file_progress_bar = QProgressBar()
-        layout.addWidget(self.file_progress_bar)
+        # 每個進行中的下載各自的進度
+        layout.addWidget(QLabel("進行中的下載"))
+        self.transfers_label = QLabel("")
+        layout.addWidget(self.transfers_label)
+        self.files_completed = 0
+        self.files_total = 0
+        self.bytes_snapshot = None
 
         btn_layout = QHBoxLayout()
         self.start_btn = QPushButton("開始同步")
@@ -74,6 +140,10 @@ class MainWindow(QWidget):
         self.pause_btn.clicked.connect(self.pause_resume)
         btn_layout.addWidget(self.pause_btn)
 
+        self.stop_btn = QPushButton("停止")
+        self.stop_btn.clicked.connect(self.stop_sync)
+        btn_layout.addWidget(self.stop_btn)
+
         self.clear_btn = QPushButton("清空訊息")
         self.clear_btn.clicked.connect(lambda: self.log_area.clear())
         btn_layout.addWidget(self.clear_btn)
@@ -82,11 +152,17 @@ class MainWindow(QWidget):
         self.setLayout(layout)
 
         self.worker = None
+        # 更新檢查與每次同步共用同一個連線池，保留 keep-alive 連線
+        self.http_session = create_session(pool_size=MAX_CONCURRENCY)
+        # 啟動時在背景預先抓取清單與檢查本地檔案，開始同步時沿用
+        self.prefetch = None
+        self.update_info_signal.connect(self.show_update)
 
     def choose_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "選擇 Minecraft 版本資料夾", os.getcwd())
         if folder:
             self.path_input.setText(folder)
+            self.start_prefetch()
             mods_servermods = os.path.join(folder, "mods", "servermods")
             mods_clientmods = os.path.join(folder, "mods", "clientmods")
             # 確保兩個目錄都存在（servermods 為伺服器 mods 嚴格同步目的地；clientmods 為伺服器 clientmods 的對應）
@@ -110,21 +186,95 @@ class MainWindow(QWidget):
             QMessageBox.warning(self, "錯誤", "請先選擇 Minecraft 版本資料夾。")
             self.start_btn.setEnabled(True)
             return
-        self.worker = WorkerThread(self.server_input.text().strip(), mc_version_path)
+        store = None
+        if self.store_checkbox.isChecked():
+            try:
+                if self.content_store is None:
+                    self.content_store = ContentStore()
+                store = self.content_store
+            except OSError as e:
+                self.append_log(f"⚠ 無法使用共用檔案庫，改為直接下載: {e}")
+        self.worker = WorkerThread(self.server_input.text().strip(), mc_version_path, session=self.http_session,
+                                   store=store, mirrors=parse_mirrors(self.mirrors_input.text()),
+                                   transfer=TRANSFER_ASYNC if self.async_checkbox.isChecked() else TRANSFER_THREADS,
+                                   prefetch=self.prefetch, peers=parse_mirrors(self.peers_input.text()))
+        # 預先抓取的結果只沿用一次，下次同步重新抓取
+        self.prefetch = None
         # 傳遞僅新增設定檔選項（不改動其他行為）
         self.worker.only_add_config = self.only_add_config_checkbox.isChecked()
+        self.apply_rate_limit()
+        self.files_completed = self.files_total = 0
+        self.bytes_snapshot = None
+        self.progress_bar.setValue(0)
+        self.progress_label.setText("")
+        self.transfers_label.setText("")
 
-        self.worker.log_signal.connect(self.append_log)
+        self.worker.log_batch_signal.connect(self.append_logs)
         self.worker.progress_signal.connect(self.update_progress)
         self.worker.total_files_signal.connect(self.set_total_files)
-        self.worker.file_progress_signal.connect(self.update_file_progress)
+        self.worker.bytes_progress_signal.connect(self.update_bytes_progress)
         self.worker.finished.connect(lambda: self.start_btn.setEnabled(True))
         self.worker.start()
 
+    def rate_limit(self):
+        """讀取頻寬上限欄位，無法解析時提示並視為不限制。"""
+        try:
+            return parse_rate(self.rate_input.text())
+        except ValueError as e:
+            self.append_log(f"⚠ {e}，頻寬不限制")
+            return None
+
+    def apply_rate_limit(self):
+        if self.worker is None:
+            return
+        self.worker.set_bandwidth_limit(self.rate_limit())
+        if self.worker.isRunning():
+            self.append_log(f"🐢 下載頻寬上限: {self.rate_input.text().strip() or '不限制'}")
+
+    def stop_sync(self):
+        if self.worker and self.worker.isRunning():
+            self.worker.stop()
+            self.pause_btn.setText("暫停")
+            self.append_log("⏹ 已停止同步，未完成的下載會在下次同步時續傳")
+
+    def toggle_share(self, checked):
+        if not checked:
+            if self.peer_server is not None:
+                self.peer_server.stop()
+                self.peer_server = None
+                self.append_log("⏹ 已停止區網快取")
+            return
+        mc_version_path = self.path_input.text().strip()
+        if not mc_version_path or not os.path.isdir(mc_version_path):
+            self.append_log("⚠ 請先選擇 Minecraft 版本資料夾再分享")
+            self.share_checkbox.setChecked(False)
+            return
+        try:
+            store = None
+            if self.store_checkbox.isChecked():
+                if self.content_store is None:
+                    self.content_store = ContentStore()
+                store = self.content_store
+            self.peer_server = PeerServer(mc_version_path, port=self.share_port, store=store).start()
+        except OSError as e:
+            self.append_log(f"❌ 無法啟動區網快取: {e}")
+            self.share_checkbox.setChecked(False)
+            return
+        self.append_log(f"🏠 區網快取已啟動 {self.peer_server.url}（其他玩家於「區網快取」填入此網址）")
+
+    def closeEvent(self, event):
+        # 關閉視窗時停止進行中的同步，保留暫存檔以便下次續傳
+        if self.worker and self.worker.isRunning():
+            self.worker.stop()
+            self.worker.wait(5000)
+        if self.peer_server is not None:
+            self.peer_server.stop()
+        super().closeEvent(event)
+
     def pause_resume(self):
         if self.worker:
             self.worker.pause()
-            if self.worker._pause_flag:
+            if self.worker.engine.paused:
                 self.pause_btn.setText("繼續")
                 self.append_log("⏸ 已暫停下載")
             else:
@@ -132,26 +282,62 @@ class MainWindow(QWidget):
                 self.append_log("▶ 已繼續下載")
 
     def append_log(self, text):
-        self.log_area.append(text)
-        self.log_area.verticalScrollBar().setValue(self.log_area.verticalScrollBar().maximum())
+        self.append_logs(text.split("\n"))
+
+    def append_logs(self, lines):
+        # 工作執行緒的 log 已合併成批次，每批只更新一次畫面
+        expanded = []
+        for line in lines:
+            expanded.extend(line.split("\n"))
+        self.log_area.append_lines(expanded)
 
     def update_progress(self, value):
-        self.progress_bar.setValue(value)
+        self.files_completed = value
+        self.update_progress_label()
 
     def set_total_files(self, total):
-        self.progress_bar.setMaximum(total)
+        self.files_total = total
+        self.update_progress_label()
+
+    def update_bytes_progress(self, snapshot):
+        self.bytes_snapshot = snapshot
+        total = snapshot["total"]
+        self.progress_bar.setValue(int(snapshot["done"] * 1000 / total) if total else 0)
+        self.update_progress_label()
+        # 最多列出 TRANSFER_LINES 個進行中的下載（大檔案在前）
+        lines = []
+        for name, done, size in snapshot["transfers"][:self.TRANSFER_LINES]:
+            percent = f"{done * 100 // size:3d}%" if size else " ..."
+            lines.append(f"{percent}  {name}")
+        hidden = len(snapshot["transfers"]) - len(lines)
+        if hidden > 0:
+            lines.append(f"…另有 {hidden} 個")
+        self.transfers_label.setText("\n".join(lines))
+
+    def update_progress_label(self):
+        text = f"{self.files_completed} / {self.files_total} 個檔案"
+        if self.bytes_snapshot is not None:
+            text += f"，{describe(self.bytes_snapshot)}"
+        self.progress_label.setText(text)
 
-    def update_file_progress(self, value):
-        self.file_progress_bar.setValue(value)
+    def start_prefetch(self):
+        """在背景開始抓取資料夾列表與清單並計算本地雜湊；版本資料夾不存在時不進行。"""
+        mc_version_path = self.path_input.text().strip()
+        if not mc_version_path or not os.path.isdir(mc_version_path):
+            self.prefetch = None
+            return
+        self.prefetch = Prefetch(self.server_input.text().strip(), mc_version_path, session=self.http_session).start()
 
     def check_update(self):
+        """在背景執行緒檢查新版本，不阻塞視窗；結果經由 update_info_signal 回到 GUI 執行緒。"""
+        server_url = self.server_input.text().strip()
+        threading.Thread(target=lambda: self.update_info_signal.emit(fetch_update_info(self.http_session, server_url)),
+                         daemon=True).start()
+
+    def show_update(self, version_info):
         try:
-            version_url = f"{self.server_input.text().strip()}/clientupdate/version.txt"
-            r = requests.get(version_url, timeout=10)
-            if r.status_code != 200:
-                self.append_log("⚠ 無法取得最新版本號")
-                return
-            version_info = json.loads(r.text)
+            if isinstance(version_info, Exception):
+                raise version_info
             latest_version = version_info.get("version", "0.0.0")
             note_text = version_info.get("note", "")
             if latest_version != self.client_version:
@@ -0,0 +1,50 @@
+import os
+import json
+from urllib.parse import quote, unquote
+
+from HashIndex import INDEX_DIR_NAME, write_json_atomic
+from ManifestIndex import ManifestIndex
+
+# -------------------------
+# 本地伺服器清單紀錄
+# -------------------------
+class ManifestCache:
+    """
+    記錄上次同步時各資料夾的伺服器清單（<mc_version_path>/.modsync/manifests/<folder>.json），
+    配合 Merkle 摘要使用：根摘要未變時直接沿用紀錄，變更時只需下載有差異的子目錄。
+    """
+
+    def __init__(self, root):
+        self.cache_dir = os.path.join(os.path.abspath(root), INDEX_DIR_NAME, "manifests")
+
+    def _path(self, folder):
+        return os.path.join(self.cache_dir, quote(str(folder), safe="") + ".json")
+
+    def folders(self):
+        """已有紀錄的資料夾名稱。"""
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+        return sorted(unquote(name[:-5]) for name in names if name.endswith(".json"))
+
+    def stamp(self, folder):
+        """紀錄檔的 mtime（不存在時為 None），長時間執行的程式可據此判斷是否需要重新載入。"""
+        try:
+            return os.stat(self._path(folder)).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self, folder):
+        try:
+            with open(self._path(folder), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return ManifestIndex(data["files"], set(data["dirs"]), data.get("sizes", {}),
+                                 data.get("algorithm", "md5"))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, folder, manifest):
+        write_json_atomic(self._path(folder), {"files": manifest.hashes, "dirs": sorted(manifest.dirs),
+                                               "sizes": manifest.sizes, "algorithm": manifest.algorithm},
+                          separators=(",", ":"))
@@ -0,0 +1,61 @@
+# -------------------------
+# 伺服器檔案清單索引
+# -------------------------
+class ManifestIndex:
+    """
+    將伺服器 /{folder}/?json=1 回傳的巢狀字典攤平成「相對路徑 -> 雜湊」的單層索引。
+    每個資料夾只需抓取並轉換一次，之後掃描、下載、驗證都共用同一份，查詢為 O(1)。
+    伺服器若以 [雜湊, 大小] 表示檔案，大小另存於 sizes 供同步規劃估算傳輸量。
+    algorithm 為伺服器宣告的雜湊演算法（預設 md5）。
+    """
+
+    __slots__ = ("hashes", "sizes", "dirs", "algorithm")
+
+    def __init__(self, hashes=None, dirs=None, sizes=None, algorithm="md5"):
+        self.hashes = hashes if hashes is not None else {}
+        self.dirs = dirs if dirs is not None else set()
+        self.sizes = sizes if sizes is not None else {}
+        self.algorithm = algorithm
+
+    @classmethod
+    def from_tree(cls, tree, algorithm="md5"):
+        """以迭代方式攤平巢狀字典（避免極深目錄造成遞迴過深）。"""
+        manifest = cls(algorithm=algorithm)
+        stack = [("", tree)]
+        while stack:
+            prefix, node = stack.pop()
+            for name, value in node.items():
+                rel = f"{prefix}/{name}" if prefix else name
+                if isinstance(value, dict):
+                    manifest.dirs.add(rel)
+                    stack.append((rel, value))
+                else:
+                    manifest.add_file(rel, value)
+        return manifest
+
+    def add_file(self, rel_path, value):
+        if isinstance(value, (list, tuple)):
+            self.hashes[rel_path] = value[0]
+            if len(value) > 1 and value[1] is not None:
+                self.sizes[rel_path] = int(value[1])
+        else:
+            self.hashes[rel_path] = value
+
+    def get(self, rel_path, default=None):
+        return self.hashes.get(rel_path, default)
+
+    def size(self, rel_path):
+        """回傳伺服器提供的檔案大小，未提供時為 None。"""
+        return self.sizes.get(rel_path)
+
+    def items(self):
+        return self.hashes.items()
+
+    def __contains__(self, rel_path):
+        return rel_path in self.hashes
+
+    def __iter__(self):
+        return iter(self.hashes)
+
+    def __len__(self):
+        return len(self.hashes)
@@ -0,0 +1,67 @@
+import hashlib
+
+# -------------------------
+# 資料夾 Merkle 摘要
+# -------------------------
+# 每個目錄的摘要 = md5( 依名稱排序後的 "f\t名稱\t檔案雜湊\n" 與 "d\t名稱\t子目錄摘要\n" )
+# 伺服器 /{folder}/{子目錄}/?merkle=1 回傳 {"hash": 目錄摘要, "files": {名稱: 雜湊}, "dirs": {名稱: 子目錄摘要}}，
+# 只要根摘要與本地紀錄相同即可確定整個資料夾未變更。
+
+
+def file_hash_of(value):
+    """清單中的檔案值可能是雜湊字串或 [雜湊, 大小]，統一取出雜湊。"""
+    if isinstance(value, (list, tuple)):
+        return value[0]
+    return value
+
+
+def dir_digest(files, dirs):
+    lines = []
+    for name, value in files.items():
+        lines.append(f"f\t{name}\t{file_hash_of(value)}\n")
+    for name, digest in dirs.items():
+        lines.append(f"d\t{name}\t{digest}\n")
+    lines.sort()
+    return hashlib.md5("".join(lines).encode("utf-8")).hexdigest()
+
+
+def split_parent(rel):
+    if "/" in rel:
+        return rel.rsplit("/", 1)
+    return "", rel
+
+
+def compute_dir_digests(manifest):
+    """由 ManifestIndex 計算所有目錄（含根目錄 ""）的摘要。"""
+    files_by_dir = {"": {}}
+    dirs_by_dir = {"": {}}
+    for rel in manifest.dirs:
+        files_by_dir.setdefault(rel, {})
+        dirs_by_dir.setdefault(rel, {})
+    for rel, value in manifest.items():
+        parent, name = split_parent(rel)
+        files_by_dir.setdefault(parent, {})[name] = value
+        dirs_by_dir.setdefault(parent, {})
+    for rel in list(files_by_dir):
+        while rel:
+            rel = split_parent(rel)[0]
+            files_by_dir.setdefault(rel, {})
+    digests = {}
+    # 由最深的目錄往上計算
+    for rel in sorted(files_by_dir, key=lambda r: r.count("/") + (1 if r else 0), reverse=True):
+        digests[rel] = dir_digest(files_by_dir[rel], dirs_by_dir.get(rel, {}))
+        if rel:
+            parent, name = split_parent(rel)
+            dirs_by_dir.setdefault(parent, {})[name] = digests[rel]
+            files_by_dir.setdefault(parent, {})
+    return digests
+
+
+def subtree_root(rel, roots):
+    """若 rel 位於 roots 中某個目錄之下（或就是該目錄），回傳該目錄，否則回傳 None。"""
+    parent = rel
+    while parent:
+        if parent in roots:
+            return parent
+        parent = split_parent(parent)[0]
+    return None
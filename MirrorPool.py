@@ -0,0 +1,174 @@
+import time
+import threading
+import concurrent.futures
+
+# -------------------------
+# 多個鏡像站的選擇與容錯
+# -------------------------
+# 檔案清單一律由主伺服器取得（雜湊以主伺服器為準），檔案內容則可由任何提供相同端點的鏡像站下載，
+# 下載後仍以清單雜湊驗證，鏡像站內容過期或損毀時只會造成一次重新下載。
+# 區網快取（其他玩家以 PeerServer 分享的檔案）也是一種鏡像站，選擇時優先使用，減輕主伺服器的負擔。
+
+PROBE_PATH = "/config_names?json=1"
+PROBE_TIMEOUT = 5
+# 鏡像站出錯後暫停使用的秒數，連續出錯時加倍
+FAILURE_COOLDOWN = 5.0
+MAX_COOLDOWN = 120.0
+# 選擇鏡像站時以此大小估算一次下載的傳輸時間
+SCORE_BYTES = 1024 * 1024
+# 有多個可用來源時，超過 SEGMENT_THRESHOLD 的檔案切成 SEGMENT_SIZE 的區段，最多由 MAX_SEGMENT_WORKERS 個連線同時下載
+SEGMENT_THRESHOLD = 16 * 1024 * 1024
+SEGMENT_SIZE = 4 * 1024 * 1024
+MAX_SEGMENT_WORKERS = 4
+# 區網快取的預估時間乘以此係數，效能相近時優先選用
+PEER_WEIGHT = 0.5
+
+
+def parse_mirrors(text):
+    """將以逗號或空白分隔的網址轉為 list，去除結尾的 / 與重複項目。"""
+    mirrors = []
+    for url in str(text or "").replace(",", " ").split():
+        url = url.rstrip("/")
+        if url and url not in mirrors:
+            mirrors.append(url)
+    return mirrors
+
+
+class Mirror:
+    """單一下載來源的實測延遲、速度與健康狀態。"""
+
+    ALPHA = 0.3
+
+    def __init__(self, url, primary=False, peer=False):
+        self.url = url.rstrip("/")
+        self.primary = primary
+        self.peer = peer
+        self.latency = None
+        self.throughput = None
+        self.active = 0
+        self.failures = 0
+        self.bytes = 0
+        self.cooldown = 0.0
+        self.disabled_until = 0.0
+
+    def available(self, now):
+        return now >= self.disabled_until
+
+    def score(self):
+        """預估在此來源再開始一個下載所需的時間，越小越好；尚未量測的數值以預設值估計。"""
+        latency = self.latency if self.latency is not None else 0.1
+        throughput = self.throughput or 4 * 1024 * 1024
+        score = latency + (self.active + 1) * SCORE_BYTES / throughput
+        return score * PEER_WEIGHT if self.peer else score
+
+    def describe(self):
+        latency = f"{self.latency * 1000:.0f}ms" if self.latency is not None else "未知"
+        role = "，主伺服器" if self.primary else "，區網快取" if self.peer else ""
+        return f"{self.url} ({latency}{role})"
+
+
+class MirrorPool:
+    """
+    管理主伺服器與所有鏡像站：probe() 量測延遲並停用無法連線的鏡像站，
+    acquire() 依目前負載與實測速度挑選最快可用的來源，release() 回報結果；
+    出錯的來源暫停一段逐次加倍的時間，其他下載自動改用別的來源。
+    """
+
+    def __init__(self, primary_url, mirrors=(), peers=()):
+        self._lock = threading.Lock()
+        self.mirrors = [Mirror(primary_url, primary=True)]
+        for url in peers:
+            self.add(url, peer=True)
+        for url in mirrors:
+            self.add(url)
+
+    def add(self, url, peer=False):
+        """加入一個鏡像站（peer 為 True 時為區網快取），已存在時回傳 False。"""
+        url = url.rstrip("/")
+        with self._lock:
+            if not url or any(m.url == url for m in self.mirrors):
+                return False
+            self.mirrors.append(Mirror(url, peer=peer))
+            return True
+
+    def __len__(self):
+        return len(self.mirrors)
+
+    def probe(self, session, timeout=PROBE_TIMEOUT):
+        """同時對所有來源送出一個輕量請求量測延遲；無法連線的來源在本次同步中暫停使用。回傳依延遲排序的 list。"""
+
+        def measure(mirror):
+            started = time.perf_counter()
+            try:
+                r = session.get(mirror.url + PROBE_PATH, timeout=timeout)
+                r.close()
+                return mirror, time.perf_counter() - started if r.status_code == 200 else None
+            except Exception:
+                return mirror, None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(self.mirrors))) as executor:
+            results = list(executor.map(measure, self.mirrors))
+        now = time.monotonic()
+        with self._lock:
+            for mirror, latency in results:
+                if latency is None:
+                    mirror.failures += 1
+                    if mirror.primary:
+                        # 主伺服器仍保留為最後的來源，只降低優先順序
+                        mirror.latency = timeout
+                    else:
+                        mirror.disabled_until = now + MAX_COOLDOWN
+                else:
+                    mirror.latency = latency
+        return self.ranked()
+
+    def ranked(self):
+        now = time.monotonic()
+        with self._lock:
+            return sorted(self.mirrors, key=lambda m: (not m.available(now), m.score()))
+
+    def healthy(self):
+        now = time.monotonic()
+        with self._lock:
+            return [m for m in self.mirrors if m.available(now)]
+
+    def acquire(self, exclude=()):
+        """挑選預估最快的可用來源並計入一個進行中的下載；exclude 中的來源只在沒有其他選擇時使用。"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [m for m in self.mirrors if m.available(now) and m not in exclude]
+            if not candidates:
+                candidates = [m for m in self.mirrors if m.available(now)] or self.mirrors
+            mirror = min(candidates, key=Mirror.score)
+            mirror.active += 1
+            return mirror
+
+    def release(self, mirror, nbytes=0, seconds=0.0, ok=True, latency=None, missing=False):
+        """
+        回報一次下載的結果；成功時更新延遲與速度的移動平均，失敗時暫停此來源。
+        missing 表示來源只是沒有這個檔案（例如區網快取尚未同步到），不視為故障。
+        """
+        with self._lock:
+            mirror.active -= 1
+            mirror.bytes += nbytes
+            if missing:
+                return
+            if not ok:
+                mirror.failures += 1
+                mirror.cooldown = min(MAX_COOLDOWN, mirror.cooldown * 2 or FAILURE_COOLDOWN)
+                mirror.disabled_until = time.monotonic() + mirror.cooldown
+                return
+            mirror.cooldown = 0.0
+            if latency is not None:
+                mirror.latency = latency if mirror.latency is None else \
+                    mirror.latency + Mirror.ALPHA * (latency - mirror.latency)
+            # 小檔案的耗時主要是延遲，只以較大的傳輸更新速度
+            if nbytes >= 256 * 1024 and seconds > 0:
+                rate = nbytes / seconds
+                mirror.throughput = rate if mirror.throughput is None else \
+                    mirror.throughput + Mirror.ALPHA * (rate - mirror.throughput)
+
+    def snapshot(self):
+        with self._lock:
+            return [{"url": m.url, "latency": m.latency, "throughput": m.throughput, "bytes": m.bytes,
+                     "failures": m.failures, "peer": m.peer} for m in self.mirrors]
@@ -0,0 +1,102 @@
+import os
+import json
+
+# -------------------------
+# 可續傳的下載暫存檔
+# -------------------------
+PART_SUFFIX = ".part"
+META_SUFFIX = ".part.json"
+
+
+def is_partial_name(name):
+    return name.endswith(PART_SUFFIX) or name.endswith(META_SUFFIX)
+
+
+def partial_target(name):
+    """由暫存檔名稱還原出目標檔名（非暫存檔回傳 None）。"""
+    for suffix in (META_SUFFIX, PART_SUFFIX):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return None
+
+
+class PartialDownload:
+    """
+    管理 <檔案>.part 與記錄下載進度的 <檔案>.part.json。
+    只有當紀錄中的清單雜湊與本次相同時才會續傳，ETag 則透過 If-Range 交由伺服器判斷，
+    因此伺服器檔案在兩次執行之間被更換時會自動從頭下載。
+    """
+
+    def __init__(self, local_path, expected_hash):
+        self.local_path = local_path
+        self.part_path = local_path + PART_SUFFIX
+        self.meta_path = local_path + META_SUFFIX
+        self.expected_hash = expected_hash
+
+    def resume_offset(self):
+        """回傳 (可續傳的位元組數, 上次的 ETag)；無法續傳時會清除殘留暫存檔並回傳 (0, None)。"""
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            offset = os.path.getsize(self.part_path)
+        except (OSError, ValueError):
+            self.discard()
+            return 0, None
+        if not self.expected_hash or meta.get("hash") != self.expected_hash:
+            self.discard()
+            return 0, None
+        total = meta.get("size")
+        if total and offset > total:
+            self.discard()
+            return 0, None
+        return offset, meta.get("etag")
+
+    def range_headers(self, offset, etag):
+        if offset <= 0:
+            return {}
+        headers = {"Range": f"bytes={offset}-"}
+        if etag:
+            headers["If-Range"] = etag
+        return headers
+
+    def seed_hash(self, hasher, offset):
+        """以已下載的部分更新雜湊，之後只需對新資料做增量計算。"""
+        with open(self.part_path, "rb") as f:
+            remaining = offset
+            while remaining > 0:
+                chunk = f.read(min(1048576, remaining))
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                remaining -= len(chunk)
+
+    def begin(self, etag, total_size):
+        meta = {"hash": self.expected_hash, "etag": etag, "size": total_size}
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def commit(self):
+        os.replace(self.part_path, self.local_path)
+        self._remove(self.meta_path)
+
+    def discard(self):
+        self._remove(self.part_path)
+        self._remove(self.meta_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def parse_content_range_start(value):
+    """解析 'bytes 100-199/200' 的起始位置，格式不符回傳 None。"""
+    try:
+        unit, rest = value.split(" ", 1)
+        if unit.strip().lower() != "bytes":
+            return None
+        return int(rest.split("-", 1)[0])
+    except (AttributeError, ValueError):
+        return None
@@ -0,0 +1,165 @@
+import os
+import sys
+import socket
+import argparse
+import threading
+
+from LocalModServer import LocalModServer, ModRequestHandler
+from ManifestCache import ManifestCache
+from HashIndex import HashIndex
+from HashEngine import hash_file
+from SyncEngine import resolve_local_folder
+
+# -------------------------
+# 區網快取
+# -------------------------
+# 同一個區網內已同步完成的玩家，把驗證過的檔案以與同步伺服器相同的端點分享出去：
+#   /config_names?json=1           有清單紀錄的資料夾（供其他客戶端量測延遲）
+#   /{folder}/{path}?download=1    單檔下載（支援 Range 與區段）
+# 其他玩家以 --peers 加入後優先由區網下載，沒有的檔案（404）改由主伺服器或其他來源提供。
+# 清單永遠由主伺服器取得，下載後一律以主伺服器清單的雜湊驗證，區網快取的內容有誤也只會重新下載。
+
+DEFAULT_PEER_PORT = 8765
+
+
+def lan_address():
+    """猜測本機在區網中的 IP（不會實際送出封包），無法判斷時回傳 127.0.0.1。"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("10.255.255.255", 1))
+            return s.getsockname()[0]
+    except OSError:
+        return "127.0.0.1"
+
+
+class PeerServer(LocalModServer):
+    """
+    分享一個版本資料夾中已驗證的檔案。只提供雜湊與上次同步的伺服器清單（.modsync/manifests）一致的檔案，
+    本地檔案已被修改時改由共用檔案庫提供，兩者皆無則回傳 404；不提供清單、整包與批次下載，
+    也不會提供清單以外的任何檔案。同步中的版本資料夾也可以分享，清單與雜湊索引更新後自動重新載入。
+    """
+
+    def __init__(self, mc_version_path, host="0.0.0.0", port=DEFAULT_PEER_PORT, store=None, link_bandwidth=None):
+        super().__init__(mc_version_path, host, port, link_bandwidth=link_bandwidth)
+        self.mc_version_path = os.path.abspath(mc_version_path)
+        self.store = store
+        self.manifest_cache = ManifestCache(self.mc_version_path)
+        self.hash_index = HashIndex(self.mc_version_path)
+        self._manifests = {}
+        self._index_stamp = None
+        # 已驗證與清單一致的路徑 -> (大小, mtime_ns, 雜湊)，傳送時作為 ETag
+        self._verified = {}
+        self._peer_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host = lan_address() if self.host in ("0.0.0.0", "") else self.host
+        return f"http://{host}:{self.httpd.server_address[1]}"
+
+    def request_handler(self):
+        return PeerRequestHandler
+
+    def folder_names(self):
+        return self.manifest_cache.folders()
+
+    def manifest(self, folder):
+        stamp = self.manifest_cache.stamp(folder)
+        if stamp is None:
+            return None
+        with self._peer_lock:
+            cached = self._manifests.get(folder)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+        manifest = self.manifest_cache.load(folder)
+        with self._peer_lock:
+            self._manifests[folder] = (stamp, manifest)
+        return manifest
+
+    def local_hash(self, path, algorithm):
+        """以版本資料夾的雜湊索引取得檔案雜湊（同步程式寫回索引後重新載入），索引沒有時才計算。"""
+        try:
+            stamp = os.stat(self.hash_index.index_path).st_mtime_ns
+        except OSError:
+            stamp = None
+        with self._peer_lock:
+            if stamp != self._index_stamp:
+                self._index_stamp = stamp
+                self.hash_index.load()
+        st = os.stat(path)
+        digest = self.hash_index.lookup(path, st, count=False, algorithm=algorithm)
+        if digest is None:
+            digest = hash_file(path, algorithm, st.st_size)
+            self.hash_index.store(path, digest, st, algorithm)
+        return digest
+
+    def resolve(self, rel):
+        folder, _, file_rel = rel.partition("/")
+        manifest = self.manifest(folder) if file_rel else None
+        expected = manifest.get(file_rel) if manifest is not None else None
+        if not expected:
+            return None
+        base = os.path.abspath(resolve_local_folder(self.mc_version_path, folder)[0])
+        path = os.path.abspath(os.path.join(base, file_rel.replace("/", os.sep)))
+        if path.startswith(base + os.sep) and os.path.isfile(path):
+            try:
+                if self.local_hash(path, manifest.algorithm) == expected:
+                    return self.verified(path, expected)
+            except OSError:
+                pass
+        if self.store is not None and self.store.contains(manifest.algorithm, expected) \
+                and self.store.verify(manifest.algorithm, expected):
+            return self.verified(self.store.object_path(manifest.algorithm, expected), expected)
+        return None
+
+    def verified(self, path, digest):
+        st = os.stat(path)
+        with self._peer_lock:
+            self._verified[path] = (st.st_size, st.st_mtime_ns, digest)
+        return path
+
+    def verified_digest(self, path):
+        """resolve() 驗證過且之後未變更的檔案回傳其清單雜湊，否則回傳 None。"""
+        with self._peer_lock:
+            entry = self._verified.get(path)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return entry[2] if (st.st_size, st.st_mtime_ns) == entry[:2] else None
+
+
+class PeerRequestHandler(ModRequestHandler):
+    def send_file(self, path, etag=None):
+        # 以清單中已驗證的雜湊作為 ETag，不必為了 ETag 再讀一次整個檔案計算 md5
+        digest = self.app.verified_digest(path)
+        super().send_file(path, etag or (f'"{digest}"' if digest else None))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="區網快取：分享版本資料夾中已驗證的檔案")
+    parser.add_argument("mc_version_path", help="已同步完成的 Minecraft 版本資料夾")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PEER_PORT)
+    parser.add_argument("--link-bandwidth", type=float, default=None, help="所有連線合計的上傳上限（bytes/s）")
+    parser.add_argument("--no-store", action="store_true", help="不由共用檔案庫提供檔案")
+    args = parser.parse_args(argv)
+    store = None
+    if not args.no_store:
+        from ContentStore import ContentStore
+        try:
+            store = ContentStore()
+        except OSError:
+            store = None
+    server = PeerServer(args.mc_version_path, args.host, args.port, store=store,
+                        link_bandwidth=args.link_bandwidth).start()
+    print(f"🏠 區網快取 {server.mc_version_path} 於 {server.url}（其他玩家以 --peers {server.url} 使用）", flush=True)
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import threading
+import concurrent.futures
+from types import SimpleNamespace
+
+from SyncEngine import SyncEngine
+from TreeDiff import TreeDiff
+
+# -------------------------
+# 啟動時的預先抓取
+# -------------------------
+# 視窗與 Splash 顯示期間就在背景取得資料夾列表、各資料夾清單並計算本地已存在檔案的雜湊，
+# 按下「開始同步」（或 --auto）時 SyncEngine 直接沿用結果，沒有變更時幾乎不必再等待。
+
+
+def fetch_update_info(session, server_url, timeout=10):
+    """取得伺服器公布的最新客戶端版本 {"version", "note"}，失敗時回傳例外物件（在背景執行緒呼叫）。"""
+    try:
+        r = session.get(f"{server_url}/clientupdate/version.txt", timeout=timeout)
+        if r.status_code != 200:
+            return RuntimeError(f"HTTP {r.status_code}")
+        return json.loads(r.text)
+    except Exception as e:
+        return e
+
+
+class Prefetch:
+    """
+    在背景執行緒預先完成同步的前置工作：資料夾列表、各資料夾清單（同時抓取）與本地檔案的雜湊索引。
+    result() 等待完成後回傳 SimpleNamespace(folder_names, manifests, hash_index)；
+    伺服器或路徑不同、抓取失敗或結果超過 MAX_AGE 秒時回傳 None，由同步流程重新抓取。
+    """
+
+    MAX_AGE = 120
+
+    def __init__(self, server_url, mc_version_path, session=None):
+        self.server_url = server_url
+        self.mc_version_path = os.path.abspath(mc_version_path)
+        self.session = session
+        self._done = threading.Event()
+        self._result = None
+        self._finished_at = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def _run(self):
+        try:
+            self._result = self._prefetch()
+        except Exception:
+            self._result = None
+        finally:
+            self._finished_at = time.monotonic()
+            self._done.set()
+
+    def _prefetch(self):
+        # 不啟動事件通道的引擎：只借用清單抓取、Merkle 比對與雜湊索引，log 不會輸出
+        engine = SyncEngine(self.server_url, self.mc_version_path, session=self.session)
+        folder_names = engine.fetch_folder_names()
+        if folder_names is None:
+            return None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(8, len(folder_names)))) as executor:
+            manifests = dict(zip(folder_names, executor.map(engine.fetch_manifest, folder_names)))
+
+        # 預先計算本地已存在檔案的雜湊，同步時比對只需查詢索引
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, max(2, os.cpu_count() or 2))) as executor:
+            for folder, manifest in manifests.items():
+                if manifest is None:
+                    continue
+                folder_base, _ = engine.resolve_folder(folder)
+                diff = TreeDiff.scan(manifest, folder_base)
+                for rel in diff.common:
+                    executor.submit(engine.get_hash, os.path.join(folder_base, rel.replace("/", os.sep)),
+                                    diff.stat(rel), manifest.algorithm)
+        try:
+            engine.hash_index.save()
+        except OSError:
+            pass
+        return SimpleNamespace(folder_names=folder_names,
+                               manifests={f: m for f, m in manifests.items() if m is not None},
+                               hash_index=engine.hash_index)
+
+    def matches(self, server_url, mc_version_path):
+        return server_url == self.server_url and os.path.abspath(mc_version_path) == self.mc_version_path
+
+    def result(self, server_url, mc_version_path, cancelled=None):
+        """等待預先抓取完成並回傳可沿用的結果；cancelled 為選用的函式，回傳 True 時放棄等待。"""
+        if not self.matches(server_url, mc_version_path):
+            return None
+        while not self._done.wait(0.2):
+            if cancelled is not None and cancelled():
+                return None
+        if self._result is None or time.monotonic() - self._finished_at > self.MAX_AGE:
+            return None
+        return self._result
@@ -0,0 +1,195 @@
+import os
+import sys
+import subprocess
+from types import SimpleNamespace
+from urllib.parse import quote
+
+from SyncEngine import SyncEngine
+from TreeDiff import TreeDiff
+from HashIndex import INDEX_DIR_NAME
+
+# -------------------------
+# 背景預先下載（--watch）
+# -------------------------
+# 定期以 Merkle 摘要低成本地檢查伺服器是否更新，把需要更新的檔案先下載到共用檔案庫，
+# 不動到版本資料夾；遊戲未執行時（或下次 --auto / --headless 同步時）再套用，
+# 套用時檔案全部由檔案庫以暫存檔 + 原子改名取得，幾乎不需等待網路。
+
+DEFAULT_WATCH_INTERVAL = 10 * 60
+# 有已暫存但尚未套用的更新時，檢查遊戲是否已關閉的間隔
+APPLY_CHECK_INTERVAL = 60
+
+
+class Stager:
+    """
+    poll() 抓取最新清單並與版本資料夾比對，需要更新且檔案庫尚未有的檔案逐一下載到
+    <mc_version_path>/.modsync/staging/ 後放入檔案庫（暫存檔保留以便下次續傳）。
+    比對規則與同步相同（僅新增設定檔模式下已存在的 config 不列入），回傳
+    SimpleNamespace(changed, extra, staged, failed, pending)：pending 為 True 表示有尚未套用的更新。
+    """
+
+    def __init__(self, server_url, mc_version_path, store, session=None, listener=None, mirrors=(), peers=()):
+        self.server_url = server_url
+        self.mc_version_path = mc_version_path
+        self.store = store
+        self.session = session
+        self.listener = listener
+        self.mirrors = mirrors
+        self.peers = peers
+        self.only_add_config = False
+        self.max_rate = None
+        self.staging_dir = os.path.join(os.path.abspath(mc_version_path), INDEX_DIR_NAME, "staging")
+        self.engine = None
+        self._stopped = False
+
+    def poll(self):
+        engine = SyncEngine(self.server_url, self.mc_version_path, session=self.session, listener=self.listener,
+                            store=self.store, mirrors=self.mirrors, peers=self.peers)
+        engine.only_add_config = self.only_add_config
+        engine.set_bandwidth_limit(self.max_rate)
+        engine.reset_run_state()
+        self.engine = engine
+        engine.events.start()
+        try:
+            return self._stage(engine)
+        finally:
+            try:
+                engine.hash_index.save()
+                self.store.save()
+            except OSError as e:
+                engine.log(f"⚠ 無法寫入雜湊索引: {e}")
+            engine.events.close()
+            self.engine = None
+
+    def stop(self):
+        self._stopped = True
+        if self.engine is not None:
+            self.engine.stop()
+
+    def _stage(self, engine):
+        folder_names = engine.fetch_folder_names()
+        if folder_names is None:
+            return None
+        changed = 0
+        extra = 0
+        missing = []
+        for folder in folder_names:
+            manifest = engine.fetch_manifest(folder)
+            if manifest is None:
+                continue
+            folder_base, strict_sync = engine.resolve_folder(folder)
+            diff = TreeDiff.scan(manifest, folder_base)
+            candidates = list(diff.added)
+            for rel in diff.common:
+                local_abs = os.path.join(folder_base, rel.replace("/", os.sep))
+                if engine.only_add_config and engine.is_under_config(local_abs):
+                    continue
+                if engine.get_hash(local_abs, diff.stat(rel), manifest.algorithm) != manifest.get(rel):
+                    candidates.append(rel)
+            is_config_base = os.path.basename(os.path.normpath(folder_base)).lower() == "config"
+            if strict_sync and not (engine.only_add_config and is_config_base):
+                extra += len(diff.extra)
+            changed += len(candidates)
+            for rel in candidates:
+                if manifest.get(rel) and not engine.in_store(manifest, rel):
+                    missing.append((folder, rel, manifest))
+
+        staged = failed = 0
+        if missing:
+            # 與同步相同，下載前加入伺服器公布的鏡像站並量測延遲；沒有需要下載的檔案時不必探測
+            engine.prepare_mirrors()
+            engine.log(f"📥 {len(missing)} 個檔案需要預先下載")
+            for folder, rel, manifest in missing:
+                engine.progress.expect(f"{folder}/{rel}", manifest.size(rel) or 0)
+        for folder, rel, manifest in missing:
+            if self._stopped:
+                break
+            staging_base = os.path.join(self.staging_dir, quote(str(folder), safe=""))
+            ok = engine.download_file(rel, folder, staging_base)
+            if ok:
+                staged_path = os.path.join(staging_base, rel.replace("/", os.sep))
+                engine.add_to_store(manifest.algorithm, manifest.get(rel), staged_path)
+                ok = engine.in_store(manifest, rel)
+                try:
+                    os.remove(staged_path)
+                except OSError:
+                    pass
+            engine.finish_download(folder, rel, ok)
+            if ok:
+                staged += 1
+            else:
+                failed += 1
+        if changed or extra:
+            engine.log(f"🗂 {changed} 個檔案需要更新、{extra} 個多餘檔案，已預先下載 {staged} 個"
+                       + (f"，{failed} 個失敗" if failed else ""))
+        return SimpleNamespace(changed=changed, extra=extra, staged=staged, failed=failed,
+                               pending=bool(changed or extra))
+
+
+def lower_priority():
+    """降低本程序的 CPU 排程優先順序，背景下載不影響遊戲與其他程式。"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), 0x4000)  # BELOW_NORMAL_PRIORITY_CLASS
+        elif hasattr(os, "nice"):
+            os.nice(10)
+    except (OSError, AttributeError):
+        pass
+
+
+def iter_command_lines():
+    """回傳目前所有程序的 (pid, 命令列)；無法取得時拋出 OSError 或 subprocess.SubprocessError。"""
+    if sys.platform == "win32":
+        script = ("[Console]::OutputEncoding=[Text.Encoding]::UTF8; Get-CimInstance Win32_Process | "
+                  "ForEach-Object { \"$($_.ProcessId) $($_.CommandLine)\" }")
+        out = subprocess.run(["powershell", "-NoProfile", "-Command", script], capture_output=True, check=True,
+                             encoding="utf-8", errors="replace", timeout=30,
+                             creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)).stdout
+    elif os.path.isdir("/proc"):
+        result = []
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{name}/cmdline", "rb") as f:
+                    cmdline = f.read().replace(b"\0", b" ").decode("utf-8", "replace")
+            except OSError:
+                continue
+            result.append((int(name), cmdline))
+        return result
+    else:
+        out = subprocess.run(["ps", "-axo", "pid=,command="], capture_output=True, check=True,
+                             encoding="utf-8", errors="replace", timeout=30).stdout
+    result = []
+    for line in out.splitlines():
+        pid, _, cmdline = line.strip().partition(" ")
+        if pid.isdigit():
+            result.append((int(pid), cmdline))
+    return result
+
+
+def game_running(mc_version_path):
+    """
+    判斷是否有遊戲正在使用此版本資料夾：啟動器啟動遊戲時，命令列的 --gameDir 或 classpath
+    一定包含版本資料夾路徑。無法取得程序列表時視為執行中，留待下次同步再套用。
+    """
+    needle = os.path.normcase(os.path.abspath(mc_version_path)).rstrip("\\/")
+    own = {os.getpid(), os.getppid()}
+    try:
+        processes = iter_command_lines()
+    except (OSError, subprocess.SubprocessError):
+        return True
+    return any(pid not in own and _mentions(os.path.normcase(cmdline), needle) for pid, cmdline in processes)
+
+
+def _mentions(cmdline, path):
+    """命令列中是否出現完整的 path（之後緊接路徑分隔、引號、空白或結尾，避免 1.20.1 誤判為 1.20.1-Forge）。"""
+    start = cmdline.find(path)
+    while start >= 0:
+        end = start + len(path)
+        if end == len(cmdline) or cmdline[end] in "\\/ \"';:":
+            return True
+        start = cmdline.find(path, start + 1)
+    return False
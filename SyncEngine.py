@@ -0,0 +1,1577 @@
+import os
+import shutil
+import asyncio
+import heapq
+import queue
+import time
+import itertools
+import contextlib
+import concurrent.futures
+import threading
+from collections import deque
+from urllib.parse import quote
+
+from requests import RequestException
+
+from HashIndex import HashIndex, INDEX_DIR_NAME
+from HashEngine import (ALGORITHM_HEADER, DEFAULT_ALGORITHM, PREFERRED_ALGORITHMS, hash_file, is_supported,
+                        new_hasher)
+from HttpSession import create_session
+from PartialDownload import PartialDownload, parse_content_range_start, is_partial_name
+from ManifestIndex import ManifestIndex
+from ManifestCache import ManifestCache
+from MerkleTree import compute_dir_digests, subtree_root
+from TaskGroup import TaskGroup
+from EventChannel import EventChannel
+from TreeDiff import TreeDiff, scan_local_tree
+from ZipStream import ZipStreamReader, ZipStreamError
+from SyncPlanner import SyncPlanner, TransferModel, STRATEGY_BULK, STRATEGY_BATCH, format_size
+from BatchQueue import BatchQueue, BATCH_FILE_LIMIT
+from FlowControl import AdaptiveLimiter, TokenBucket, MAX_CONCURRENCY
+from SyncStats import SyncStats, save_report
+from TransferProgress import TransferProgress
+from MirrorPool import MirrorPool, SEGMENT_THRESHOLD, SEGMENT_SIZE, MAX_SEGMENT_WORKERS
+from AsyncTransfer import AsyncRunner, AsyncHttpError, ASYNC_MAX_CONCURRENCY
+from ContentStore import link_or_copy, should_link
+
+# 逐檔下載的執行方式：執行緒池（預設）或事件迴圈
+TRANSFER_THREADS = "threads"
+TRANSFER_ASYNC = "async"
+
+# Merkle 摘要比對最多抓取的有變更目錄數，超過時一次抓完整清單較快；同一層的子目錄以 MERKLE_WORKERS 個連線同時抓取
+MERKLE_FETCH_LIMIT = 16
+MERKLE_WORKERS = 8
+# 事件迴圈下載時累積到此大小才交給執行緒寫入暫存檔
+ASYNC_WRITE_SIZE = 1024 * 1024
+
+
+def resolve_local_folder(mc_version_path, folder):
+    """回傳伺服器資料夾對應的 (本地路徑, 是否嚴格同步)。"""
+    # 🟢 特殊規則處理（已更新）
+    # 伺服器 "mods"  -> 客戶端 <mc_version_path>/mods/servermods   (嚴格同步)
+    # 伺服器 "clientmods" -> 客戶端 <mc_version_path>/mods/clientmods (非嚴格)
+    # 伺服器 "needsmods" -> 客戶端 <mc_version_path>/mods            (非嚴格)
+    folder_lower = str(folder).lower()
+    if folder_lower == "mods":
+        return os.path.join(mc_version_path, "mods", "servermods"), True
+    elif folder_lower == "clientmods":
+        return os.path.join(mc_version_path, "mods"), False
+    elif folder_lower == "needmods":
+        return os.path.join(mc_version_path, "mods", "clientmods"), True
+    return os.path.join(mc_version_path, folder), False
+
+
+# -------------------------
+# 單一檔案的逐檔下載（執行緒與事件迴圈共用）
+# -------------------------
+class _FileDownload:
+    """
+    逐檔下載中與傳輸方式無關的步驟：選擇來源、準備續傳暫存檔、檢查回應、記錄流量、驗證雜湊後改名。
+    download_file 與 download_file_async 只各自負責送出請求與逐塊讀取本文，每次嘗試的流程為
+    begin() -> accept() -> open_part() 寫入並更新 downloaded -> end_body() -> verify_and_commit()，
+    結束時（含 continue 與例外）一律呼叫 release() 歸還來源。
+    續傳部分的雜湊、暫存檔寫入與改名集中在 open_part()、write() 與 verify_and_commit()，事件迴圈下載時交給執行緒執行。
+    """
+
+    def __init__(self, engine, folder, file_path, local_base):
+        self.engine = engine
+        self.folder = folder
+        self.file_path = file_path
+        self.key = f"{folder}/{file_path}"
+        self.local_path = os.path.join(local_base, file_path.replace("/", os.sep))
+        manifest = engine.manifests.get(folder)
+        self.expected_hash = manifest.get(file_path) if manifest is not None else None
+        self.algorithm = manifest.algorithm if manifest is not None else DEFAULT_ALGORITHM
+        self.size = manifest.size(file_path) if manifest is not None else None
+        # 先寫入 .part 暫存檔，雜湊與清單一致後才改名為正式檔案；中斷時保留暫存檔以便續傳
+        self.partial = PartialDownload(self.local_path, self.expected_hash)
+        os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
+        self.tried = []
+        self.mirror = None
+
+    def attempts(self, max_retries):
+        # 每次重試改用尚未失敗過的來源；有多個鏡像站時多給每個來源一次機會
+        return max_retries + len(self.engine.mirrors) - 1
+
+    def begin(self, attempt):
+        """選擇來源並回傳 (網址, 續傳用的請求標頭)。"""
+        engine = self.engine
+        if attempt:
+            engine.stats.add("retries", 1, self.folder)
+        self.mirror = engine.mirrors.acquire(exclude=self.tried)
+        self.mirror_ok = False
+        self.missing = False
+        self.server_error = False
+        self.latency = None
+        self.received = 0
+        self.request_start = time.time()
+        self.offset, etag = self.partial.resume_offset()
+        source = "" if self.mirror.primary else f"，來源 {self.mirror.url}"
+        if self.offset:
+            engine.stats.add("resumed_bytes", self.offset, self.folder)
+            engine.log(f"⏯ 續傳 {self.key}，已完成 {self.offset} bytes (嘗試 {attempt+1}{source})")
+        else:
+            engine.log(f"⬇ 開始下載 {self.key} (嘗試 {attempt+1}{source})")
+        url = f"{self.mirror.url}/{self.folder}/{quote(self.file_path)}?download=1"
+        return url, self.partial.range_headers(self.offset, etag)
+
+    def accept(self, status, headers):
+        """
+        檢查回應狀態，可以開始接收本文時回傳已含續傳部分的雜湊物件，否則回傳 None（改試下一次）。
+        headers 以小寫名稱查詢（requests 的標頭不分大小寫，事件迴圈客戶端一律為小寫）。
+        """
+        engine = self.engine
+        if status == 416:
+            # 暫存檔與伺服器檔案不符，清除後從頭下載
+            self.mirror_ok = True
+            self.partial.discard()
+            return None
+        if status == 404 and not self.mirror.primary:
+            # 區網快取或鏡像站沒有此檔案（例如尚未同步到），改用其他來源，不視為來源故障
+            self.missing = True
+            return None
+        if status not in (200, 206):
+            if status == 429 or status >= 500:
+                self.server_error = True
+                engine.note_server_error(self.folder)
+            engine.log(f"❌ HTTP {status} {self.key}")
+            return None
+        if not (status == 206 and self.offset
+                and parse_content_range_start(headers.get("content-range")) == self.offset):
+            # 伺服器未接受 Range（或檔案已變更），改為完整下載
+            self.offset = 0
+        self.body_start = time.time()
+        self.latency = self.body_start - self.request_start
+        engine.transfer_model.record_request(self.latency)
+        total_size = self.offset + int(headers.get("content-length", 0))
+        self.etag = headers.get("etag")
+        self.total_size = total_size or None
+        self.downloaded = self.offset
+        engine.progress.start(self.key, total_size, self.offset)
+        return new_hasher(self.algorithm)
+
+    def open_part(self, hasher):
+        """記錄續傳資訊並開啟暫存檔；續傳時先以已下載的部分更新 hasher，之後的內容直接覆寫。"""
+        if self.offset:
+            self.partial.seed_hash(hasher, self.offset)
+        self.partial.begin(self.etag, self.total_size)
+        f = open(self.partial.part_path, "r+b" if self.offset else "wb")
+        f.seek(self.offset)
+        f.truncate()
+        return f
+
+    @staticmethod
+    def write(f, hasher, data):
+        # 邊下載邊計算雜湊，省去下載後再讀一次檔案
+        f.write(data)
+        hasher.update(data)
+
+    def end_body(self):
+        """本文接收結束（含中途停止），計入下載流量並回傳本次收到的位元組數。"""
+        self.received = self.downloaded - self.offset
+        self.engine.add_downloaded_bytes(self.received, self.folder)
+        return self.received
+
+    def verify_and_commit(self, hasher):
+        """雜湊與清單一致時改名為正式檔案並回傳 True；不一致時清除暫存檔，下一次改用其他來源。"""
+        engine = self.engine
+        engine.transfer_model.record_stream(self.received, time.time() - self.body_start)
+        digest = hasher.hexdigest()
+        if self.expected_hash and digest != self.expected_hash:
+            # 鏡像站的檔案可能尚未更新，下一次改用其他來源
+            engine.log(f"⚠ 下載後 {self.algorithm.upper()} 不同，重新下載 {self.key}")
+            self.partial.discard()
+            return False
+        self.mirror_ok = True
+        self.partial.commit()
+        engine.hash_index.store(self.local_path, digest, algorithm=self.algorithm)
+        engine.log(f"✅ 下載完成 {self.key}")
+        return True
+
+    def fail(self, error, server_error):
+        if server_error:
+            self.server_error = True
+            self.engine.note_server_error(self.folder)
+        self.engine.log(f"❌ 下載錯誤 {self.key}: {error}")
+
+    def release(self):
+        self.engine.mirrors.release(self.mirror, self.received, time.time() - self.request_start, self.mirror_ok,
+                                    self.latency, self.missing)
+        if not self.mirror_ok:
+            self.tried.append(self.mirror)
+
+    def sources_exhausted(self):
+        """所有可用來源都已失敗過時回傳 True，呼叫端應稍候再試。"""
+        return all(m in self.tried for m in self.engine.mirrors.healthy())
+
+    def give_up(self):
+        self.engine.log(f"❌ 最終下載失敗 {self.key}")
+        return False
+
+
+# -------------------------
+# 同步引擎（不依賴 Qt）
+# -------------------------
+class SyncEngine:
+    """
+    完整的同步流程，不依賴 Qt，可直接由命令列或其他程式呼叫。
+    進度以批次回呼 listener(lines, progress) 通知：lines 為 log 行的 list，
+    progress 可能包含 "total"（需下載檔案數）、"completed"（已完成數）、
+    "bytes"（TransferProgress 快照：已完成/總位元組、速度、剩餘時間與每個進行中的傳輸），
+    live_stats 為 True 時另附 "stats"（SyncStats 快照）。
+    也可使用 iter_events() 在背景執行同步並以迭代方式取得相同的批次。
+    transfer 為 TRANSFER_ASYNC 時逐檔下載改在事件迴圈上進行（可同時進行數百個下載），其餘工作仍使用執行緒池。
+    peers 為區網快取（PeerServer）網址，與鏡像站相同但優先使用。
+    prefetch 為啟動時開始的 Prefetch，run() 會等待並沿用其資料夾列表、清單與雜湊索引（只使用一次）。
+    每次 run() 結束後，統計報告存於 self.report 並寫入 .modsync/sync_report.json。
+    """
+
+    def __init__(self, server_url, mc_version_path, session=None, listener=None, store=None, mirrors=(),
+                 transfer=TRANSFER_THREADS, prefetch=None, peers=()):
+        self.server_url = server_url
+        self.mc_version_path = mc_version_path
+        os.makedirs(self.mc_version_path, exist_ok=True)
+        # 未暫停時為 set；暫停時所有下載在下一塊資料前等待，不再輪詢
+        self._running = threading.Event()
+        self._running.set()
+        self._stop_flag = False
+        self.transfer = transfer
+        self.async_runner = None
+        self.prefetch = prefetch
+        self.prefetched = None
+        # 新增：是否僅同步新增的 config 檔（存在則不覆蓋、不刪除）
+        self.only_add_config = False
+        # 所有 log 與進度先寫入事件通道，再以固定頻率合併後通知 listener
+        self.listener = listener
+        self.events = EventChannel(self.flush_events, poll=self.poll_progress)
+        self.progress = TransferProgress()
+        self._polled_bytes = 0
+        self.failed_files = 0
+        self.errors = 0
+        # 本地雜湊索引：未變動的檔案不必重新計算雜湊
+        self.hash_index = HashIndex(self.mc_version_path)
+        # 即將被覆蓋、但內容是其他位置需要的檔案先移到這裡，同步結束後清除
+        self.reuse_dir = os.path.join(os.path.abspath(self.mc_version_path), INDEX_DIR_NAME, "reuse")
+        # 多個版本資料夾共用的檔案庫（ContentStore），None 表示不使用
+        self.store = store
+        # 依偏好順序告知伺服器本地支援的雜湊演算法，實際使用的演算法由伺服器於清單回應中宣告
+        self.hash_algorithms = PREFERRED_ALGORITHMS
+        # 實測的延遲與頻寬，供同步規劃估算整包/逐檔的成本
+        self.transfer_model = TransferModel(self.mc_version_path)
+        # 每個伺服器資料夾的攤平檔案清單，於 run() 中各抓取一次後共用
+        self.manifests = {}
+        # 上次同步的清單紀錄，配合伺服器的 Merkle 摘要略過未變更的子目錄
+        self.manifest_cache = ManifestCache(self.mc_version_path)
+        # 執行緒池大小即同時下載數的上限；實際並行數由 AdaptiveLimiter 依實測結果調整
+        self.max_workers = MAX_CONCURRENCY
+        self.limiter = AdaptiveLimiter(round(self.transfer_model["concurrency"]), maximum=self.max_concurrency)
+        # 全域頻寬上限（bytes/s），None 為不限制，可於同步途中以 set_bandwidth_limit 調整
+        self.bandwidth = TokenBucket(None)
+        # 雜湊計算受磁碟與 CPU 限制，同時計算的檔案數不超過核心數
+        self.hash_slots = threading.BoundedSemaphore(min(8, max(2, os.cpu_count() or 2)))
+        self._transfer = threading.local()
+        # 伺服器是否支援 POST ?batch=1；第一次被拒絕後即改回逐檔下載
+        self.batch_supported = True
+        # 各階段耗時與計數，每次 run() 重新開始統計
+        self.stats = SyncStats()
+        self.live_stats = False
+        self.report = None
+        # 檔案下載的來源：主伺服器、鏡像站與區網快取（清單一律由主伺服器取得）
+        self.mirrors = MirrorPool(server_url, mirrors, peers)
+        # 共用 keep-alive 連線池，所有清單抓取與下載都經由此 session
+        self.session = session or create_session(pool_size=self.max_workers, pool_hosts=8)
+
+    def is_under_config(self, local_abs):
+        """
+        判斷一個絕對路徑是否位於名為 'config' 的目錄下（任何層級，只要 segment 為 'config' 即認定）。
+        這樣可以區分真正的 config 資料夾，而不會僅以字串包含進行判斷。
+        """
+        parts = [p.lower() for p in os.path.normpath(local_abs).split(os.sep)]
+        return 'config' in parts
+
+    @property
+    def max_concurrency(self):
+        """同時下載數的上限：執行緒池模式受限於執行緒數，事件迴圈模式可以高得多。"""
+        return ASYNC_MAX_CONCURRENCY if self.transfer == TRANSFER_ASYNC else self.max_workers
+
+    def run(self):
+        self.stats = SyncStats()
+        self.events.start()
+        self.take_prefetch()
+        self.hash_index.hits = self.hash_index.misses = 0
+        if self.transfer == TRANSFER_ASYNC:
+            self.async_runner = AsyncRunner()
+            if not self._running.is_set():
+                self.async_runner.pause()
+        try:
+            self.sync()
+        finally:
+            if self.async_runner is not None:
+                self.async_runner.close()
+                self.async_runner = None
+            try:
+                self.hash_index.save()
+                self.transfer_model.save()
+                if self.store is not None:
+                    self.store.save()
+            except Exception as e:
+                self.log(f"⚠ 無法寫入雜湊索引: {e}")
+            self.write_report()
+            self.events.close()
+
+    def take_prefetch(self):
+        """等待啟動時的預先抓取完成；伺服器與路徑相同且未過期時沿用其結果。"""
+        prefetch, self.prefetch = self.prefetch, None
+        self.prefetched = None
+        if prefetch is None:
+            return
+        if not prefetch.done:
+            self.log("⏳ 等待啟動時開始的清單抓取與本地檢查完成...")
+        result = prefetch.result(self.server_url, self.mc_version_path, cancelled=lambda: self._stop_flag)
+        if result is None:
+            return
+        self.prefetched = result
+        self.hash_index = result.hash_index
+        self.log(f"⚡ 沿用啟動時預先取得的 {len(result.manifests)} 個資料夾清單與本地雜湊")
+
+    def write_report(self):
+        self.stats.finish()
+        self.stats.add("hash_cache_hits", self.hash_index.hits)
+        self.stats.add("hash_cache_misses", self.hash_index.misses)
+        self.report = self.stats.report(server_url=self.server_url, mc_version_path=self.mc_version_path,
+                                        ok=self.ok, errors=self.errors, failed_files=self.failed_files,
+                                        concurrency=self.limiter.snapshot(), mirrors=self.mirrors.snapshot())
+        self.log(f"⏱ {self.stats.summary()}")
+        try:
+            path = save_report(self.mc_version_path, self.report)
+            self.log(f"📊 同步報告已寫入 {path}")
+        except OSError as e:
+            self.log(f"⚠ 無法寫入同步報告: {e}")
+
+    def log(self, text):
+        self.events.log(text)
+
+    def error(self, text):
+        """記錄一個會讓本次同步視為失敗的錯誤。"""
+        self.errors += 1
+        self.log(text)
+
+    @property
+    def ok(self):
+        return self.errors == 0 and self.failed_files == 0
+
+    def flush_events(self, lines, progress):
+        if self.live_stats:
+            progress = dict(progress, stats=self.stats.snapshot())
+        if self.listener is not None:
+            self.listener(lines, progress)
+
+    def iter_events(self):
+        """於背景執行緒執行同步，逐一產生 (lines, progress) 批次，同步結束後停止。"""
+        events = queue.Queue()
+        previous = self.listener
+        self.listener = lambda lines, progress: events.put((lines, progress))
+        thread = threading.Thread(target=lambda: (self.run(), events.put(None)), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = events.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            thread.join()
+            self.listener = previous
+
+    def sync(self):
+        if self.prefetched is not None:
+            folder_names = self.prefetched.folder_names
+            self.log(f"✅ 取得資料夾列表: {folder_names}")
+        else:
+            folder_names = self.fetch_folder_names()
+        if folder_names is None:
+            return
+
+        self.reset_run_state()
+
+        # 單一有界執行緒池：所有資料夾清單同時抓取，掃描到差異的檔案立即排入下載
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self.tasks = TaskGroup(executor)
+            # 鏡像站的探測與清單抓取同時進行，完成前的下載先由主伺服器提供
+            self.tasks.submit(self.prepare_mirrors)
+            # 本地目錄樹的走訪不需要清單，與清單抓取同時進行；下載時可由此找出搬移或改名到其他位置的相同檔案
+            self.local_scans = {folder: executor.submit(scan_local_tree, self.resolve_folder(folder)[0])
+                                for folder in folder_names}
+            for folder in folder_names:
+                self.tasks.submit(self.sync_folder, folder)
+            self.tasks.wait()
+            # 多餘檔案在所有下載完成後才刪除，下載途中仍可作為沿用的來源
+            for args in self.pending_deletes:
+                self.tasks.submit(self.delete_extra_files, *args)
+            self.tasks.wait()
+        self.clear_reuse_dir()
+
+        for error in self.tasks.errors:
+            self.error(f"❌ 同步工作發生錯誤: {error}")
+
+        for folder, count in self.folder_downloads.items():
+            if count:
+                self.log(f"{folder}: 已處理 {count} 個需要下載的檔案")
+            else:
+                self.log(f"{folder}: 所有檔案完整")
+            if folder in self.folder_plans:
+                plan, started = self.folder_plans[folder]
+                actual = self.folder_done_at.get(folder, started) - started
+                self.log(f"📐 {folder}: 預估 {plan.estimate:.1f}s，實際 {actual:.1f}s")
+
+        # 以本次整體下載速度與最後的並行數修正傳輸模型，下次同步由此開始調整
+        if self.download_started_at is not None:
+            self.transfer_model.record_link(self.bytes_downloaded, time.time() - self.download_started_at)
+            limiter = self.limiter.snapshot()
+            self.transfer_model.record("concurrency", limiter["limit"])
+            self.log(f"⚙ 並行下載數：最終 {limiter['limit']}，最高 {limiter['peak']}，伺服器錯誤 {limiter['errors']} 次")
+            if len(self.mirrors) > 1:
+                for mirror in self.mirrors.snapshot():
+                    role = "（區網快取）" if mirror["peer"] else ""
+                    self.log(f"🪞 {mirror['url']}{role}: 下載 {format_size(mirror['bytes'])}，失敗 {mirror['failures']} 次")
+
+        if self.total_tasks == 0:
+            self.log("🎉 所有檔案已完整")
+
+    def reset_run_state(self):
+        """重設每次同步的計數、並行控制、整體進度與下載佇列。"""
+        self.total_tasks = 0
+        self.completed = 0
+        self.folder_downloads = {}
+        self.folder_plans = {}
+        self.folder_done_at = {}
+        self.bytes_downloaded = 0
+        self.download_started_at = None
+        self.folder_batches = {}
+        self.local_scans = {}
+        self._local_by_size = None
+        self.stashed = {}
+        self._reuse_lock = threading.Lock()
+        self.pending_deletes = []
+        self._count_lock = threading.Lock()
+        self.limiter = AdaptiveLimiter(round(self.transfer_model["concurrency"]), maximum=self.max_concurrency)
+        self.progress = TransferProgress()
+        self._polled_bytes = 0
+        # 等待開始的下載以位元組數排序（大檔案優先），避免最後只剩一個大檔案單獨下載
+        self.download_queue = []
+        self._download_seq = itertools.count()
+        self._dispatch_lock = threading.Lock()
+        self._pump_scheduled = False
+        self.planner = SyncPlanner(self.transfer_model, int(self.limiter.limit))
+
+    def fetch_folder_names(self):
+        self.log(f"開始連線伺服器: {self.server_url}/config_names?json=1")
+        try:
+            resp = self.session.get(f"{self.server_url}/config_names?json=1", timeout=10)
+            if resp.status_code != 200:
+                self.error(f"❌ 伺服器回傳錯誤代碼: {resp.status_code}")
+                return None
+            folder_names = resp.json()
+            self.log(f"✅ 取得資料夾列表: {folder_names}")
+            return folder_names
+        except Exception as e:
+            self.error(f"❌ 無法連線伺服器: {e}")
+            return None
+
+    def prepare_mirrors(self):
+        """加入伺服器公布的鏡像站（/mirrors?json=1，不支援時略過）；有多個來源時量測延遲並排序。"""
+        try:
+            r = self.session.get(f"{self.server_url}/mirrors?json=1", timeout=5)
+            if r.status_code == 200:
+                for url in r.json():
+                    if isinstance(url, str):
+                        self.mirrors.add(url)
+        except (RequestException, ValueError):
+            pass
+        if len(self.mirrors) > 1:
+            ranked = self.mirrors.probe(self.session)
+            available = self.mirrors.healthy()
+            self.log("🪞 下載來源（依延遲排序）: " + "、".join(m.describe() for m in ranked if m in available))
+            for mirror in ranked:
+                if mirror not in available:
+                    self.log(f"⚠ 無法連線鏡像站 {mirror.url}，本次同步不使用")
+
+    def resolve_folder(self, folder):
+        """回傳伺服器資料夾對應的 (本地路徑, 是否嚴格同步)。"""
+        return resolve_local_folder(self.mc_version_path, folder)
+
+    def sync_folder(self, folder):
+        folder_base, strict_sync = self.resolve_folder(folder)
+        with self._count_lock:
+            self.folder_downloads[folder] = 0
+
+        os.makedirs(folder_base, exist_ok=True)
+        self.log(f"\n🔍 檢查伺服端資料夾: {folder} -> 本地: {folder_base}")
+
+        # 如果為 config 並且啟用了 only_add_config，顯示提示
+        if str(folder).lower() == "config" and self.only_add_config:
+            self.log("⚙ 已啟用『僅同步新增設定檔』模式，對於已存在的檔案不會覆蓋或刪除，只會補上缺失檔案。")
+
+        # 取得伺服器該資料夾的檔案清單（僅抓取一次，後續階段共用）
+        with self.stats.phase("manifest", folder):
+            manifest = self.prefetched.manifests.get(folder) if self.prefetched is not None else None
+            if manifest is not None:
+                self.manifests[folder] = manifest
+            else:
+                manifest = self.fetch_manifest(folder)
+        if manifest is None:
+            return
+        self.log(f"✅ {folder} 伺服器檔案列表取得成功")
+
+        for local_rel in manifest.dirs:
+            os.makedirs(os.path.join(folder_base, local_rel.replace("/", os.sep)), exist_ok=True)
+
+        # 以同步開始時走訪的本地目錄樹比對，依預估的傳輸成本決定整包或逐檔下載
+        with self.stats.phase("scan", folder):
+            diff = TreeDiff(manifest, self.local_scans[folder].result())
+            keep_existing = self.only_add_config and self.is_under_config(folder_base)
+            plan = self.plan_folder(manifest, diff, folder_base, keep_existing)
+        self.stats.add("files_local", len(diff.local), folder)
+        self.stats.add("files_manifest", len(manifest), folder)
+        self.folder_plans[folder] = (plan, time.time())
+        if plan.pending_count:
+            self.log(f"📐 {folder}: 約 {plan.pending_count} 個檔案 / {format_size(plan.pending_bytes)} 需要更新，"
+                                 f"採用{plan.describe()}")
+
+        if plan.strategy == STRATEGY_BULK:
+            zip_url = f"{self.server_url}/{folder}?download=1"
+            with self.stats.phase("extract", folder):
+                verified = self.download_and_extract_zip(zip_url, folder_base, manifest, keep_existing, folder)
+            self.stats.add("files_extracted", len(verified), folder)
+            # 解壓時已記錄雜湊，重新比對只需 stat
+            with self.stats.phase("scan", folder):
+                diff = TreeDiff.scan(manifest, folder_base)
+        elif plan.strategy == STRATEGY_BATCH:
+            # 需要下載的小檔案先累積成批，每批以一個請求取得
+            self.folder_batches[folder] = BatchQueue(
+                lambda files: self.submit_download(self.download_batch, folder, folder_base, files,
+                                                   size=sum(manifest.size(rel) or 0 for rel in files)))
+        self.mark_folder_done(folder)
+
+        # 比對檔案：缺少的直接排入下載，兩邊都有的各自為一個雜湊工作，發現差異即排入下載
+        self.scan_folder(folder, folder_base, strict_sync, manifest, diff)
+
+    def plan_folder(self, manifest, diff, folder_base, keep_existing):
+        """
+        只用 metadata 估算需要下載的檔案數與位元組數：缺少的檔案必定下載（共用檔案庫已有的除外）；
+        已存在的檔案若雜湊索引有紀錄則以紀錄比對，否則只在大小與伺服器不同時視為變更。
+        伺服器未提供大小時，以已知檔案的平均大小估計。
+        """
+        known = list(manifest.sizes.values())
+        default_size = sum(known) / len(known) if known else 64 * 1024
+        pending_count = 0
+        pending_bytes = 0
+        for rel in diff.added:
+            if self.in_store(manifest, rel) or self.reusable(manifest, rel, folder_base):
+                continue
+            pending_count += 1
+            pending_bytes += manifest.size(rel) or default_size
+        if not keep_existing:
+            for rel in diff.common:
+                st = diff.stat(rel)
+                server_size = manifest.size(rel)
+                local_abs = os.path.join(folder_base, rel.replace("/", os.sep))
+                cached = self.hash_index.lookup(local_abs, st, count=False, algorithm=manifest.algorithm)
+                if cached is not None:
+                    changed = cached != manifest.get(rel)
+                else:
+                    changed = server_size is not None and server_size != st.st_size
+                if changed and not self.in_store(manifest, rel) and not self.reusable(manifest, rel, folder_base):
+                    pending_count += 1
+                    pending_bytes += server_size if server_size is not None else st.st_size
+        folder_bytes = 0
+        for rel in manifest:
+            size = manifest.size(rel)
+            if size is None:
+                st = diff.stat(rel)
+                size = st.st_size if st is not None else default_size
+            folder_bytes += size
+        return self.planner.plan(folder_bytes, pending_count, pending_bytes, allow_batch=self.batch_supported)
+
+    def mark_folder_done(self, folder):
+        with self._count_lock:
+            self.folder_done_at[folder] = time.time()
+
+    def scan_folder(self, folder, folder_base, strict_sync, manifest, diff):
+        is_config_base = os.path.basename(os.path.normpath(folder_base)).lower() == 'config'
+        batch = self.folder_batches.get(folder)
+        if batch is not None:
+            # 掃描與所有雜湊工作結束前不送出未滿的批次
+            batch.hold()
+        try:
+            if strict_sync:
+                # 刪除多餘檔案（若為 config 且啟用了僅新增模式，跳過刪除）
+                if self.only_add_config and is_config_base:
+                    self.log("🛡 已啟用『僅新增設定檔』，跳過多餘檔案刪除。")
+                elif diff.extra:
+                    with self._count_lock:
+                        self.pending_deletes.append((diff.extra, folder_base, folder))
+            # 缺少的檔案依大小由大到小排入，並行名額未滿時最大的檔案最先開始下載
+            for local_rel in sorted(diff.added, key=lambda rel: manifest.size(rel) or 0, reverse=True):
+                self.log(f"[檔案缺失] {local_rel}")
+                self.queue_download(folder, local_rel, folder_base)
+            # 大檔案先排入，讓最耗時的雜湊計算最早開始，各核心同時處理不同檔案，避免最後只剩一個大檔案在算
+            common = sorted(diff.common, key=lambda rel: diff.stat(rel).st_size, reverse=True)
+            for local_rel in common:
+                if batch is not None:
+                    batch.hold()
+                self.tasks.submit(self.check_and_queue, folder, folder_base, local_rel, manifest.get(local_rel),
+                                  strict_sync, is_config_base, diff.stat(local_rel), manifest.algorithm)
+        finally:
+            if batch is not None:
+                batch.release()
+
+    def check_and_queue(self, folder, folder_base, local_rel, server_hash, strict_sync, is_config_base, st=None,
+                        algorithm=DEFAULT_ALGORITHM):
+        try:
+            local_abs = os.path.join(folder_base, local_rel.replace("/", os.sep))
+            if strict_sync:
+                result = self.check_strict_file(local_abs, local_rel, server_hash, is_config_base, st, algorithm)
+            else:
+                result = self.check_file(local_abs, local_rel, server_hash, st, algorithm)
+            if result:
+                self.queue_download(folder, result, folder_base)
+        finally:
+            batch = self.folder_batches.get(folder)
+            if batch is not None:
+                batch.release()
+
+    def queue_download(self, folder, file_path, folder_base):
+        with self._count_lock:
+            self.total_tasks += 1
+            self.folder_downloads[folder] += 1
+            total = self.total_tasks
+        self.events.progress("total", total)
+        batch = self.folder_batches.get(folder)
+        manifest = self.manifests.get(folder)
+        size = manifest.size(file_path) if manifest is not None else None
+        self.progress.expect(f"{folder}/{file_path}", size)
+        if (batch is not None and self.batch_supported and (size or 0) <= BATCH_FILE_LIMIT
+                and not self.in_store(manifest, file_path)):
+            batch.add(file_path, size)
+        else:
+            self.submit_download(self.download_and_count, folder, file_path, folder_base, size=size or 0)
+
+    # -------------------------
+    # 下載排程（依並行上限逐一送入執行緒池）
+    # -------------------------
+    def submit_download(self, fn, *args, size=0):
+        """排入一個下載；size 為預估位元組數，等待中的下載依大小由大到小開始，大小相同時依排入順序。"""
+        with self._dispatch_lock:
+            heapq.heappush(self.download_queue, (-size, next(self._download_seq), fn, args))
+        self.pump_downloads()
+
+    def pump_downloads(self):
+        """在並行上限內把佇列中的下載送入執行緒池；退避期間改由一個等待工作稍後再送。"""
+        while True:
+            with self._dispatch_lock:
+                if not self.download_queue:
+                    return
+                if not self.limiter.try_acquire():
+                    delay = self.limiter.backoff_remaining()
+                    if delay > 0 and not self._pump_scheduled:
+                        self._pump_scheduled = True
+                        self.tasks.submit(self.pump_later, delay)
+                    return
+                _, _, fn, args = heapq.heappop(self.download_queue)
+            if self.async_runner is not None and fn == self.download_and_count and not self.use_segments(*args[:2]):
+                self.tasks.track(lambda args=args: self.async_runner.submit(self.download_and_count_async(*args)))
+            else:
+                self.tasks.submit(self.run_download, fn, args)
+
+    def pump_later(self, delay):
+        time.sleep(delay)
+        with self._dispatch_lock:
+            self._pump_scheduled = False
+        self.pump_downloads()
+
+    def run_download(self, fn, args):
+        transfer = self._transfer
+        transfer.bytes = 0
+        transfer.error = False
+        started = time.perf_counter()
+        try:
+            fn(*args)
+        finally:
+            self.limiter.release(transfer.bytes, time.perf_counter() - started, transfer.error)
+            transfer.bytes = None
+            self.pump_downloads()
+
+    def note_server_error(self, folder=None):
+        """記錄伺服器過載的跡象（429/5xx、逾時），讓並行數減半並退避。"""
+        self.stats.add("server_errors", 1, folder)
+        if getattr(self._transfer, "bytes", None) is not None:
+            self._transfer.error = True
+
+    def count_chunk(self, chunk, key=None):
+        """累計本次傳輸量與進度（key 為 TransferProgress 中的傳輸名稱），回傳為了頻寬上限應等待的秒數。"""
+        if getattr(self._transfer, "bytes", None) is not None:
+            self._transfer.bytes += len(chunk)
+        if key is not None:
+            self.progress.advance(key, len(chunk))
+        return self.bandwidth.reserve(len(chunk))
+
+    def receive_chunk(self, chunk, key=None):
+        """每收到一塊資料呼叫一次：套用頻寬上限並累計本次傳輸量；暫停時在此等待。"""
+        wait = self.count_chunk(chunk, key)
+        if wait > 0:
+            time.sleep(wait)
+        self.wait_if_paused()
+
+    def wait_if_paused(self):
+        if not self._running.is_set():
+            self._running.wait()
+
+    def poll_progress(self):
+        """由事件通道定期呼叫：有進行中的傳輸或完成量有變動時回傳整體進度快照。"""
+        progress = self.progress
+        if not progress.active and progress.finished == self._polled_bytes:
+            return None
+        self._polled_bytes = progress.finished
+        return {"bytes": progress.snapshot()}
+
+    def set_bandwidth_limit(self, rate):
+        self.bandwidth.set_rate(rate)
+
+    def mark_download_started(self):
+        with self._count_lock:
+            if self.download_started_at is None:
+                self.download_started_at = time.time()
+
+    def finish_download(self, folder, file_path, ok):
+        self.progress.finish(f"{folder}/{file_path}")
+        self.stats.add("files_downloaded" if ok else "files_failed", 1, folder)
+        with self._count_lock:
+            if not ok:
+                self.failed_files += 1
+            self.completed += 1
+            completed = self.completed
+            self.folder_done_at[folder] = time.time()
+        self.events.progress("completed", completed)
+
+    def download_and_count(self, folder, file_path, folder_base):
+        self.mark_download_started()
+        ok = False
+        started = time.perf_counter()
+        try:
+            with self.stats.phase("download", folder):
+                ok = self.download_and_verify(folder, file_path, folder_base)
+        finally:
+            self.stats.record_latency(time.perf_counter() - started)
+            self.finish_download(folder, file_path, ok)
+
+    def download_batch(self, folder, folder_base, files):
+        """以單一請求下載一批小檔案並邊接收邊寫入；未收到或驗證失敗的檔案改為逐檔下載。"""
+        self.mark_download_started()
+        remaining = set(files)
+        # 本地其他位置已有相同內容的檔案直接沿用，不放入批次請求
+        for rel in files:
+            if self.reuse_local(folder, rel, folder_base):
+                remaining.discard(rel)
+                self.finish_download(folder, rel, True)
+        files = [rel for rel in files if rel in remaining]
+        if files and self.batch_supported and not self._stop_flag:
+            started = time.perf_counter()
+            try:
+                with self.stats.phase("download", folder):
+                    self.fetch_batch(folder, folder_base, files, remaining)
+            except ZipStreamError as e:
+                # 回傳 200 卻不是 ZIP（忽略 ?batch=1 的舊伺服器或代理），之後的批次也只會同樣失敗
+                self.batch_supported = False
+                self.log(f"⚠ {folder} 批次內容無法解析 ({e})，之後改為逐檔下載。")
+            except Exception as e:
+                if isinstance(e, RequestException):
+                    self.note_server_error(folder)
+                self.log(f"❌ {folder} 批次下載失敗: {e}")
+            self.stats.record_latency(time.perf_counter() - started)
+        manifest = self.manifests[folder]
+        for rel in files:
+            if rel in remaining:
+                self.submit_download(self.download_and_count, folder, rel, folder_base,
+                                     size=manifest.size(rel) or 0)
+
+    def fetch_batch(self, folder, folder_base, files, remaining):
+        manifest = self.manifests[folder]
+        self.stats.add("batch_requests", 1, folder)
+        self.log(f"📦 批次下載 {folder}: {len(files)} 個檔案")
+        request_start = time.time()
+        # compress=1：請伺服器以 deflate 壓縮，設定檔等文字內容可大幅減少傳輸量
+        with self.session.post(f"{self.server_url}/{folder}/?batch=1&compress=1", json={"files": files},
+                               stream=True, timeout=30) as r:
+            if r.status_code in (400, 404, 405, 501):
+                self.batch_supported = False
+                self.log(f"⚠ 伺服器不支援批次下載 (HTTP {r.status_code})，改為逐檔下載")
+                return
+            if r.status_code != 200:
+                if r.status_code == 429 or r.status_code >= 500:
+                    self.note_server_error(folder)
+                self.log(f"❌ 批次下載失敗 HTTP {r.status_code}")
+                return
+            body_start = time.time()
+            self.transfer_model.record_request(body_start - request_start)
+            received = {"bytes": 0}
+
+            def chunks():
+                for chunk in r.iter_content(65536):
+                    if chunk:
+                        self.receive_chunk(chunk)
+                        received["bytes"] += len(chunk)
+                        yield chunk
+
+            try:
+                for member in ZipStreamReader(chunks()):
+                    self.wait_if_paused()
+                    if self._stop_flag:
+                        break
+                    rel = member.name.strip("/")
+                    if member.is_dir or rel not in remaining:
+                        continue
+                    local_abs = os.path.join(folder_base, rel.replace("/", os.sep))
+                    expected_hash = manifest.get(rel)
+                    if self.extract_member(member, local_abs, expected_hash, manifest.algorithm):
+                        remaining.discard(rel)
+                        self.add_to_store(manifest.algorithm, expected_hash, local_abs)
+                        self.log(f"✅ 下載完成 {folder}/{rel}")
+                        self.finish_download(folder, rel, True)
+            finally:
+                self.add_downloaded_bytes(received["bytes"], folder)
+                self.transfer_model.record_stream(received["bytes"], time.time() - body_start)
+
+    def add_downloaded_bytes(self, nbytes, folder=None):
+        with self._count_lock:
+            self.bytes_downloaded += nbytes
+        self.stats.add("bytes_downloaded", nbytes, folder)
+
+    # -------------------------
+    # 快速檢查檔案
+    # -------------------------
+    def get_hash(self, file_path, st=None, algorithm=DEFAULT_ALGORITHM):
+        # 先查本地索引，大小與 mtime 未變則直接使用快取
+        cached = self.hash_index.lookup(file_path, st, algorithm=algorithm)
+        if cached is not None:
+            return cached
+        try:
+            st = st or os.stat(file_path)
+            with self.hash_slots, self.stats.phase("hash"):
+                digest = hash_file(file_path, algorithm, st.st_size)
+            self.stats.add("bytes_hashed", st.st_size)
+            self.hash_index.store(file_path, digest, st, algorithm)
+            return digest
+        except Exception as e:
+            self.log(f"❌ 計算雜湊失敗: {file_path}, {e}")
+            return None
+
+    def manifest_algorithm(self, response):
+        """由清單回應的標頭取得伺服器使用的雜湊演算法，舊伺服器未宣告時為 md5。"""
+        algorithm = response.headers.get(ALGORITHM_HEADER, DEFAULT_ALGORITHM).strip().lower()
+        if not is_supported(algorithm):
+            raise ValueError(f"伺服器使用不支援的雜湊演算法 {algorithm}")
+        return algorithm
+
+    def fetch_manifest(self, folder):
+        """
+        取得伺服器資料夾清單並攤平成 ManifestIndex，失敗回傳 None。
+        優先以 Merkle 摘要與本地紀錄比對，只抓取有變更的子目錄；伺服器不支援時改抓完整清單。
+        """
+        manifest = None
+        cached = self.manifest_cache.load(folder)
+        # 沒有本地紀錄時（首次安裝、紀錄遺失）每個目錄都不同，直接抓完整清單只需一個請求
+        if cached is not None:
+            try:
+                manifest = self.fetch_manifest_merkle(folder, cached)
+            except Exception as e:
+                self.log(f"⚠ {folder} Merkle 摘要比對失敗，改抓完整清單: {e}")
+        if manifest is None:
+            try:
+                # size=1：支援的伺服器會以 [雜湊, 大小] 表示檔案；hash=：偏好的雜湊演算法。舊伺服器忽略這些參數
+                self.stats.add("manifest_requests", 1, folder)
+                r = self.session.get(f"{self.server_url}/{folder}/?json=1&size=1&{self.hash_query()}", timeout=10)
+                if r.status_code != 200:
+                    self.error(f"❌ 無法取得 {folder} 檔案列表: HTTP {r.status_code}")
+                    return None
+                manifest = ManifestIndex.from_tree(r.json(), self.manifest_algorithm(r))
+            except Exception as e:
+                self.error(f"❌ 取得 {folder} 檔案列表失敗: {e}")
+                return None
+        self.manifests[folder] = manifest
+        try:
+            self.manifest_cache.save(folder, manifest)
+        except OSError as e:
+            self.log(f"⚠ 無法記錄 {folder} 檔案列表: {e}")
+        return manifest
+
+    def get_merkle_level(self, folder, rel):
+        """取得某一層目錄的 Merkle 摘要，伺服器不支援時回傳 None。"""
+        sub = f"{quote(rel)}/" if rel else ""
+        self.stats.add("manifest_requests", 1, folder)
+        r = self.session.get(f"{self.server_url}/{folder}/{sub}?merkle=1&size=1&{self.hash_query()}", timeout=10)
+        if r.status_code != 200:
+            return None
+        try:
+            data = r.json()
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or "hash" not in data:
+            return None
+        data["algorithm"] = self.manifest_algorithm(r)
+        return data
+
+    def hash_query(self):
+        return f"hash={','.join(self.hash_algorithms)}"
+
+    def fetch_manifest_merkle(self, folder, cached):
+        """
+        以 Merkle 摘要與本地紀錄 cached 比對，只抓取有變更的子目錄並與未變更的部分合併成新清單。
+        回傳 None 表示應改抓完整清單：伺服器不支援、雜湊演算法不同，或有變更的目錄超過 MERKLE_FETCH_LIMIT。
+        """
+        root = self.get_merkle_level(folder, "")
+        if root is None:
+            return None
+        algorithm = root["algorithm"]
+        if cached.algorithm != algorithm:
+            # 伺服器更換了雜湊演算法，舊紀錄的摘要無法比對
+            return None
+        local_digests = compute_dir_digests(cached)
+        if local_digests.get("") == root["hash"]:
+            self.log(f"🌲 {folder} 摘要未變更，沿用本地清單紀錄")
+            return cached
+
+        # 只往摘要不同的子目錄深入，相同的子目錄直接沿用紀錄；同一層有變更的子目錄同時抓取
+        manifest = ManifestIndex(algorithm=algorithm)
+        unchanged = set()
+        fetched = 1
+        levels = [("", root)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MERKLE_WORKERS) as executor:
+            while levels:
+                changed = []
+                for rel, level in levels:
+                    for name, value in level.get("files", {}).items():
+                        manifest.add_file(f"{rel}/{name}" if rel else name, value)
+                    for name, digest in level.get("dirs", {}).items():
+                        sub = f"{rel}/{name}" if rel else name
+                        manifest.dirs.add(sub)
+                        if local_digests.get(sub) == digest:
+                            unchanged.add(sub)
+                        else:
+                            changed.append(sub)
+                if fetched + len(changed) > MERKLE_FETCH_LIMIT:
+                    self.log(f"🌲 {folder} 有變更的目錄過多，改抓完整清單")
+                    return None
+                sub_levels = list(executor.map(lambda sub: self.get_merkle_level(folder, sub), changed))
+                if any(level is None for level in sub_levels):
+                    return None
+                fetched += len(changed)
+                levels = list(zip(changed, sub_levels))
+        if unchanged:
+            for rel, value in cached.items():
+                if subtree_root(rel, unchanged):
+                    manifest.add_file(rel, [value, cached.size(rel)])
+            for rel in cached.dirs:
+                if subtree_root(rel, unchanged):
+                    manifest.dirs.add(rel)
+
+        if compute_dir_digests(manifest).get("") != root["hash"]:
+            # 伺服器在比對途中有更新，摘要無法對上，改抓完整清單
+            return None
+        self.log(f"🌲 {folder} 依摘要比對，抓取了 {fetched} 個有變更的目錄")
+        return manifest
+
+    # -------------------------
+    # mods/servermods 嚴格同步
+    # -------------------------
+    def check_strict_file(self, local_abs, local_rel, server_hash, is_config_base, st=None,
+                          algorithm=DEFAULT_ALGORITHM):
+        local_hash = self.get_hash(local_abs, st, algorithm) if os.path.exists(local_abs) else None
+        if local_hash is not None and self.only_add_config and is_config_base:
+            self.log(f"[跳過覆蓋] config 模式：保留本地已有檔案 {local_rel}")
+            return None
+        if local_hash != server_hash:
+            if os.path.exists(local_abs):
+                self.discard_local(local_abs, algorithm, local_hash)
+            return local_rel
+        # 已與伺服器一致的檔案也放入共用檔案庫，供其他版本資料夾使用
+        self.add_to_store(algorithm, server_hash, local_abs)
+        return None
+
+    def delete_extra_files(self, extra_files, local_base, folder=None):
+        with self.stats.phase("delete", folder):
+            for rel_path_local in extra_files:
+                self.log(f"[多餘檔案刪除] {rel_path_local}")
+                local_abs = os.path.join(local_base, rel_path_local.replace("/", os.sep))
+                try:
+                    os.remove(local_abs)
+                    self.hash_index.invalidate(local_abs)
+                    self.stats.add("files_deleted", 1, folder)
+                except Exception as e:
+                    self.log(f"❌ 刪除失敗 {rel_path_local}: {e}")
+
+    def check_file(self, local_abs, local_rel, server_hash, st=None, algorithm=DEFAULT_ALGORITHM):
+        # 如果本地不存在 -> 需要下載
+        if not os.path.exists(local_abs):
+            self.log(f"[檔案缺失] {local_rel}")
+            return local_rel
+
+        # 如果啟用了 only_add_config 且該檔案位於 config 下 -> 跳過覆蓋與雜湊檢查（保留本地）
+        if self.only_add_config and self.is_under_config(local_abs):
+            self.log(f"[跳過檢查] config 模式且檔案已存在，保留本地：{local_rel}")
+            return None
+
+        local_hash = self.get_hash(local_abs, st, algorithm)
+        if local_hash != server_hash:
+            self.log(f"[{algorithm.upper()} 不同] {local_rel}")
+            self.discard_local(local_abs, algorithm, local_hash)
+            return local_rel
+        self.add_to_store(algorithm, server_hash, local_abs)
+        return None
+
+    def download_file(self, file_path, folder, local_base, max_retries=3):
+        download = _FileDownload(self, folder, file_path, local_base)
+        if self.use_segments(folder, file_path) and download.partial.resume_offset()[0] == 0:
+            if self.download_segmented(file_path, folder, download.partial, download.size, download.algorithm):
+                return True
+            if self._stop_flag:
+                return False
+        for attempt in range(download.attempts(max_retries)):
+            self.wait_if_paused()
+            if self._stop_flag:
+                return False
+            url, headers = download.begin(attempt)
+            try:
+                with self.session.get(url, stream=True, timeout=15, headers=headers) as r:
+                    hasher = download.accept(r.status_code, r.headers)
+                    if hasher is None:
+                        continue
+                    with download.open_part(hasher) as f:
+                        for chunk in r.iter_content(65536):
+                            if self._stop_flag:
+                                break
+                            if chunk:
+                                self.receive_chunk(chunk, download.key)
+                                download.write(f, hasher, chunk)
+                                download.downloaded += len(chunk)
+                    download.end_body()
+                    if self._stop_flag:
+                        # 停止時保留暫存檔，下次同步可續傳
+                        download.mirror_ok = True
+                        return False
+                    if download.verify_and_commit(hasher):
+                        return True
+            except Exception as e:
+                download.fail(e, isinstance(e, RequestException))
+            finally:
+                download.release()
+            # 還有其他可用來源時立即改用，否則稍候再試
+            if download.sources_exhausted():
+                time.sleep(1)
+        return download.give_up()
+
+    def use_segments(self, folder, file_path):
+        """大檔案且有多個可用來源時，分段由多個來源同時下載。"""
+        manifest = self.manifests.get(folder)
+        if manifest is None or not manifest.get(file_path):
+            return False
+        size = manifest.size(file_path)
+        return bool(size) and size >= SEGMENT_THRESHOLD and len(self.mirrors.healthy()) > 1
+
+    def download_segmented(self, file_path, folder, partial, size, algorithm):
+        """
+        將大檔案切成 SEGMENT_SIZE 的區段，由多個來源同時以 Range 請求下載並寫入同一個暫存檔，
+        快的來源自然會下載較多區段；區段失敗時放回佇列改由其他來源下載。
+        完成後以清單雜湊驗證整個檔案，成功回傳 True；來源不支援區段或驗證失敗時回傳 False，改用一般下載。
+        """
+        key = f"{folder}/{file_path}"
+        segments = deque((start, min(start + SEGMENT_SIZE, size) - 1) for start in range(0, size, SEGMENT_SIZE))
+        workers = min(MAX_SEGMENT_WORKERS, len(self.mirrors.healthy()), len(segments))
+        lock = threading.Lock()
+        state = {"failures": 0, "aborted": False, "bytes": 0}
+        max_failures = len(segments) + 2 * workers
+        self.log(f"🧩 分段下載 {folder}/{file_path}：{len(segments)} 段，{workers} 個來源同時下載")
+        self.progress.start(key, size)
+        with open(partial.part_path, "wb") as f:
+            f.truncate(size)
+
+        def fetch_segments():
+            failed = []
+            with open(partial.part_path, "r+b") as f:
+                while not self._stop_flag:
+                    with lock:
+                        if state["aborted"] or not segments:
+                            return
+                        start, end = segments.popleft()
+                    self.wait_if_paused()
+                    mirror = self.mirrors.acquire(exclude=failed)
+                    url = f"{mirror.url}/{folder}/{quote(file_path)}?download=1"
+                    received = 0
+                    ok = False
+                    unsupported = False
+                    missing = False
+                    request_start = time.time()
+                    latency = None
+                    try:
+                        with self.session.get(url, stream=True, timeout=15,
+                                              headers={"Range": f"bytes={start}-{end}"}) as r:
+                            latency = time.time() - request_start
+                            if r.status_code != 206 or parse_content_range_start(
+                                    r.headers.get("Content-Range")) != start:
+                                if r.status_code == 429 or r.status_code >= 500:
+                                    self.note_server_error(folder)
+                                # 200 表示來源忽略 Range，不適合分段下載
+                                unsupported = r.status_code == 200
+                                missing = r.status_code == 404 and not mirror.primary
+                                continue
+                            f.seek(start)
+                            for chunk in r.iter_content(65536):
+                                if self._stop_flag:
+                                    break
+                                if chunk:
+                                    chunk = chunk[:end + 1 - start - received]
+                                    self.receive_chunk(chunk, key)
+                                    f.write(chunk)
+                                    received += len(chunk)
+                            ok = received == end - start + 1
+                    except Exception as e:
+                        if isinstance(e, RequestException):
+                            self.note_server_error(folder)
+                        self.log(f"⚠ 區段 {start}-{end} 下載失敗 ({mirror.url}): {e}")
+                    finally:
+                        self.mirrors.release(mirror, received, time.time() - request_start, ok, latency, missing)
+                        with lock:
+                            state["bytes"] += received
+                            if not ok:
+                                # 已計入進度的部分扣回，區段放回佇列由其他來源重新下載
+                                self.progress.advance(key, -received)
+                                segments.append((start, end))
+                                state["failures"] += 1
+                                if unsupported or state["failures"] > max_failures:
+                                    state["aborted"] = True
+                        if not ok:
+                            failed.append(mirror)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(fetch_segments) for _ in range(workers)]:
+                future.result()
+        self.add_downloaded_bytes(state["bytes"], folder)
+        # 分段由其他執行緒接收，傳輸量另外計入呼叫端的並行調整
+        if getattr(self._transfer, "bytes", None) is not None:
+            self._transfer.bytes += state["bytes"]
+        if state["aborted"] or segments or self._stop_flag:
+            partial.discard()
+            self.log(f"⚠ 分段下載未完成，改為一般下載 {folder}/{file_path}")
+            return False
+        with self.hash_slots:
+            digest = hash_file(partial.part_path, algorithm, size)
+        if digest != partial.expected_hash:
+            partial.discard()
+            self.log(f"⚠ 分段下載後 {algorithm.upper()} 不同，改為一般下載 {folder}/{file_path}")
+            return False
+        partial.commit()
+        self.hash_index.store(partial.local_path, digest, algorithm=algorithm)
+        self.stats.add("segmented_files", 1, folder)
+        self.log(f"✅ 下載完成 {folder}/{file_path}")
+        return True
+
+    # -------------------------
+    # 事件迴圈上的逐檔下載（transfer=TRANSFER_ASYNC）
+    # -------------------------
+    async def download_and_count_async(self, folder, file_path, folder_base):
+        """download_and_count 的事件迴圈版本；結束時自行歸還並行名額並繼續派送佇列中的下載。"""
+        self.mark_download_started()
+        result = {"bytes": 0, "error": False}
+        ok = False
+        started = time.perf_counter()
+        try:
+            with self.stats.phase("download", folder):
+                ok = await self.download_and_verify_async(folder, file_path, folder_base, result)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats.record_latency(elapsed)
+            self.finish_download(folder, file_path, ok)
+            self.limiter.release(result["bytes"], elapsed, result["error"])
+            self.pump_downloads()
+
+    async def download_and_verify_async(self, folder, file_path, local_base, result):
+        loop = asyncio.get_running_loop()
+        manifest = self.manifests.get(folder)
+        # 本地沿用與檔案庫的存取是磁碟操作，交給執行緒以免卡住事件迴圈
+        if manifest is not None and self.reusable(manifest, file_path, local_base) and await loop.run_in_executor(
+                None, self.reuse_local, folder, file_path, local_base):
+            return True
+        if manifest is not None and self.in_store(manifest, file_path) and await loop.run_in_executor(
+                None, self.restore_from_store, folder, file_path, local_base):
+            return True
+        if not await self.download_file_async(file_path, folder, local_base, result):
+            return False
+        if manifest is not None and self.store is not None:
+            await loop.run_in_executor(None, self.add_to_store, manifest.algorithm, manifest.get(file_path),
+                                       os.path.join(local_base, file_path.replace("/", os.sep)))
+        return True
+
+    async def run_blocking(self, fn, *args):
+        """
+        在執行緒中執行磁碟讀寫與雜湊計算，避免卡住事件迴圈上的其他下載；同時執行的數量與雜湊工作共用 hash_slots 上限。
+        取消時仍等待已開始的工作結束，呼叫端才能安全地關閉檔案。
+        """
+        def call():
+            with self.hash_slots:
+                return fn(*args)
+
+        future = asyncio.get_running_loop().run_in_executor(None, call)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            raise
+
+    async def download_file_async(self, file_path, folder, local_base, result, max_retries=3):
+        """與 download_file 相同的續傳、換來源與雜湊驗證流程；暫停與取消立即作用在進行中的傳輸。"""
+        runner = self.async_runner
+        download = _FileDownload(self, folder, file_path, local_base)
+        for attempt in range(download.attempts(max_retries)):
+            await runner.wait_running()
+            if self._stop_flag:
+                return False
+            url, headers = download.begin(attempt)
+            try:
+                async with runner.client.get(url, headers) as r:
+                    hasher = download.accept(r.status_code, r.headers)
+                    if hasher is None:
+                        result["error"] = result["error"] or download.server_error
+                        continue
+                    f = await self.run_blocking(download.open_part, hasher)
+                    try:
+                        # 收到的內容累積到 ASYNC_WRITE_SIZE 再交給執行緒寫入與計算雜湊
+                        pending = []
+                        pending_bytes = 0
+                        async for chunk in r.iter_content(65536):
+                            wait = self.count_chunk(chunk, download.key)
+                            if wait > 0:
+                                await asyncio.sleep(wait)
+                            await runner.wait_running()
+                            pending.append(chunk)
+                            pending_bytes += len(chunk)
+                            download.downloaded += len(chunk)
+                            if pending_bytes >= ASYNC_WRITE_SIZE:
+                                await self.run_blocking(download.write, f, hasher, b"".join(pending))
+                                pending, pending_bytes = [], 0
+                        if pending:
+                            await self.run_blocking(download.write, f, hasher, b"".join(pending))
+                    finally:
+                        f.close()
+                    result["bytes"] += download.end_body()
+                    if await self.run_blocking(download.verify_and_commit, hasher):
+                        return True
+            except asyncio.CancelledError:
+                # 取消時保留暫存檔，下次同步可續傳
+                download.mirror_ok = True
+                raise
+            except Exception as e:
+                if isinstance(e, AsyncHttpError):
+                    result["error"] = True
+                download.fail(e, isinstance(e, AsyncHttpError))
+            finally:
+                download.release()
+            if download.sources_exhausted():
+                await asyncio.sleep(1)
+        return download.give_up()
+
+    # -------------------------
+    # 下載並驗證（驗證已於下載過程中完成）
+    # -------------------------
+    def download_and_verify(self, folder, file_path, local_base):
+        # 本地其他位置或共用檔案庫已有相同雜湊的檔案時直接取用，不經網路
+        if self.reuse_local(folder, file_path, local_base) or self.restore_from_store(folder, file_path, local_base):
+            return True
+        if not self.download_file(file_path, folder, local_base):
+            return False
+        manifest = self.manifests.get(folder)
+        if manifest is not None:
+            self.add_to_store(manifest.algorithm, manifest.get(file_path),
+                              os.path.join(local_base, file_path.replace("/", os.sep)))
+        return True
+
+    def in_store(self, manifest, rel):
+        return self.store is not None and self.store.contains(manifest.algorithm, manifest.get(rel))
+
+    def restore_from_store(self, folder, file_path, local_base):
+        manifest = self.manifests.get(folder)
+        if self.store is None or manifest is None or not manifest.get(file_path):
+            return False
+        local_path = os.path.join(local_base, file_path.replace("/", os.sep))
+        digest = manifest.get(file_path)
+        try:
+            if not self.store.materialize(manifest.algorithm, digest, local_path):
+                return False
+        except Exception as e:
+            self.log(f"⚠ 無法由共用檔案庫取得 {folder}/{file_path}: {e}")
+            return False
+        self.hash_index.store(local_path, digest, algorithm=manifest.algorithm)
+        self.stats.add("files_from_store", 1, folder)
+        self.stats.add("bytes_from_store", os.path.getsize(local_path), folder)
+        self.log(f"♻ 由共用檔案庫取得 {folder}/{file_path}")
+        return True
+
+    def add_to_store(self, algorithm, digest, local_path):
+        """將已驗證的檔案放入共用檔案庫（已存在則略過），失敗不影響同步結果。"""
+        if self.store is None or not digest:
+            return
+        try:
+            self.store.add(algorithm, digest, local_path)
+        except Exception as e:
+            self.log(f"⚠ 無法加入共用檔案庫 {local_path}: {e}")
+
+    # -------------------------
+    # 沿用本地相同內容的檔案（搬移、改名或移到其他資料夾）
+    # -------------------------
+    def local_files_by_size(self):
+        """所有資料夾的本地檔案（同步開始時走訪）依大小分組的絕對路徑，資料夾互相包含時不重複；第一次使用時建立。"""
+        with self._reuse_lock:
+            if self._local_by_size is None:
+                by_size = {}
+                seen = set()
+                for folder, scan in self.local_scans.items():
+                    base = self.resolve_folder(folder)[0]
+                    for rel, st in scan.result().items():
+                        path = os.path.abspath(os.path.join(base, rel.replace("/", os.sep)))
+                        if is_partial_name(rel) or path in seen:
+                            continue
+                        seen.add(path)
+                        by_size.setdefault(st.st_size, []).append(path)
+                self._local_by_size = by_size
+            return self._local_by_size
+
+    def reusable(self, manifest, rel, local_base):
+        """
+        不計算雜湊的快速判斷：暫存區已有相同雜湊的檔案，或其他位置有大小相同的檔案時回傳 True，
+        供同步規劃估算與決定是否值得嘗試 reuse_local。空檔案不沿用。
+        """
+        digest = manifest.get(rel)
+        if not digest:
+            return False
+        if (manifest.algorithm, digest) in self.stashed:
+            return True
+        size = manifest.size(rel)
+        if not size or not self.local_scans:
+            return False
+        local_path = os.path.abspath(os.path.join(local_base, rel.replace("/", os.sep)))
+        return any(path != local_path for path in self.local_files_by_size().get(size, ()))
+
+    def find_local_copy(self, algorithm, digest, size, exclude):
+        """找出內容雜湊為 digest 的本地檔案，回傳 (路徑, 計算雜湊時的 stat)；沒有時回傳 None。"""
+        key = (algorithm, digest)
+        stashed = self.stashed.get(key)
+        candidates = [stashed] if stashed is not None else []
+        if size:
+            candidates += [path for path in self.local_files_by_size().get(size, ()) if path != exclude]
+        for path in candidates:
+            st = self.verify_local_copy(path, algorithm, digest, size)
+            if st is not None:
+                return path, st
+        # 候選檔案可能在查詢途中因內容與伺服器不同被移到暫存區
+        late = self.stashed.get(key)
+        if late is not None and late != stashed:
+            st = self.verify_local_copy(late, algorithm, digest, size)
+            if st is not None:
+                return late, st
+        return None
+
+    def verify_local_copy(self, path, algorithm, digest, size):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if size and st.st_size != size:
+            return None
+        return st if self.get_hash(path, st, algorithm) == digest else None
+
+    def reuse_local(self, folder, file_path, local_base):
+        """
+        下載開始前，以本地其他位置相同雜湊的檔案建立 file_path：jar/zip 建立硬連結，其他檔案複製，
+        以暫存檔 + 原子改名完成。候選來源只需大小相同，雜湊多半已在雜湊索引中。找不到時回傳 False。
+        """
+        manifest = self.manifests.get(folder)
+        if manifest is None or not self.reusable(manifest, file_path, local_base):
+            return False
+        digest = manifest.get(file_path)
+        local_path = os.path.abspath(os.path.join(local_base, file_path.replace("/", os.sep)))
+        with self.stats.phase("reuse", folder):
+            # 來源可能在查詢後被移到暫存區（內容與伺服器不同的檔案），再找一次
+            for _ in range(2):
+                found = self.find_local_copy(manifest.algorithm, digest, manifest.size(file_path), local_path)
+                if found is None:
+                    return False
+                if self.copy_local(found[0], found[1], local_path):
+                    break
+            else:
+                return False
+        source = found[0]
+        self.hash_index.store(local_path, digest, algorithm=manifest.algorithm)
+        self.stats.add("files_reused", 1, folder)
+        self.stats.add("bytes_reused", found[1].st_size, folder)
+        source_rel = os.path.relpath(source, self.mc_version_path).replace(os.sep, "/")
+        self.log(f"♻ 沿用本地相同內容 {source_rel} -> {folder}/{file_path}")
+        return True
+
+    def copy_local(self, source, st, local_path):
+        """
+        將 source 連結或複製到 local_path；source 在計算雜湊後被替換或修改（inode、大小或 mtime 不同）時放棄，
+        避免取得未驗證的內容。
+        """
+        tmp_path = f"{local_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        expected = (st.st_ino, st.st_size, st.st_mtime_ns)
+        try:
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            link_or_copy(source, tmp_path, should_link(local_path))
+            after = os.stat(source)
+            if (after.st_ino, after.st_size, after.st_mtime_ns) != expected:
+                raise OSError("來源在複製途中被修改")
+            os.replace(tmp_path, local_path)
+            return True
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            return False
+
+    def discard_local(self, local_abs, algorithm, digest):
+        """
+        移除內容與伺服器不同的檔案：先移到 .modsync/reuse/，同步中其他位置需要相同內容時仍可沿用，
+        同步結束後清除。無法移動時直接刪除。
+        """
+        self.hash_index.invalidate(local_abs)
+        if digest:
+            path = os.path.join(self.reuse_dir, f"{algorithm}-{digest}")
+            try:
+                os.makedirs(self.reuse_dir, exist_ok=True)
+                os.replace(local_abs, path)
+            except OSError:
+                pass
+            else:
+                self.hash_index.store(path, digest, algorithm=algorithm)
+                with self._reuse_lock:
+                    self.stashed[(algorithm, digest)] = path
+                return
+        with contextlib.suppress(OSError):
+            os.remove(local_abs)
+
+    def clear_reuse_dir(self):
+        """移除本次未被沿用的暫存檔案。"""
+        for path in self.stashed.values():
+            self.hash_index.invalidate(path)
+        shutil.rmtree(self.reuse_dir, ignore_errors=True)
+
+    def download_and_extract_zip(self, zip_url, extract_to, manifest=None, keep_existing=False, folder=None):
+        """
+        邊下載邊解壓整包 ZIP，不在磁碟上留下暫存壓縮檔。
+        本地已相同（或 keep_existing 時本地已存在）的項目直接略過，其餘項目解壓時同步計算雜湊並與清單比對，一致才改名為正式檔案。
+        回傳已確認與清單一致的相對路徑集合。
+        """
+        verified = set()
+        extracted = 0
+        skipped = 0
+        algorithm = manifest.algorithm if manifest is not None else DEFAULT_ALGORITHM
+        try:
+            self.log(f"📦 下載 ZIP: {zip_url}")
+            request_start = time.time()
+            with self.session.get(zip_url, stream=True, timeout=30) as r:
+                if r.status_code != 200:
+                    self.log(f"❌ ZIP 下載失敗 HTTP {r.status_code}")
+                    return verified
+                body_start = time.time()
+                self.transfer_model.record_request(body_start - request_start)
+                total_size = int(r.headers.get('Content-Length', 0))
+                progress = {"downloaded": 0}
+                # 整包 ZIP 視為一個傳輸計入整體進度
+                key = f"{folder}.zip"
+                self.progress.expect(key, total_size)
+                self.progress.start(key, total_size)
+
+                def chunks():
+                    for chunk in r.iter_content(65536):
+                        if chunk:
+                            self.bandwidth.consume(len(chunk))
+                            self.progress.advance(key, len(chunk))
+                            progress["downloaded"] += len(chunk)
+                            yield chunk
+
+                for member in ZipStreamReader(chunks()):
+                    rel = member.name.strip("/")
+                    local_abs = os.path.normpath(os.path.join(extract_to, rel.replace("/", os.sep)))
+                    if not rel or not local_abs.startswith(os.path.normpath(extract_to) + os.sep):
+                        continue
+                    if member.is_dir:
+                        os.makedirs(local_abs, exist_ok=True)
+                        continue
+                    expected_hash = manifest.get(rel) if manifest is not None else None
+                    if keep_existing and os.path.exists(local_abs):
+                        skipped += 1
+                        continue
+                    if (expected_hash and os.path.exists(local_abs)
+                            and self.get_hash(local_abs, algorithm=algorithm) == expected_hash):
+                        skipped += 1
+                        verified.add(rel)
+                        continue
+                    if self.extract_member(member, local_abs, expected_hash, algorithm):
+                        extracted += 1
+                        if expected_hash:
+                            verified.add(rel)
+                            self.add_to_store(algorithm, expected_hash, local_abs)
+                self.add_downloaded_bytes(progress["downloaded"], folder)
+                self.transfer_model.record_stream(progress["downloaded"], time.time() - body_start)
+            self.log(f"✅ 解壓完成，寫入 {extracted} 個檔案，略過 {skipped} 個已相同的檔案。")
+        except ZipStreamError as e:
+            self.log(f"⚠ 無法串流解壓 ({e})，剩餘檔案改為逐檔下載。")
+        except Exception as e:
+            self.log(f"❌ 下載或解壓失敗: {e}")
+        finally:
+            self.progress.finish(f"{folder}.zip")
+        return verified
+
+    def extract_member(self, member, local_abs, expected_hash, algorithm=DEFAULT_ALGORITHM):
+        os.makedirs(os.path.dirname(local_abs), exist_ok=True)
+        part_path = local_abs + ".part"
+        hasher = new_hasher(algorithm)
+        try:
+            with open(part_path, "wb") as f:
+                for data in member.iter_data():
+                    f.write(data)
+                    hasher.update(data)
+        except BaseException:
+            # open() 本身失敗時暫存檔不存在，清理不可掩蓋原本的例外
+            with contextlib.suppress(OSError):
+                os.remove(part_path)
+            raise
+        digest = hasher.hexdigest()
+        if expected_hash and digest != expected_hash:
+            self.log(f"⚠ ZIP 內檔案 {algorithm.upper()} 不同，稍後逐檔下載: {member.name}")
+            with contextlib.suppress(OSError):
+                os.remove(part_path)
+            return False
+        os.replace(part_path, local_abs)
+        self.hash_index.store(local_abs, digest, algorithm=algorithm)
+        return True
+
+    def pause(self):
+        """切換暫停狀態；進行中的下載在收到下一塊資料前停住，繼續時從原處接著下載。"""
+        if self._running.is_set():
+            self._running.clear()
+            if self.async_runner is not None:
+                self.async_runner.pause()
+        else:
+            self._running.set()
+            if self.async_runner is not None:
+                self.async_runner.resume()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def stop(self):
+        """停止同步：不再開始新的下載，事件迴圈上的傳輸立即取消（暫存檔保留以便下次續傳）。"""
+        self._stop_flag = True
+        self._running.set()
+        if self.async_runner is not None:
+            self.async_runner.cancel_all()
@@ -0,0 +1,138 @@
+import os
+import json
+import math
+import threading
+
+from HashIndex import INDEX_DIR_NAME, write_json_atomic
+from BatchQueue import BATCH_MAX_FILES, BATCH_MAX_BYTES
+
+# -------------------------
+# 依位元組成本選擇傳輸方式
+# -------------------------
+STRATEGY_PER_FILE = "per_file"
+STRATEGY_BULK = "bulk"
+STRATEGY_BATCH = "batch"
+
+STRATEGY_NAMES = {
+    STRATEGY_PER_FILE: "逐檔下載",
+    STRATEGY_BULK: "整包下載",
+    STRATEGY_BATCH: "批次下載",
+}
+
+
+class TransferModel:
+    """
+    記錄實測的傳輸特性（<mc_version_path>/.modsync/planner.json），以指數移動平均更新：
+    overhead          每個請求到收到回應標頭的時間（秒）
+    stream_throughput 單一連線的下載速度（bytes/s）
+    link_throughput   多連線同時下載時的整體速度（bytes/s）
+    concurrency       上次同步結束時的並行下載數，作為下次的起始值
+    """
+
+    FILE_NAME = "planner.json"
+    ALPHA = 0.3
+    DEFAULTS = {"overhead": 0.05, "stream_throughput": 4 * 1024 * 1024, "link_throughput": 8 * 1024 * 1024,
+                "concurrency": 4.0}
+
+    def __init__(self, root):
+        self.path = os.path.join(os.path.abspath(root), INDEX_DIR_NAME, self.FILE_NAME)
+        self.values = dict(self.DEFAULTS)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key in self.DEFAULTS:
+                if isinstance(data.get(key), (int, float)) and data[key] > 0:
+                    self.values[key] = float(data[key])
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def record(self, key, sample):
+        if sample is None or sample <= 0:
+            return
+        with self._lock:
+            self.values[key] = self.values[key] * (1 - self.ALPHA) + sample * self.ALPHA
+
+    def record_request(self, seconds):
+        self.record("overhead", seconds)
+
+    def record_stream(self, nbytes, seconds):
+        # 太小的傳輸主要反映延遲而非頻寬，不列入
+        if nbytes >= 256 * 1024 and seconds > 0:
+            self.record("stream_throughput", nbytes / seconds)
+
+    def record_link(self, nbytes, seconds):
+        if nbytes >= 1024 * 1024 and seconds > 0:
+            self.record("link_throughput", nbytes / seconds)
+
+    def save(self):
+        with self._lock:
+            data = dict(self.values)
+        write_json_atomic(self.path, data)
+
+
+class SyncPlan:
+    __slots__ = ("strategy", "estimates", "pending_count", "pending_bytes")
+
+    def __init__(self, strategy, estimates, pending_count, pending_bytes):
+        self.strategy = strategy
+        self.estimates = estimates
+        self.pending_count = pending_count
+        self.pending_bytes = pending_bytes
+
+    @property
+    def estimate(self):
+        return self.estimates[self.strategy]
+
+    def describe(self):
+        parts = ", ".join(f"{STRATEGY_NAMES[k]} {v:.1f}s" for k, v in self.estimates.items())
+        return f"{STRATEGY_NAMES[self.strategy]} (預估 {parts})"
+
+
+class SyncPlanner:
+    """
+    以預估耗時比較各傳輸方式：
+    逐檔：每個請求的延遲可由多個連線分攤，但需傳輸的只有變更的位元組
+    整包：只需一個請求，但必須傳輸整個資料夾
+    批次：只傳輸變更的檔案，且每個請求包含多個檔案（需伺服器支援 ?batch=1）
+    """
+
+    def __init__(self, model, workers):
+        self.model = model
+        self.workers = max(1, workers)
+
+    def per_file_cost(self, count, nbytes):
+        if not count:
+            return 0.0
+        streams = min(self.workers, count)
+        throughput = min(self.model["stream_throughput"] * streams, self.model["link_throughput"])
+        return count * self.model["overhead"] / streams + nbytes / throughput
+
+    def bulk_cost(self, folder_bytes):
+        throughput = min(self.model["stream_throughput"], self.model["link_throughput"])
+        return self.model["overhead"] + folder_bytes / throughput
+
+    def batch_cost(self, count, nbytes):
+        batches = max(math.ceil(count / BATCH_MAX_FILES), math.ceil(nbytes / BATCH_MAX_BYTES), 1)
+        streams = min(self.workers, batches)
+        throughput = min(self.model["stream_throughput"] * streams, self.model["link_throughput"])
+        return batches * self.model["overhead"] / streams + nbytes / throughput
+
+    def plan(self, folder_bytes, pending_count, pending_bytes, allow_batch=False):
+        estimates = {STRATEGY_PER_FILE: self.per_file_cost(pending_count, pending_bytes)}
+        if pending_count:
+            estimates[STRATEGY_BULK] = self.bulk_cost(folder_bytes)
+        if allow_batch and pending_count > 1:
+            estimates[STRATEGY_BATCH] = self.batch_cost(pending_count, pending_bytes)
+        strategy = min(estimates, key=estimates.get)
+        return SyncPlan(strategy, estimates, pending_count, pending_bytes)
+
+
+def format_size(nbytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if nbytes < 1024 or unit == "GB":
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
@@ -0,0 +1,129 @@
+import os
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+from HashIndex import INDEX_DIR_NAME, write_json_atomic
+
+# -------------------------
+# 同步效能統計
+# -------------------------
+PHASES = ("manifest", "scan", "reuse", "hash", "download", "extract", "delete")
+
+PHASE_NAMES = {
+    "manifest": "清單",
+    "scan": "掃描",
+    "reuse": "沿用",
+    "hash": "雜湊",
+    "download": "下載",
+    "extract": "解壓",
+    "delete": "刪除",
+}
+
+REPORT_FILE_NAME = "sync_report.json"
+
+
+def percentile(sorted_values, pct):
+    """以最近排名法取百分位數，sorted_values 需已排序。"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+class SyncStats:
+    """
+    收集一次同步的各階段耗時、計數與單檔下載延遲，可隨時取快照，結束時輸出 JSON 報告。
+    各階段時間為所有執行緒累計的秒數（多執行緒同時進行時可能大於整體經過時間），
+    並依伺服器資料夾分開統計，方便找出哪個資料夾最慢。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.finished_at = None
+        self.phases = {name: {"seconds": 0.0, "count": 0} for name in PHASES}
+        self.counters = {}
+        self.folders = {}
+        self.latencies = []
+
+    @contextmanager
+    def phase(self, name, folder=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, folder)
+
+    def add_time(self, name, seconds, folder=None):
+        with self._lock:
+            entry = self.phases[name]
+            entry["seconds"] += seconds
+            entry["count"] += 1
+            if folder is not None:
+                phases = self.folders.setdefault(str(folder), {}).setdefault("phases", {})
+                phases[name] = phases.get(name, 0.0) + seconds
+
+    def add(self, key, amount=1, folder=None):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+            if folder is not None:
+                counters = self.folders.setdefault(str(folder), {}).setdefault("counters", {})
+                counters[key] = counters.get(key, 0) + amount
+
+    def record_latency(self, seconds):
+        """記錄單一檔案從開始下載到驗證完成的時間。"""
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.perf_counter()) - self._started
+
+    def snapshot(self):
+        """回傳目前統計的 dict，可於同步途中呼叫。"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            phases = {name: dict(entry) for name, entry in self.phases.items()}
+            counters = dict(self.counters)
+            folders = {name: {key: dict(value) for key, value in data.items()}
+                       for name, data in self.folders.items()}
+        return {
+            "elapsed": self.elapsed,
+            "phases": phases,
+            "counters": counters,
+            "latency": {
+                "count": len(latencies),
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+                "max": latencies[-1] if latencies else None,
+            },
+            "folders": folders,
+        }
+
+    def report(self, **extra):
+        """完整報告：快照加上開始時間與呼叫端提供的附加欄位。"""
+        data = {"version": 1, "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at))}
+        data.update(extra)
+        data.update(self.snapshot())
+        return data
+
+    def summary(self):
+        """單行的各階段耗時摘要，供 log 顯示。"""
+        with self._lock:
+            parts = [f"{PHASE_NAMES[name]} {entry['seconds']:.2f}s"
+                     for name, entry in self.phases.items() if entry["count"]]
+        return f"總計 {self.elapsed:.2f}s（{'、'.join(parts)}）" if parts else f"總計 {self.elapsed:.2f}s"
+
+
+def save_report(root, report):
+    """以暫存檔 + 原子改名寫入 <root>/.modsync/sync_report.json，回傳檔案路徑。"""
+    path = os.path.join(os.path.abspath(root), INDEX_DIR_NAME, REPORT_FILE_NAME)
+    write_json_atomic(path, report, ensure_ascii=False, indent=2)
+    return path
@@ -0,0 +1,52 @@
+import threading
+
+# -------------------------
+# 動態工作群組
+# -------------------------
+class TaskGroup:
+    """
+    追蹤提交到同一個執行緒池的工作；工作執行中可以再提交新工作（例如掃描到差異後立即排入下載），
+    wait() 會等到包含後續提交在內的所有工作都完成為止。工作拋出的例外會收集在 errors。
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.errors = []
+        self._pending = 0
+        self._cond = threading.Condition()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._cond:
+            self._pending += 1
+        future = self.executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._done)
+        return future
+
+    def track(self, start):
+        """追蹤不在執行緒池中執行的工作（例如事件迴圈上的下載）：start() 需回傳 concurrent.futures.Future。"""
+        with self._cond:
+            self._pending += 1
+        try:
+            future = start()
+        except BaseException:
+            with self._cond:
+                self._pending -= 1
+                if self._pending == 0:
+                    self._cond.notify_all()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        error = None if future.cancelled() else future.exception()
+        with self._cond:
+            if error is not None:
+                self.errors.append(error)
+            self._pending -= 1
+            if self._pending == 0:
+                self._cond.notify_all()
+
+    def wait(self):
+        with self._cond:
+            while self._pending:
+                self._cond.wait()
@@ -0,0 +1,97 @@
+import time
+import threading
+from collections import deque
+
+from SyncPlanner import format_size
+
+# -------------------------
+# 以位元組計算的整體進度
+# -------------------------
+# 進度以「位元組」而非「檔案數」計算：一個 50 MB 的 jar 與一個 1 KB 的設定檔份量不同，
+# 依檔案數顯示的進度會在最後幾個大檔案時停住不動，也無法估計剩餘時間。
+
+
+class TransferProgress:
+    """
+    追蹤本次同步需要傳輸的總位元組數、已完成位元組數與每個進行中傳輸的進度。
+    expect() 於檔案排入下載時以清單大小累加總量；start()/advance() 記錄單一傳輸的進度，
+    實際大小（Content-Length）與清單不同時修正總量；finish() 不論成功與否都把該檔案計為完成，
+    讓進度最後一定到達 100%。速度以最近 WINDOW 秒的完成量計算。
+    """
+
+    WINDOW = 5.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.finished = 0
+        self._expected = {}
+        self._active = {}
+        self._samples = deque()
+
+    def expect(self, key, size):
+        with self._lock:
+            size = size or 0
+            self.total += size - self._expected.get(key, 0)
+            self._expected[key] = size
+
+    def start(self, key, size=None, done=0):
+        """開始（或重新開始）一個傳輸；done 為續傳時已完成的位元組數。"""
+        with self._lock:
+            if size and size != self._expected.get(key):
+                self.total += size - self._expected.get(key, 0)
+                self._expected[key] = size
+            self._active[key] = [done, size or self._expected.get(key, 0)]
+
+    def advance(self, key, nbytes):
+        with self._lock:
+            entry = self._active.get(key)
+            if entry is not None:
+                entry[0] += nbytes
+
+    def finish(self, key):
+        with self._lock:
+            self._active.pop(key, None)
+            self.finished += self._expected.pop(key, 0)
+
+    @property
+    def active(self):
+        return bool(self._active)
+
+    def snapshot(self, now=None):
+        """
+        回傳 {"done", "total", "rate", "eta", "transfers"}：
+        rate 為最近的速度（bytes/s），eta 為預估剩餘秒數（無法估計時為 None），
+        transfers 為進行中的傳輸 [(名稱, 已完成, 大小)]，依大小由大到小排列。
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            in_flight = sum(min(done, size) if size else done for done, size in self._active.values())
+            done = min(self.finished + in_flight, self.total) if self.total else self.finished + in_flight
+            transfers = sorted(((key, entry[0], entry[1]) for key, entry in self._active.items()),
+                               key=lambda item: item[2], reverse=True)
+            samples = self._samples
+            samples.append((now, done))
+            while len(samples) > 2 and now - samples[0][0] > self.WINDOW:
+                samples.popleft()
+            elapsed = now - samples[0][0]
+            rate = (done - samples[0][1]) / elapsed if elapsed > 0 else 0.0
+            total = self.total
+        remaining = max(0, total - done)
+        eta = remaining / rate if rate > 0 else (0.0 if not remaining else None)
+        return {"done": done, "total": total, "rate": rate, "eta": eta, "transfers": transfers}
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds + 0.5)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def describe(snapshot):
+    """整體進度的一行文字，例如「12.0 MB / 48.5 MB，3.2 MB/s，剩餘 00:11」。"""
+    return (f"{format_size(snapshot['done'])} / {format_size(snapshot['total'])}，"
+            f"{format_size(snapshot['rate'])}/s，剩餘 {format_eta(snapshot['eta'])}")
@@ -0,0 +1,61 @@
+import os
+
+from PartialDownload import is_partial_name, partial_target
+
+# -------------------------
+# 本地目錄樹比對
+# -------------------------
+def scan_local_tree(base):
+    """
+    以單次 os.scandir 走訪建立本地檔案索引：相對路徑（以 / 分隔）-> os.stat_result。
+    不論目錄多深都只走訪一次，stat 結果可直接交給 HashIndex 查詢，不必再次 stat。
+    """
+    files = {}
+    stack = [("", base)]
+    while stack:
+        prefix, path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    rel = f"{prefix}/{entry.name}" if prefix else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((rel, entry.path))
+                        elif entry.is_file():
+                            files[rel] = entry.stat()
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return files
+
+
+class TreeDiff:
+    """
+    以線性時間比對伺服器清單與本地索引：
+    added   - 伺服器有、本地沒有（不需計算雜湊即可排入下載）
+    common  - 兩邊都有，需以雜湊判斷是否變更
+    extra   - 本地多出的檔案（仍在清單中的續傳暫存檔除外）
+    """
+
+    __slots__ = ("added", "common", "extra", "local")
+
+    def __init__(self, manifest, local_files):
+        self.local = local_files
+        self.added = []
+        self.common = []
+        for rel in manifest:
+            if rel in local_files:
+                self.common.append(rel)
+            else:
+                self.added.append(rel)
+        self.extra = [rel for rel in local_files
+                      if rel not in manifest
+                      and not (is_partial_name(rel) and partial_target(rel) in manifest)]
+
+    @classmethod
+    def scan(cls, manifest, base):
+        return cls(manifest, scan_local_tree(base))
+
+    def stat(self, rel):
+        return self.local.get(rel)
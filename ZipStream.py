@@ -0,0 +1,171 @@
+import zlib
+import struct
+
+# -------------------------
+# 串流 ZIP 解析
+# -------------------------
+# 依序讀取 ZIP 的 local file header，邊下載邊解壓，不需先把整個壓縮檔寫入磁碟。
+# 支援 stored / deflate、data descriptor 與 zip64；遇到不支援的項目會拋出 ZipStreamError，
+# 呼叫端可改用逐檔下載補齊剩餘檔案。
+
+LOCAL_HEADER_SIG = b"PK\x03\x04"
+DESCRIPTOR_SIG = b"PK\x07\x08"
+STOP_SIGS = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06", b"PK\x06\x07")
+LOCAL_HEADER = struct.Struct("<HHHHHIIIHH")
+FLAG_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+ZIP64_EXTRA_ID = 0x0001
+
+
+class ZipStreamError(Exception):
+    pass
+
+
+class _ChunkReader:
+    """把 iter_content 產生的區塊包裝成可精確讀取 n 位元組、並可退回資料的讀取器。"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def read_some(self, limit=65536):
+        if not self._buffer:
+            for chunk in self._chunks:
+                if chunk:
+                    self._buffer = chunk
+                    break
+        data, self._buffer = self._buffer[:limit], self._buffer[limit:]
+        return data
+
+    def read_exact(self, n):
+        parts = []
+        while n > 0:
+            data = self.read_some(n)
+            if not data:
+                raise ZipStreamError("ZIP 資料提前結束")
+            parts.append(data)
+            n -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data):
+        if data:
+            self._buffer = data + self._buffer
+
+
+class ZipStreamMember:
+    def __init__(self, reader, name, flag, method, crc, compress_size, file_size, zip64):
+        self._reader = reader
+        self.name = name
+        self.flag = flag
+        self.method = method
+        self.crc = crc
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self.zip64 = zip64
+        self._consumed = False
+
+    @property
+    def is_dir(self):
+        return self.name.endswith("/")
+
+    def iter_data(self):
+        """產生解壓後的資料區塊；每個項目只能讀取一次，並在結束時檢查 CRC。"""
+        if self._consumed:
+            return
+        self._consumed = True
+        has_descriptor = bool(self.flag & FLAG_DESCRIPTOR)
+        crc = 0
+        if self.method == 0:
+            if has_descriptor:
+                raise ZipStreamError(f"不支援未標示大小的未壓縮項目: {self.name}")
+            remaining = self.compress_size
+            while remaining > 0:
+                data = self._reader.read_some(min(remaining, 65536))
+                if not data:
+                    raise ZipStreamError("ZIP 資料提前結束")
+                remaining -= len(data)
+                crc = zlib.crc32(data, crc)
+                yield data
+        elif self.method == 8:
+            decompressor = zlib.decompressobj(-15)
+            while not decompressor.eof:
+                data = self._reader.read_some()
+                if not data:
+                    raise ZipStreamError("ZIP 資料提前結束")
+                try:
+                    out = decompressor.decompress(data)
+                except zlib.error as e:
+                    raise ZipStreamError(f"無法解壓 {self.name}: {e}") from e
+                if decompressor.unused_data:
+                    self._reader.unread(decompressor.unused_data)
+                if out:
+                    crc = zlib.crc32(out, crc)
+                    yield out
+        else:
+            raise ZipStreamError(f"不支援的壓縮方式 {self.method}: {self.name}")
+        if has_descriptor:
+            self.crc = self._read_descriptor()
+        if crc != self.crc:
+            raise ZipStreamError(f"CRC 不符: {self.name}")
+
+    def _read_descriptor(self):
+        head = self._reader.read_exact(4)
+        if head == DESCRIPTOR_SIG:
+            head = self._reader.read_exact(4)
+        crc = struct.unpack("<I", head)[0]
+        self._reader.read_exact(16 if self.zip64 else 8)
+        return crc
+
+    def drain(self):
+        for _ in self.iter_data():
+            pass
+
+
+class ZipStreamReader:
+    """
+    用法：
+        for member in ZipStreamReader(response.iter_content(65536)):
+            for data in member.iter_data(): ...
+    未讀取的項目會在取得下一個項目前自動略過。
+    """
+
+    def __init__(self, chunks):
+        self._reader = _ChunkReader(chunks)
+
+    def __iter__(self):
+        while True:
+            # 資料剛好在項目之間結束（沒有中央目錄）視為正常結束，切在標頭中間則為資料不完整
+            sig = self._reader.read_some(4)
+            if not sig:
+                return
+            if len(sig) < 4:
+                sig += self._reader.read_exact(4 - len(sig))
+            if sig in STOP_SIGS:
+                return
+            if sig != LOCAL_HEADER_SIG:
+                raise ZipStreamError("無法辨識的 ZIP 區塊")
+            member = self._read_member()
+            yield member
+            member.drain()
+
+    def _read_member(self):
+        (_version, flag, method, _time, _date, crc, compress_size, file_size,
+         name_len, extra_len) = LOCAL_HEADER.unpack(self._reader.read_exact(LOCAL_HEADER.size))
+        raw_name = self._reader.read_exact(name_len)
+        extra = self._reader.read_exact(extra_len)
+        name = raw_name.decode("utf-8" if flag & FLAG_UTF8 else "cp437")
+        zip64 = False
+        pos = 0
+        while pos + 4 <= len(extra):
+            header_id, size = struct.unpack("<HH", extra[pos:pos + 4])
+            if header_id == ZIP64_EXTRA_ID:
+                zip64 = True
+                field = extra[pos + 4:pos + 4 + size]
+                values = list(struct.unpack(f"<{len(field) // 8}Q", field[:len(field) // 8 * 8]))
+                if file_size == 0xFFFFFFFF and values:
+                    file_size = values.pop(0)
+                if compress_size == 0xFFFFFFFF and values:
+                    compress_size = values.pop(0)
+            pos += 4 + size
+        return ZipStreamMember(self._reader, name.replace("\\", "/"), flag, method, crc,
+                               compress_size, file_size, zip64)
@@ -1,15 +1,7 @@
 import sys
 import os
-
-from MainWindow import MainWindow
-
-from PyQt6.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-    QLabel, QTextEdit, QProgressBar, QLineEdit, QFileDialog, QMessageBox, QSplashScreen,
-    QCheckBox
-)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
-from PyQt6.QtGui import QPixmap
+import time
+from types import SimpleNamespace
 
 # -------------------------
 # 主程式 + Splash
@@ -17,24 +9,77 @@ from PyQt6.QtGui import QPixmap
 # -------------------------
 # 主程式 + Splash + 參數處理
 # -------------------------
+# 注意：PyQt6 只在 GUI 模式下才匯入，--headless 模式完全不載入 Qt，可在數十毫秒內開始同步
 
 serverUrl = "http://modapi.barian.moe/"
 # serverUrl = "https://mc-api.yuaner.tw/"
 version = "1.2.2"  # 更新版本
 localPath = ""
+# 與 SyncEngine.TRANSFER_THREADS / TRANSFER_ASYNC 相同（此處不匯入 SyncEngine，GUI 啟動時才載入）
+TRANSFER_CHOICES = ("threads", "async")
 
-if __name__ == "__main__":
-
-    app = QApplication(sys.argv)
-
-    # ✅ 解析命令列參數
-    args = sys.argv[1:]
 
+def parse_args(args):
     auto_mode = "--auto" in args
     reconfig_mode = "--reconfig" in args  # 用於取消預設同步 config
+    headless_mode = "--headless" in args  # 不開啟視窗，直接於命令列同步
+    no_store = "--no-store" in args  # 不使用多個版本資料夾共用的檔案庫
 
-    # 預設啟用 config 同步，除非加上 --reconfig
-    addconf_mode = not reconfig_mode
+    # 逐檔下載的執行方式，例如 --transfer async（事件迴圈）或 --transfer threads（預設）；--async 等同 --transfer async
+    transfer = "async" if "--async" in args else "threads"
+    if "--transfer" in args:
+        i = args.index("--transfer")
+        if i + 1 < len(args) and args[i + 1] in TRANSFER_CHOICES:
+            transfer = args[i + 1]
+        else:
+            print(f"⚠ --transfer 只接受 {' / '.join(TRANSFER_CHOICES)}，改用 {transfer}", file=sys.stderr)
+
+    # 下載頻寬上限，例如 --max-rate 2M
+    max_rate = None
+    if "--max-rate" in args:
+        i = args.index("--max-rate")
+        if i + 1 < len(args):
+            max_rate = args[i + 1]
+
+    # 背景預先下載模式，例如 --watch 或 --watch 30（每 30 分鐘檢查一次）
+    watch_mode = "--watch" in args
+    watch_interval = None
+    if watch_mode:
+        i = args.index("--watch")
+        if i + 1 < len(args) and not args[i + 1].startswith("--"):
+            try:
+                watch_interval = float(args[i + 1]) * 60
+            except ValueError:
+                pass
+
+    # 鏡像站，例如 --mirrors "http://a.example,http://b.example"
+    mirrors = ""
+    if "--mirrors" in args:
+        i = args.index("--mirrors")
+        if i + 1 < len(args):
+            mirrors = args[i + 1]
+
+    # 區網快取，例如 --peers "http://192.168.1.5:8765"
+    peers = ""
+    if "--peers" in args:
+        i = args.index("--peers")
+        if i + 1 < len(args):
+            peers = args[i + 1]
+
+    # 分享本機已驗證的檔案給區網，例如 --share 或 --share 8765
+    share_mode = "--share" in args
+    share_port = None
+    if share_mode:
+        i = args.index("--share")
+        if i + 1 < len(args) and args[i + 1].isdigit():
+            share_port = int(args[i + 1])
+
+    # 改用其他同步伺服器（例如本機測試伺服器）
+    server_url = None
+    if "--server" in args:
+        i = args.index("--server")
+        if i + 1 < len(args):
+            server_url = args[i + 1].rstrip("/")
 
     # ✅ 新增：處理 --dir 參數
     # ✅ 新增：處理 --dir 參數（支援含空格的路徑）
@@ -50,6 +95,180 @@ if __name__ == "__main__":
             dir_path = " ".join(path_parts).strip('"')  # 移除多餘引號
             break
 
+    return SimpleNamespace(auto_mode=auto_mode, reconfig_mode=reconfig_mode,
+                           headless_mode=headless_mode, no_store=no_store, transfer=transfer, max_rate=max_rate,
+                           mirrors=mirrors, dir_path=dir_path, watch_mode=watch_mode, watch_interval=watch_interval,
+                           peers=peers, share_mode=share_mode, share_port=share_port, server_url=server_url)
+
+
+def headless_printer():
+    """回傳輸出 log 到標準輸出的 listener(lines, progress)；整體進度每隔數秒輸出一行。"""
+    from TransferProgress import describe
+
+    out = sys.stdout
+    if out is not None and hasattr(out, "reconfigure"):
+        # Windows 主控台編碼可能無法顯示表情符號，無法編碼的字元以 ? 取代
+        out.reconfigure(errors="replace")
+
+    # 整體進度每隔數秒輸出一行，啟動器可據此顯示剩餘時間
+    last_progress = [0.0]
+
+    def print_lines(lines, progress):
+        if out is None:
+            return
+        snapshot = progress.get("bytes")
+        if snapshot is not None and (snapshot["done"] >= snapshot["total"]
+                                     or time.monotonic() - last_progress[0] >= 2):
+            last_progress[0] = time.monotonic()
+            lines = lines + [f"📥 {describe(snapshot)}"]
+        if lines:
+            out.write("\n".join(lines) + "\n")
+            out.flush()
+
+    return print_lines
+
+
+def version_path(options):
+    return os.path.abspath(options.dir_path) if options.dir_path else os.path.dirname(sys.executable)
+
+
+def run_headless(options, print_lines=None, store=None):
+    """不載入 Qt，直接執行同步並把 log 輸出到標準輸出；同步成功回傳 0，否則回傳 1。"""
+    from SyncEngine import SyncEngine
+    from ContentStore import ContentStore
+    from FlowControl import parse_rate
+    from MirrorPool import parse_mirrors
+
+    mc_version_path = version_path(options)
+    print_lines = print_lines or headless_printer()
+    if store is None and not options.no_store:
+        try:
+            store = ContentStore()
+        except OSError as e:
+            print_lines([f"⚠ 無法使用共用檔案庫，改為直接下載: {e}"], {})
+    engine = SyncEngine(serverUrl, mc_version_path, listener=print_lines, store=store,
+                        mirrors=parse_mirrors(options.mirrors), peers=parse_mirrors(options.peers),
+                        transfer=options.transfer)
+    # 與 GUI 相同：預設僅同步新增設定檔，--reconfig 時取消
+    engine.only_add_config = not options.reconfig_mode
+    if options.max_rate:
+        try:
+            engine.set_bandwidth_limit(parse_rate(options.max_rate))
+        except ValueError as e:
+            print_lines([f"⚠ 忽略 --max-rate: {e}"], {})
+    engine.run()
+    return 0 if engine.ok else 1
+
+
+def run_watch(options):
+    """
+    背景預先下載模式：定期檢查伺服器更新並把需要的檔案先下載到共用檔案庫，
+    遊戲未使用此版本資料夾時立即套用（一般同步，檔案全部由檔案庫取得），否則留待遊戲關閉或下次 --auto。
+    以 Ctrl+C 結束。
+    """
+    from ContentStore import ContentStore
+    from FlowControl import parse_rate
+    from MirrorPool import parse_mirrors
+    from Staging import Stager, game_running, lower_priority, DEFAULT_WATCH_INTERVAL, APPLY_CHECK_INTERVAL
+
+    mc_version_path = version_path(options)
+    interval = options.watch_interval or DEFAULT_WATCH_INTERVAL
+    print_lines = headless_printer()
+    if options.no_store:
+        print_lines(["⚠ --watch 需要共用檔案庫暫存更新，忽略 --no-store"], {})
+    try:
+        store = ContentStore()
+    except OSError as e:
+        print_lines([f"❌ 無法使用共用檔案庫: {e}"], {})
+        return 1
+    lower_priority()
+    if options.share_mode:
+        start_share(options, store, print_lines)
+
+    stager = Stager(serverUrl, mc_version_path, store, listener=print_lines, mirrors=parse_mirrors(options.mirrors),
+                    peers=parse_mirrors(options.peers))
+    stager.only_add_config = not options.reconfig_mode
+    if options.max_rate:
+        try:
+            stager.max_rate = parse_rate(options.max_rate)
+        except ValueError as e:
+            print_lines([f"⚠ 忽略 --max-rate: {e}"], {})
+    print_lines([f"👀 背景預先下載模式：每 {interval / 60:g} 分鐘檢查一次 {mc_version_path}"], {})
+
+    pending = waiting = False
+    next_poll = 0.0
+    try:
+        while True:
+            if time.monotonic() >= next_poll:
+                result = stager.poll()
+                next_poll = time.monotonic() + interval
+                pending = pending or (result is not None and result.pending)
+            if pending:
+                if game_running(mc_version_path):
+                    if not waiting:
+                        print_lines(["🎮 遊戲執行中，更新已暫存，將於遊戲關閉後或下次 --auto 同步時套用"], {})
+                        waiting = True
+                else:
+                    print_lines(["🔁 套用已暫存的更新"], {})
+                    if run_headless(options, print_lines, store) == 0:
+                        pending = waiting = False
+                    else:
+                        print_lines([f"⚠ 套用更新未完成，{APPLY_CHECK_INTERVAL} 秒後重試"], {})
+            time.sleep(max(1.0, min(APPLY_CHECK_INTERVAL if pending else interval, next_poll - time.monotonic())))
+    except KeyboardInterrupt:
+        stager.stop()
+        print_lines(["⏹ 已結束背景預先下載模式"], {})
+        return 0
+
+
+def start_share(options, store, print_lines):
+    """於背景分享版本資料夾中已驗證的檔案給區網，無法啟動時回傳 None。"""
+    from PeerCache import PeerServer, DEFAULT_PEER_PORT
+
+    try:
+        server = PeerServer(version_path(options), port=options.share_port or DEFAULT_PEER_PORT, store=store).start()
+    except OSError as e:
+        print_lines([f"❌ 無法啟動區網快取: {e}"], {})
+        return None
+    print_lines([f"🏠 區網快取已啟動 {server.url}（其他玩家以 --peers {server.url} 使用）"], {})
+    return server
+
+
+def run_share(options):
+    """持續分享版本資料夾直到 Ctrl+C（--headless --share 於同步完成後進入）。"""
+    from ContentStore import ContentStore
+
+    print_lines = headless_printer()
+    store = None
+    if not options.no_store:
+        try:
+            store = ContentStore()
+        except OSError:
+            store = None
+    server = start_share(options, store, print_lines)
+    if server is None:
+        return 1
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+        print_lines(["⏹ 已停止區網快取"], {})
+        return 0
+
+
+def run_gui(options):
+    from PyQt6.QtWidgets import QApplication, QSplashScreen
+    from PyQt6.QtCore import Qt, QTimer
+    from PyQt6.QtGui import QPixmap
+
+    from MainWindow import MainWindow
+
+    app = QApplication(sys.argv)
+
+    auto_mode = options.auto_mode
+    reconfig_mode = options.reconfig_mode
+    dir_path = options.dir_path
 
     base_path = getattr(sys, '_MEIPASS', os.path.abspath("."))
     splash_path = os.path.join(base_path, "img", "loading.png")
@@ -72,15 +291,54 @@ if __name__ == "__main__":
             window.only_add_config_checkbox.setChecked(False)
             window.append_log("⚠ 啟用參數 --reconfig：取消預設『僅同步新增設定檔』")
 
+        # ✅ 若使用 --no-store，不使用共用檔案庫
+        if options.no_store:
+            window.store_checkbox.setChecked(False)
+            window.append_log("⚠ 啟用參數 --no-store：不使用共用檔案庫")
+
+        # ✅ 若使用 --transfer async（或 --async），改用非同步下載
+        if options.transfer == "async":
+            window.async_checkbox.setChecked(True)
+            window.append_log("⚡ 啟用參數 --transfer async：使用非同步下載")
+
+        # ✅ 若使用 --max-rate，設定下載頻寬上限
+        if options.max_rate:
+            window.rate_input.setText(options.max_rate)
+            window.append_log(f"🐢 啟用參數 --max-rate：下載頻寬上限 {options.max_rate}")
+
+        # ✅ 若使用 --mirrors，加入鏡像站
+        if options.mirrors:
+            window.mirrors_input.setText(options.mirrors)
+            window.append_log(f"🪞 啟用參數 --mirrors：{options.mirrors}")
+
+        # ✅ 若使用 --peers，優先由區網快取下載
+        if options.peers:
+            window.peers_input.setText(options.peers)
+            window.append_log(f"🏠 啟用參數 --peers：{options.peers}")
+
+        # ✅ 若使用 --server，改用其他同步伺服器
+        if options.server_url:
+            window.server_input.setText(options.server_url)
+
         # ✅ 若使用 --dir，設定預設同步路徑
         if dir_path:
             abs_dir = os.path.abspath(dir_path)
             window.path_input.setText(abs_dir)
             window.append_log(f"📁 啟用參數 --dir：同步路徑設定為 {abs_dir}")
 
+        # ✅ Splash 仍顯示時就在背景檢查更新、抓取清單並檢查本地檔案，開始同步時直接沿用
+        # 更新提示經由訊號在視窗顯示後才出現，不會被 Splash 擋住
+        window.check_update()
+        window.start_prefetch()
+
         window.show()
         splash.finish(window)
-        window.check_update()  # 確保更新提示不被 Splash 擋住
+
+        # ✅ 若使用 --share，分享本機已驗證的檔案給區網
+        if options.share_mode:
+            if options.share_port:
+                window.share_port = options.share_port
+            window.share_checkbox.setChecked(True)
 
         # ✅ 若使用 --auto，自動開始同步並於完成後自動關閉
         if auto_mode:
@@ -101,6 +359,21 @@ if __name__ == "__main__":
             connect_auto_close()
 
     QTimer.singleShot(100, start_main)
-    sys.exit(app.exec())
+    return app.exec()
+
 
+if __name__ == "__main__":
+
+    # ✅ 解析命令列參數
+    options = parse_args(sys.argv[1:])
+    if options.server_url:
+        serverUrl = options.server_url
 
+    if options.watch_mode:
+        sys.exit(run_watch(options))
+    if options.headless_mode:
+        code = run_headless(options)
+        if options.share_mode:
+            code = run_share(options) or code
+        sys.exit(code)
+    sys.exit(run_gui(options))
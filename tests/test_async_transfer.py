@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from AsyncTransfer import AsyncHttpClient, AsyncHttpError
+
+
+async def serve(response):
+    """啟動一個對每個請求都回傳固定內容的伺服器，回傳 (server, 網址, 收到的請求數)。"""
+    requests = []
+
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        requests.append(1)
+        writer.write(response)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}/file", requests
+
+
+def fetch(response, retries=0, seen=None):
+    async def run():
+        server, url, requests = await serve(response)
+        if seen is not None:
+            seen.append(requests)
+        client = AsyncHttpClient(timeout=5, retries=retries, backoff_factor=0)
+        try:
+            async with client.get(url) as r:
+                body = b"".join([chunk async for chunk in r.iter_content()])
+            return r.status_code, body, len(requests)
+        finally:
+            client.close()
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(run())
+
+
+def test_content_length_body():
+    assert fetch(b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\nConnection: close\r\n\r\nhello")[:2] == (200, b"hello")
+
+
+@pytest.mark.parametrize("value", [b"abc", b"-1", b""])
+def test_malformed_content_length_is_a_protocol_error(value):
+    response = b"HTTP/1.1 200 OK\r\nContent-Length: " + value + b"\r\n\r\nhello"
+    with pytest.raises(AsyncHttpError):
+        fetch(response)
+
+
+def test_malformed_content_length_is_retried():
+    response = b"HTTP/1.1 200 OK\r\nContent-Length: 5x\r\n\r\nhello"
+    seen = []
+    with pytest.raises(AsyncHttpError):
+        fetch(response, retries=2, seen=seen)
+    # 與連線錯誤相同，依重試次數重新送出請求
+    assert len(seen[0]) == 3
@@ -0,0 +1,77 @@
+import os
+import random
+
+import pytest
+
+from LocalModServer import LocalModServer
+from SyncEngine import SyncEngine, resolve_local_folder
+
+
+class HtmlBatchServer(LocalModServer):
+    """批次端點回傳 200 與 HTML，模擬忽略 ?batch=1 的舊伺服器或代理。"""
+
+    def write_batch_zip(self, path, files, out, compress=False):
+        out.write(b"<!DOCTYPE html><html><body>Welcome</body></html>")
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def server_root(tmp_path):
+    rng = random.Random(4)
+    root = tmp_path / "server"
+    # 大檔案使整包下載的預估成本較高，新增少量小檔案時選擇批次下載
+    write(str(root / "config" / "big.bin"), rng.randbytes(8 * 1024 * 1024))
+    return root
+
+
+def add_small_files(root, prefix, count=10):
+    rng = random.Random(prefix)
+    for i in range(count):
+        write(str(root / "config" / f"{prefix}-{i}.toml"), rng.randbytes(2000))
+
+
+def assert_matches_server(root, client):
+    base, _ = resolve_local_folder(str(client), "config")
+    for name in os.listdir(root / "config"):
+        assert read(os.path.join(base, name)) == read(str(root / "config" / name)), name
+
+
+def batch_posts(server):
+    return [path for method, path in server.request_log if method == "POST" and "batch" in path]
+
+
+def test_non_zip_batch_response_disables_batches(server_root, tmp_path):
+    client = tmp_path / "client"
+    server = HtmlBatchServer(str(server_root)).start()
+    try:
+        engine = SyncEngine(server.url, str(client))
+        engine.run()
+        assert engine.ok
+
+        add_small_files(server_root, "first")
+        server.reset_stats()
+        engine.run()
+        assert engine.ok
+        assert len(batch_posts(server)) == 1
+        assert not engine.batch_supported
+        assert_matches_server(server_root, client)
+
+        # 之後的同步不再送出批次請求
+        add_small_files(server_root, "second")
+        server.reset_stats()
+        engine.run()
+        assert engine.ok
+        assert batch_posts(server) == []
+        assert_matches_server(server_root, client)
+    finally:
+        server.stop()
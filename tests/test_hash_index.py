@@ -0,0 +1,123 @@
+import os
+import json
+import threading
+
+from HashIndex import HashIndex, write_json_atomic, INDEX_DIR_NAME
+
+
+def make_file(root, rel, data=b"abc"):
+    path = os.path.join(str(root), *rel.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_lookup_hits_until_size_or_mtime_changes(tmp_path):
+    path = make_file(tmp_path, "mods/a.jar")
+    index = HashIndex(str(tmp_path))
+    index.store(path, "digest")
+    assert index.lookup(path) == "digest"
+    assert (index.hits, index.misses) == (1, 0)
+
+    # 只改變 mtime
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert index.lookup(path) is None
+
+    # 大小改變但 mtime 還原
+    index.store(path, "digest")
+    st = os.stat(path)
+    with open(path, "ab") as f:
+        f.write(b"more")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert index.lookup(path) is None
+    assert index.misses == 2
+
+
+def test_algorithms_are_kept_separately(tmp_path):
+    path = make_file(tmp_path, "config/a.toml")
+    index = HashIndex(str(tmp_path))
+    index.store(path, "md5digest", algorithm="md5")
+    index.store(path, "shadigest", algorithm="sha256")
+    assert index.lookup(path, algorithm="md5") == "md5digest"
+    assert index.lookup(path, algorithm="sha256") == "shadigest"
+    assert index.lookup(path, algorithm="sha1") is None
+    # 檔案變更後重新記錄時，舊的其他演算法結果一併失效
+    make_file(tmp_path, "config/a.toml", b"changed")
+    index.store(path, "newmd5", algorithm="md5")
+    assert index.lookup(path, algorithm="md5") == "newmd5"
+    assert index.lookup(path, algorithm="sha256") is None
+
+
+def test_save_prunes_deleted_files(tmp_path):
+    kept = make_file(tmp_path, "mods/kept.jar")
+    removed = make_file(tmp_path, "mods/removed.jar")
+    index = HashIndex(str(tmp_path))
+    index.store(kept, "k")
+    index.store(removed, "r")
+    index.save()
+    os.remove(removed)
+
+    reloaded = HashIndex(str(tmp_path))
+    assert reloaded.compact() == 1
+    reloaded.save()
+    with open(reloaded.index_path, "r", encoding="utf-8") as f:
+        entries = json.load(f)["entries"]
+    assert list(entries) == ["mods/kept.jar"]
+    assert HashIndex(str(tmp_path)).lookup(kept) == "k"
+
+
+def test_paths_outside_root_and_corrupt_index_are_ignored(tmp_path):
+    outside = make_file(tmp_path, "other/x.jar")
+    root = tmp_path / "instance"
+    index = HashIndex(str(root))
+    index.store(outside, "digest")
+    assert index.lookup(outside) is None
+
+    os.makedirs(index.index_dir)
+    with open(index.index_path, "w", encoding="utf-8") as f:
+        f.write("{not json")
+    assert HashIndex(str(root)).lookup(make_file(root, "mods/a.jar")) is None
+
+
+def test_concurrent_writers_leave_one_complete_file(tmp_path):
+    path = str(tmp_path / INDEX_DIR_NAME / "data.json")
+    errors = []
+
+    def writer(n):
+        try:
+            for i in range(50):
+                write_json_atomic(path, {"writer": n, "i": i, "payload": "x" * 4096})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["payload"] == "x" * 4096
+    # 不留下任何暫存檔
+    assert os.listdir(os.path.dirname(path)) == ["data.json"]
+
+
+def test_save_and_reload_from_several_indexes(tmp_path):
+    target = tmp_path / "mods" / "a.jar"
+    target.parent.mkdir()
+    target.write_bytes(b"abc")
+    indexes = [HashIndex(str(tmp_path)) for _ in range(4)]
+    for n, index in enumerate(indexes):
+        index.store(str(target), f"digest{n}")
+    threads = [threading.Thread(target=index.save) for index in indexes]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    reloaded = HashIndex(str(tmp_path))
+    assert reloaded.lookup(str(target), count=False) in {f"digest{n}" for n in range(4)}
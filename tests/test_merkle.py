@@ -0,0 +1,193 @@
+import os
+import random
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import pytest
+
+from LocalModServer import LocalModServer
+from ManifestIndex import ManifestIndex
+from MerkleTree import compute_dir_digests
+from SyncEngine import SyncEngine, resolve_local_folder
+
+TREE = {
+    "mods": ["a.jar", "b.jar", "sub/c.jar"],
+    "config": ["top.toml", "a/x.toml", "b/y.toml", "b/c/z.toml", "b/c/d/w.toml"],
+    "kubejs": ["server_scripts/s.js", "client_scripts/c.js", "startup_scripts/st.js"],
+}
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+@pytest.fixture
+def server_root(tmp_path):
+    rng = random.Random(2)
+    root = tmp_path / "server"
+    for folder, files in TREE.items():
+        for rel in files:
+            write(str(root / folder / rel), rng.randbytes(rng.randint(100, 5000)))
+    return root
+
+
+def manifest_requests(server):
+    """回傳 {資料夾: [(種類, 子目錄), ...]}，種類為 merkle 或 json；單檔下載等其他請求不列入。"""
+    result = {}
+    for method, path in server.request_log:
+        parts = urlsplit(path)
+        query = parse_qs(parts.query)
+        kind = "merkle" if "merkle" in query else "json" if "json" in query else None
+        folder, _, sub = unquote(parts.path).strip("/").partition("/")
+        if kind is None or folder not in TREE:
+            continue
+        result.setdefault(folder, []).append((kind, sub.strip("/")))
+    return result
+
+
+def sync(server, client):
+    engine = SyncEngine(server.url, str(client))
+    engine.run()
+    assert engine.ok
+    return engine
+
+
+def assert_synced(root, client):
+    for folder, files in TREE.items():
+        base, _ = resolve_local_folder(str(client), folder)
+        for rel in files:
+            with open(os.path.join(root, folder, rel), "rb") as a, open(os.path.join(base, rel), "rb") as b:
+                assert a.read() == b.read(), f"{folder}/{rel}"
+
+
+def test_client_digests_match_server(server_root):
+    server = LocalModServer(str(server_root))
+    for folder in TREE:
+        path = os.path.join(server.root, folder)
+        manifest = ManifestIndex.from_tree(server.build_tree(path, with_size=True))
+        assert compute_dir_digests(manifest)[""] == server.merkle_level(path)["hash"]
+
+
+def test_cold_sync_costs_one_manifest_request_per_folder(server_root, tmp_path):
+    client = tmp_path / "client"
+    server = LocalModServer(str(server_root)).start()
+    try:
+        engine = sync(server, client)
+        # 沒有本地紀錄時不逐層比對摘要，直接抓完整清單
+        assert manifest_requests(server) == {folder: [("json", "")] for folder in TREE}
+        assert engine.report["counters"]["manifest_requests"] == len(TREE)
+        assert_synced(server_root, client)
+    finally:
+        server.stop()
+
+
+def test_many_changed_directories_fetch_full_listing(server_root, tmp_path):
+    client = tmp_path / "client"
+    server = LocalModServer(str(server_root)).start()
+    try:
+        sync(server, client)
+        for i in range(20):
+            write(str(server_root / "config" / f"many{i:02d}" / "m.toml"), b"%d" % i)
+        server.stop()
+        server = LocalModServer(str(server_root)).start()
+
+        sync(server, client)
+        requests = manifest_requests(server)
+        # 根目錄的摘要顯示變更的目錄超過上限，不再逐一抓取
+        assert requests["config"] == [("merkle", ""), ("json", "")]
+        assert_synced(server_root, client)
+        assert (client / "config" / "many19" / "m.toml").read_bytes() == b"19"
+    finally:
+        server.stop()
+
+
+def test_unchanged_launch_costs_one_digest_request_per_folder(server_root, tmp_path):
+    client = tmp_path / "client"
+    server = LocalModServer(str(server_root)).start()
+    try:
+        sync(server, client)
+        server.reset_stats()
+        engine = sync(server, client)
+        requests = manifest_requests(server)
+        assert requests == {folder: [("merkle", "")] for folder in TREE}
+        assert engine.total_tasks == 0
+        assert not any("download" in path or method == "POST" for method, path in server.request_log)
+    finally:
+        server.stop()
+
+
+def test_change_in_one_subtree_fetches_only_that_subtree(server_root, tmp_path):
+    client = tmp_path / "client"
+    server = LocalModServer(str(server_root)).start()
+    try:
+        sync(server, client)
+        write(str(server_root / "config" / "b" / "c" / "z.toml"), b"changed")
+        # 伺服器會快取檔案雜湊，內容變更後重新啟動
+        server.stop()
+        server = LocalModServer(str(server_root)).start()
+
+        engine = sync(server, client)
+        requests = manifest_requests(server)
+        assert requests["mods"] == [("merkle", "")]
+        assert requests["kubejs"] == [("merkle", "")]
+        # 只沿著變更的路徑往下：根目錄、b、b/c；a 與 b/c/d 沿用本地紀錄
+        assert Counter(requests["config"]) == Counter([("merkle", ""), ("merkle", "b"), ("merkle", "b/c")])
+        assert engine.report["counters"]["manifest_requests"] == 5
+        assert engine.total_tasks == 1
+        assert_synced(server_root, client)
+    finally:
+        server.stop()
+
+
+def test_added_and_removed_directories(server_root, tmp_path):
+    client = tmp_path / "client"
+    server = LocalModServer(str(server_root)).start()
+    try:
+        sync(server, client)
+        write(str(server_root / "config" / "new" / "n.toml"), b"new")
+        for name in os.listdir(server_root / "config" / "a"):
+            os.remove(server_root / "config" / "a" / name)
+        os.rmdir(server_root / "config" / "a")
+        server.stop()
+        server = LocalModServer(str(server_root)).start()
+
+        sync(server, client)
+        requests = manifest_requests(server)
+        assert Counter(requests["config"]) == Counter([("merkle", ""), ("merkle", "new")])
+        assert (client / "config" / "new" / "n.toml").read_bytes() == b"new"
+    finally:
+        server.stop()
+
+
+def test_falls_back_to_json_without_digest_endpoint(server_root, tmp_path):
+    client = tmp_path / "client"
+    server = LocalModServer(str(server_root), merkle=False).start()
+    try:
+        sync(server, client)
+        assert_synced(server_root, client)
+        server.reset_stats()
+        engine = sync(server, client)
+        requests = manifest_requests(server)
+        # 每個資料夾嘗試一次摘要（回傳 400）後改抓完整清單
+        assert requests == {folder: [("merkle", ""), ("json", "")] for folder in TREE}
+        assert engine.total_tasks == 0
+    finally:
+        server.stop()
+
+
+def test_falls_back_to_json_when_digest_response_is_not_a_digest(server_root, tmp_path):
+    # 忽略未知參數、直接回傳完整清單的舊伺服器
+    class TreeOnlyServer(LocalModServer):
+        def merkle_level(self, path, with_size=False, algorithm=None):
+            return self.build_tree(path, with_size)
+
+    client = tmp_path / "client"
+    server = TreeOnlyServer(str(server_root)).start()
+    try:
+        sync(server, client)
+        assert_synced(server_root, client)
+        assert all(kinds[-1] == ("json", "") for kinds in manifest_requests(server).values())
+    finally:
+        server.stop()
@@ -0,0 +1,184 @@
+import os
+import re
+import sys
+import json
+import random
+import threading
+import subprocess
+
+import pytest
+import requests
+
+from LocalModServer import LocalModServer
+from ManifestCache import ManifestCache
+from PeerCache import PeerServer
+from SyncEngine import SyncEngine, resolve_local_folder
+
+# 以獨立程序執行主伺服器、區網快取與玩家端，與實際部署相同
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMEOUT = 60
+# 大於 BATCH_FILE_LIMIT，逐檔下載時才會經由鏡像站選擇
+FILE_SIZE = 1536 * 1024
+TREE = {
+    "mods": ["a.jar", "b.jar", "c.jar"],
+    "config": ["big.dat"],
+}
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def start(script, *args, pattern):
+    """啟動一個服務程序，等待輸出符合 pattern 的網址後回傳 (程序, 網址)。"""
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    proc = subprocess.Popen([sys.executable, script, *map(str, args)], cwd=REPO, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8")
+    lines = []
+    for line in proc.stdout:
+        lines.append(line)
+        match = re.search(pattern, line)
+        if match:
+            # 持續讀取之後的輸出，避免管線寫滿使服務程序停住
+            threading.Thread(target=proc.stdout.read, daemon=True).start()
+            return proc, match.group(1)
+    proc.wait(timeout=TIMEOUT)
+    raise AssertionError(f"{script} 未啟動:\n{''.join(lines)}")
+
+
+def stop(proc):
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def sync(client, origin, peers=None):
+    args = [sys.executable, "main.py", "--headless", "--no-store", "--server", origin, "--dir", str(client)]
+    if peers:
+        args += ["--peers", peers]
+    result = subprocess.run(args, cwd=REPO, capture_output=True, text=True, encoding="utf-8", timeout=TIMEOUT,
+                            env=dict(os.environ, PYTHONUNBUFFERED="1"))
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+def sources(client):
+    """回傳 (區網快取, 主伺服器) 在同步報告中的統計。"""
+    with open(os.path.join(client, ".modsync", "sync_report.json"), encoding="utf-8") as f:
+        mirrors = json.load(f)["mirrors"]
+    peer = next(m for m in mirrors if m["peer"])
+    origin = next(m for m in mirrors if not m["peer"])
+    return peer, origin
+
+
+def assert_matches_server(root, client):
+    for folder, files in TREE.items():
+        base, _ = resolve_local_folder(str(client), folder)
+        for rel in files:
+            assert read(os.path.join(base, rel)) == read(os.path.join(root, folder, rel)), f"{folder}/{rel}"
+
+
+@pytest.fixture
+def network(tmp_path):
+    """主伺服器與一個已由主伺服器同步完成、正在分享的區網快取。"""
+    rng = random.Random(3)
+    root = tmp_path / "server"
+    for folder, files in TREE.items():
+        for rel in files:
+            write(str(root / folder / rel), rng.randbytes(FILE_SIZE))
+    procs = []
+    try:
+        origin_proc, origin = start("LocalModServer.py", root, "--port", 0, pattern=r"at (http://\S+)")
+        procs.append(origin_proc)
+        peer_mc = tmp_path / "peer"
+        sync(peer_mc, origin)
+        peer_proc, peer = start("PeerCache.py", peer_mc, "--host", "127.0.0.1", "--port", 0, "--no-store",
+                                pattern=r"於 (http://[\d.]+:\d+)")
+        procs.append(peer_proc)
+        yield root, origin, peer_mc, peer, peer_proc
+    finally:
+        for proc in procs:
+            stop(proc)
+
+
+def test_files_come_from_peer_first(network, tmp_path):
+    root, origin, _, peer, _ = network
+    client = tmp_path / "client"
+    sync(client, origin, peer)
+    assert_matches_server(root, client)
+    peer_stats, origin_stats = sources(client)
+    total = sum(len(files) for files in TREE.values()) * FILE_SIZE
+    assert peer_stats["failures"] == 0
+    assert peer_stats["bytes"] + origin_stats["bytes"] == total
+    assert peer_stats["bytes"] >= origin_stats["bytes"]
+
+
+def test_peer_with_bad_content_is_rejected(network, tmp_path):
+    root, origin, peer_mc, peer, _ = network
+    # 內容遭竄改但大小與修改時間不變，區網快取的雜湊索引仍認為檔案有效而照常提供
+    for folder, files in TREE.items():
+        base, _ = resolve_local_folder(str(peer_mc), folder)
+        for rel in files:
+            path = os.path.join(base, rel)
+            st = os.stat(path)
+            write(path, bytes(st.st_size))
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    client = tmp_path / "client"
+    sync(client, origin, peer)
+    assert_matches_server(root, client)
+    peer_stats, origin_stats = sources(client)
+    assert peer_stats["failures"] >= 1
+    assert origin_stats["bytes"] == sum(len(files) for files in TREE.values()) * FILE_SIZE
+
+
+def test_peer_down_falls_back_to_origin(network, tmp_path):
+    root, origin, _, peer, peer_proc = network
+    stop(peer_proc)
+    client = tmp_path / "client"
+    sync(client, origin, peer)
+    assert_matches_server(root, client)
+    peer_stats, origin_stats = sources(client)
+    assert peer_stats["bytes"] == 0
+    assert origin_stats["bytes"] == sum(len(files) for files in TREE.values()) * FILE_SIZE
+
+
+def test_peer_etag_is_the_verified_manifest_hash(tmp_path, monkeypatch):
+    root = tmp_path / "server"
+    data = random.Random(5).randbytes(FILE_SIZE)
+    write(str(root / "mods" / "a.jar"), data)
+    peer_mc = tmp_path / "peer"
+    origin = LocalModServer(str(root), port=0).start()
+    try:
+        engine = SyncEngine(origin.url, str(peer_mc))
+        engine.run()
+        assert engine.ok
+    finally:
+        origin.stop()
+    expected = ManifestCache(str(peer_mc)).load("mods").get("a.jar")
+
+    def no_rehash(self, path, algorithm=None):
+        raise AssertionError(f"不應重新計算 {path} 的雜湊")
+
+    monkeypatch.setattr(PeerServer, "file_hash", no_rehash)
+    peer = PeerServer(str(peer_mc), host="127.0.0.1", port=0).start()
+    try:
+        r = requests.get(f"{peer.url}/mods/a.jar?download=1", timeout=TIMEOUT)
+        assert r.status_code == 200 and r.content == data
+        assert r.headers["ETag"] == f'"{expected}"'
+        # 續傳時以同一個 ETag 比對
+        r = requests.get(f"{peer.url}/mods/a.jar?download=1", timeout=TIMEOUT,
+                         headers={"Range": "bytes=100-", "If-Range": f'"{expected}"'})
+        assert r.status_code == 206 and r.content == data[100:]
+    finally:
+        peer.stop()
@@ -0,0 +1,162 @@
+import os
+import time
+import shutil
+import random
+import threading
+
+import pytest
+
+from LocalModServer import LocalModServer
+from SyncEngine import SyncEngine, TRANSFER_THREADS, TRANSFER_ASYNC, resolve_local_folder
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def server_root(tmp_path):
+    rng = random.Random(1)
+    root = tmp_path / "server"
+    for folder, names in (("mods", ["a.jar", "b.jar", "c.jar"]), ("clientmods", ["x.jar"]),
+                          ("config", ["one.toml", "two.toml"])):
+        for name in names:
+            size = 300_000 if name.endswith(".jar") else 5000
+            write(str(root / folder / name), rng.randbytes(size))
+    return root
+
+
+def sync(server_url, client, transfer=TRANSFER_THREADS):
+    engine = SyncEngine(server_url, str(client), transfer=transfer)
+    engine.run()
+    assert engine.ok
+    return engine
+
+
+def assert_matches_server(root, client):
+    for folder in os.listdir(root):
+        local_base, _ = resolve_local_folder(str(client), folder)
+        for dirpath, _, files in os.walk(root / folder):
+            for name in files:
+                rel = os.path.relpath(os.path.join(dirpath, name), root / folder)
+                assert read(os.path.join(local_base, rel)) == read(os.path.join(dirpath, name)), rel
+
+
+def restart(server, root, **kwargs):
+    # 伺服器會快取檔案雜湊，內容變更後重新啟動
+    server.stop()
+    return LocalModServer(str(root), **kwargs).start()
+
+
+@pytest.mark.parametrize("transfer", [TRANSFER_THREADS, TRANSFER_ASYNC])
+def test_moved_and_renamed_files_are_reused(server_root, tmp_path, transfer):
+    client = tmp_path / "client"
+    server = LocalModServer(str(server_root)).start()
+    try:
+        sync(server.url, client, transfer)
+        shutil.move(server_root / "mods" / "a.jar", server_root / "clientmods" / "a.jar")
+        os.rename(server_root / "mods" / "b.jar", server_root / "mods" / "b-1.1.jar")
+        os.rename(server_root / "config" / "one.toml", server_root / "config" / "renamed.toml")
+        server = restart(server, server_root)
+
+        engine = sync(server.url, client, transfer)
+        counters = engine.report["counters"]
+        assert engine.bytes_downloaded == 0
+        assert counters["files_reused"] == 3
+        assert_matches_server(server_root, client)
+        # 嚴格同步資料夾的舊檔案在沿用後才刪除
+        assert not (client / "mods" / "servermods" / "a.jar").exists()
+        assert not (client / "mods" / "servermods" / "b.jar").exists()
+        assert not (client / ".modsync" / "reuse").exists()
+    finally:
+        server.stop()
+
+
+def test_swapped_contents_are_reused(server_root, tmp_path):
+    client = tmp_path / "client"
+    server = LocalModServer(str(server_root)).start()
+    try:
+        sync(server.url, client)
+        first, second = server_root / "mods" / "a.jar", server_root / "mods" / "b.jar"
+        a, b = read(str(first)), read(str(second))
+        write(str(first), b)
+        write(str(second), a)
+        server = restart(server, server_root)
+
+        engine = sync(server.url, client)
+        assert engine.bytes_downloaded == 0
+        assert engine.report["counters"]["files_reused"] == 2
+        assert_matches_server(server_root, client)
+        assert not (client / ".modsync" / "reuse").exists()
+    finally:
+        server.stop()
+
+
+def test_modified_source_is_not_reused(server_root, tmp_path):
+    client = tmp_path / "client"
+    server = LocalModServer(str(server_root)).start()
+    try:
+        sync(server.url, client)
+        shutil.move(server_root / "mods" / "a.jar", server_root / "clientmods" / "a.jar")
+        server = restart(server, server_root)
+        # 本地舊位置的檔案被改動（大小相同、內容不同）時不可沿用
+        old = client / "mods" / "servermods" / "a.jar"
+        data = bytearray(read(str(old)))
+        data[0] ^= 0xFF
+        write(str(old), bytes(data))
+
+        engine = sync(server.url, client)
+        assert engine.report["counters"].get("files_reused", 0) == 0
+        assert engine.bytes_downloaded == 300_000
+        assert_matches_server(server_root, client)
+    finally:
+        server.stop()
+
+
+class SlowFolderServer(LocalModServer):
+    """指定資料夾的清單延遲回應，並記錄每個單檔下載請求的時間。"""
+
+    def __init__(self, root, slow_folder, delay):
+        super().__init__(root)
+        self.slow_path = os.path.join(self.root, slow_folder)
+        self.delay = delay
+        self.slow_manifest_done = None
+        self.download_times = {}
+        self._log_lock = threading.Lock()
+
+    def slow(self, path):
+        if path == self.slow_path or path.startswith(self.slow_path + os.sep):
+            time.sleep(self.delay)
+            self.slow_manifest_done = time.monotonic()
+
+    def merkle_level(self, path, *args, **kwargs):
+        self.slow(path)
+        return super().merkle_level(path, *args, **kwargs)
+
+    def build_tree(self, path, *args, **kwargs):
+        self.slow(path)
+        return super().build_tree(path, *args, **kwargs)
+
+    def file_hash(self, path, *args, **kwargs):
+        # send_file 以檔案雜湊作為 ETag，藉此記錄下載請求的時間
+        with self._log_lock:
+            self.download_times.setdefault(os.path.relpath(path, self.root).replace(os.sep, "/"), time.monotonic())
+        return super().file_hash(path, *args, **kwargs)
+
+
+def test_downloads_do_not_wait_for_other_folders(server_root, tmp_path):
+    server = SlowFolderServer(str(server_root), "config", delay=1.5).start()
+    try:
+        sync(server.url, tmp_path / "client")
+        started = server.download_times["mods/a.jar"]
+        assert server.slow_manifest_done is not None
+        assert started < server.slow_manifest_done - 0.5
+    finally:
+        server.stop()
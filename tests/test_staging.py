@@ -0,0 +1,36 @@
+import os
+import random
+
+from ContentStore import ContentStore
+from LocalModServer import LocalModServer
+from Staging import Stager
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def downloads(server):
+    return [path for method, path in server.request_log if "download" in path]
+
+
+def test_poll_uses_published_mirrors(tmp_path):
+    rng = random.Random(6)
+    root = tmp_path / "server"
+    for name in ("a.jar", "b.jar", "c.jar"):
+        write(str(root / "mods" / name), rng.randbytes(200_000))
+    mirror = LocalModServer(str(root)).start()
+    # 主伺服器延遲較高，下載應全部改由鏡像站提供
+    origin = LocalModServer(str(root), latency=0.3, mirrors=[mirror.url]).start()
+    try:
+        store = ContentStore(str(tmp_path / "store"))
+        stager = Stager(origin.url, str(tmp_path / "client"), store)
+        result = stager.poll()
+        assert result.staged == 3 and result.failed == 0
+        assert len(downloads(mirror)) == 3
+        assert downloads(origin) == []
+    finally:
+        origin.stop()
+        mirror.stop()
@@ -0,0 +1,211 @@
+import io
+import os
+import zlib
+import struct
+import zipfile
+
+import pytest
+
+import SyncEngine as sync_engine
+from SyncEngine import SyncEngine
+from ZipStream import ZipStreamReader, ZipStreamError, FLAG_DESCRIPTOR
+
+
+class UnseekableWriter(io.RawIOBase):
+    """不可 seek 的輸出，zipfile 寫入時會改用 data descriptor（與伺服器邊壓縮邊傳送相同）。"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def build_zip(entries, compression=zipfile.ZIP_DEFLATED, seekable=True, force_zip64=False):
+    buffer = io.BytesIO() if seekable else UnseekableWriter()
+    with zipfile.ZipFile(buffer, "w", compression) as zf:
+        for name, data in entries.items():
+            if data is None:
+                zf.mkdir(name) if hasattr(zf, "mkdir") else zf.writestr(name, b"")
+                continue
+            with zf.open(zipfile.ZipInfo(name) if compression == zipfile.ZIP_STORED else name, "w",
+                         force_zip64=force_zip64) as f:
+                f.write(data)
+    return bytes(buffer.getvalue() if seekable else buffer.data)
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def read_all(chunks):
+    result = {}
+    flags = {}
+    for member in ZipStreamReader(chunks):
+        result[member.name] = b"".join(member.iter_data())
+        flags[member.name] = member.flag
+    return result, flags
+
+
+def sample_entries():
+    rng = __import__("random").Random(7)
+    return {
+        "mods/a.jar": rng.randbytes(200_000),
+        "config/b.toml": b"key = 1\n" * 5000,
+        "empty.txt": b"",
+        "unicode/設定.json": "{\"名稱\": \"值\"}".encode("utf-8"),
+    }
+
+
+def first_member(archive):
+    return next(iter(ZipStreamReader([archive])))
+
+
+# -------------------------
+# ZipStreamReader
+# -------------------------
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536, 1 << 20])
+def test_round_trip(compression, chunk_size):
+    entries = sample_entries()
+    archive = build_zip(entries, compression)
+    result, flags = read_all(chunked(archive, chunk_size))
+    assert result == entries
+    assert not any(flag & FLAG_DESCRIPTOR for flag in flags.values())
+
+
+@pytest.mark.parametrize("chunk_size", [3, 65536])
+def test_deflated_with_data_descriptors(chunk_size):
+    entries = sample_entries()
+    archive = build_zip(entries, seekable=False)
+    result, flags = read_all(chunked(archive, chunk_size))
+    assert result == entries
+    assert all(flag & FLAG_DESCRIPTOR for flag in flags.values())
+
+
+def test_stored_with_data_descriptor_is_rejected():
+    archive = build_zip({"a.txt": b"hello"}, zipfile.ZIP_STORED, seekable=False)
+    with pytest.raises(ZipStreamError):
+        read_all([archive])
+
+
+@pytest.mark.parametrize("seekable, compression", [(True, zipfile.ZIP_STORED), (True, zipfile.ZIP_DEFLATED),
+                                                    (False, zipfile.ZIP_DEFLATED)])
+def test_zip64(seekable, compression):
+    entries = sample_entries()
+    archive = build_zip(entries, compression, seekable=seekable, force_zip64=True)
+    members = list(ZipStreamReader([archive]))
+    assert all(member.zip64 for member in members)
+    result, _ = read_all(chunked(archive, 4096))
+    assert result == entries
+
+
+def test_zip64_stored_with_data_descriptor_is_rejected():
+    # 未壓縮項目搭配 data descriptor 無法得知本文長度，由呼叫端改為逐檔下載
+    archive = build_zip({"a.txt": b"hello"}, zipfile.ZIP_STORED, seekable=False, force_zip64=True)
+    with pytest.raises(ZipStreamError):
+        read_all([archive])
+
+
+def test_directories_and_unread_members_are_skipped():
+    entries = {"dir/": None, "dir/a.txt": b"a" * 1000, "b.txt": b"b" * 1000}
+    archive = build_zip(entries)
+    names = []
+    for member in ZipStreamReader(chunked(archive, 100)):
+        names.append((member.name, member.is_dir))
+        if member.name == "b.txt":
+            assert b"".join(member.iter_data()) == b"b" * 1000
+    assert names == [("dir/", True), ("dir/a.txt", False), ("b.txt", False)]
+
+
+@pytest.mark.parametrize("seekable", [True, False])
+def test_truncated_stream_raises(seekable):
+    archive = build_zip(sample_entries(), seekable=seekable)
+    # 切在第一個項目的資料中間、以及下一個項目的標頭中間
+    second = archive.index(b"PK\x03\x04", 4)
+    for cut in (len(archive) // 8, second + 2, second + 10):
+        with pytest.raises(ZipStreamError):
+            read_all(chunked(archive[:cut], 1000))
+
+
+def test_stream_without_central_directory_ends_cleanly():
+    archive = build_zip({"a.txt": b"a" * 100, "b.txt": b"b" * 100})
+    end = archive.index(b"PK\x01\x02")
+    result, _ = read_all([archive[:end]])
+    assert result == {"a.txt": b"a" * 100, "b.txt": b"b" * 100}
+
+
+def crc_offset(archive):
+    return archive.index(b"PK\x03\x04") + 14
+
+
+def test_crc_mismatch_in_header_raises():
+    archive = bytearray(build_zip({"a.txt": os.urandom(5000)}, zipfile.ZIP_STORED))
+    offset = crc_offset(archive)
+    crc = struct.unpack("<I", archive[offset:offset + 4])[0]
+    archive[offset:offset + 4] = struct.pack("<I", crc ^ 1)
+    with pytest.raises(ZipStreamError, match="CRC"):
+        read_all([bytes(archive)])
+
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_corrupted_data_raises(compression):
+    data = os.urandom(20000) + b"0123456789abcdef" * 4096
+    archive = bytearray(build_zip({"a.txt": data}, compression))
+    # 竄改本文中間的一個位元組
+    start = archive.index(b"a.txt") + len("a.txt")
+    end = archive.index(b"PK\x01\x02")
+    archive[(start + end) // 2] ^= 0xFF
+    with pytest.raises(ZipStreamError):
+        read_all([bytes(archive)])
+
+
+def test_invalid_deflate_stream_raises():
+    archive = bytearray(build_zip({"a.txt": b"x" * 1000}))
+    start = archive.index(b"a.txt") + len("a.txt")
+    # 區塊類型 3 為保留值，zlib 會回報錯誤
+    archive[start] = 0x07
+    with pytest.raises(ZipStreamError):
+        read_all([bytes(archive)])
+
+
+def test_crc_mismatch_in_descriptor_raises():
+    data = os.urandom(5000)
+    archive = bytearray(build_zip({"a.txt": data}, seekable=False))
+    offset = archive.index(b"PK\x07\x08") + 4
+    archive[offset:offset + 4] = struct.pack("<I", zlib.crc32(data) ^ 1)
+    with pytest.raises(ZipStreamError, match="CRC"):
+        read_all([bytes(archive)])
+
+
+def test_unsupported_method_raises():
+    archive = build_zip({"a.txt": b"x" * 1000}, zipfile.ZIP_BZIP2)
+    with pytest.raises(ZipStreamError):
+        read_all([archive])
+
+
+# -------------------------
+# SyncEngine.extract_member
+# -------------------------
+def test_extract_member_keeps_original_error_when_open_fails(tmp_path, monkeypatch):
+    engine = SyncEngine("http://127.0.0.1:9", str(tmp_path))
+
+    def denied(*args, **kwargs):
+        raise PermissionError("denied")
+
+    monkeypatch.setattr(sync_engine, "open", denied, raising=False)
+    member = first_member(build_zip({"a.txt": b"hello"}))
+    with pytest.raises(PermissionError, match="denied"):
+        engine.extract_member(member, str(tmp_path / "out" / "a.txt"), None)
+
+
+def test_extract_member_hash_mismatch_leaves_no_partial(tmp_path):
+    engine = SyncEngine("http://127.0.0.1:9", str(tmp_path))
+    member = first_member(build_zip({"a.txt": b"hello"}))
+    target = tmp_path / "out" / "a.txt"
+    assert engine.extract_member(member, str(target), "0" * 32, "md5") is False
+    assert list((tmp_path / "out").iterdir()) == []